@@ -0,0 +1,197 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# Filas por bloque; la memoria usada depende de este valor y no del total de alertas
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+
+KML_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document>
+<name>{name}</name>
+"""
+KML_FOOTER = "</Document>\n</kml>\n"
+
+GEOJSON_HEADER = '{"type": "FeatureCollection", "features": [\n'
+GEOJSON_FOOTER = "\n]}\n"
+
+# Columnas de la predicción del clasificador (ver firms_clusters.fan_out_predictions)
+PREDICTION_COLUMNS = ["prediction", "prediction_confidence", "prob_fire", "prob_no_fire"]
+
+
+def iter_chunks(source, chunk_rows=EXPORT_CHUNK_ROWS):
+    """DataFrame, CSV, Parquet o directorio del alert_store -> DataFrames de a chunk_rows filas."""
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+    elif str(source).endswith(".csv"):
+        yield from pd.read_csv(source, chunksize=chunk_rows)
+    elif isinstance(source, str):
+        dataset = ds.dataset(source, format="parquet", partitioning="hive")
+        for batch in dataset.to_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        # Iterable de DataFrames ya particionado
+        yield from source
+
+
+def with_coordinates(chunk):
+    """Filas con latitud y longitud finitas; NaN o inf no son coordenadas válidas en GeoJSON ni en KML."""
+    latitude = pd.to_numeric(chunk["latitude"], errors="coerce").to_numpy(dtype=float)
+    longitude = pd.to_numeric(chunk["longitude"], errors="coerce").to_numpy(dtype=float)
+    return chunk[np.isfinite(latitude) & np.isfinite(longitude)]
+
+
+def escape_xml(values):
+    return (
+        values.astype(str)
+        .str.replace("&", "&amp;", regex=False)
+        .str.replace("<", "&lt;", regex=False)
+        .str.replace(">", "&gt;", regex=False)
+    )
+
+
+def brightness_column(chunk):
+    """MODIS usa brightness; los CSV crudos de VIIRS traen bright_ti4."""
+    if "brightness" in chunk.columns:
+        return chunk["brightness"]
+    return chunk["bright_ti4"]
+
+
+def image_links(chunk, image_base_url):
+    if image_base_url is None or "image_name" not in chunk.columns:
+        return None
+    return (image_base_url.rstrip("/") + "/" + chunk["image_name"].astype(str)).where(chunk["image_name"].notna())
+
+
+def kml_placemarks(chunk, include_predictions=True, image_base_url=None):
+    """Placemarks de un bloque armados con operaciones de columnas, sin iterar filas."""
+    name = escape_xml(chunk["acq_date"].astype(str) + " " + chunk["acq_time"].astype(str))
+
+    description = (
+        "Brightness: " + brightness_column(chunk).astype(str)
+        + ", Confidence: " + chunk["confidence"].astype(str)
+    )
+    if include_predictions and "prediction" in chunk.columns:
+        description = description + (
+            ", Prediction: " + chunk["prediction"].astype(str)
+            + (", Score: " + chunk["prediction_confidence"].astype(str) if "prediction_confidence" in chunk.columns else "")
+        ).where(chunk["prediction"].notna(), "")
+
+    links = image_links(chunk, image_base_url)
+    if links is not None:
+        description = description + (", Image: " + links).where(links.notna(), "")
+
+    coordinates = chunk["longitude"].astype(str) + "," + chunk["latitude"].astype(str) + ",0"
+
+    return (
+        "<Placemark><name>" + name
+        + "</name><description>" + escape_xml(description)
+        + "</description><Point><coordinates>" + coordinates
+        + "</coordinates></Point></Placemark>\n"
+    )
+
+
+def geojson_features(chunk, include_predictions=True, image_base_url=None):
+    """Features de un bloque; las propiedades se serializan en bloque con to_json."""
+    properties = chunk.drop(columns=["latitude", "longitude"])
+    if not include_predictions:
+        properties = properties.drop(columns=[c for c in PREDICTION_COLUMNS if c in properties.columns])
+
+    links = image_links(chunk, image_base_url)
+    if links is not None:
+        properties = properties.assign(image_url=links)
+
+    properties_json = properties.to_json(orient="records", lines=True, date_format="iso").splitlines()
+
+    return (
+        '{"type": "Feature", "geometry": {"type": "Point", "coordinates": ['
+        + chunk["longitude"].astype(str) + ", " + chunk["latitude"].astype(str)
+        + ']}, "properties": ' + pd.Series(properties_json, index=chunk.index) + "}"
+    )
+
+
+def write_kml(source, output_file, name="FIRMS Points", include_predictions=True, image_base_url=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    rows = 0
+    skipped = 0
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(KML_HEADER.format(name=name))
+        for chunk in iter_chunks(source, chunk_rows):
+            valid = with_coordinates(chunk)
+            skipped += len(chunk) - len(valid)
+            f.write("".join(kml_placemarks(valid, include_predictions, image_base_url)))
+            rows += len(valid)
+        f.write(KML_FOOTER)
+
+    print(f"KML generated correctly: {output_file} ({rows} points, {skipped} skipped without coordinates)")
+    return output_file
+
+
+def write_geojson(source, output_file, include_predictions=True, image_base_url=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    rows = 0
+    skipped = 0
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(GEOJSON_HEADER)
+        for chunk in iter_chunks(source, chunk_rows):
+            valid = with_coordinates(chunk)
+            skipped += len(chunk) - len(valid)
+            if valid.empty:
+                continue
+            if rows:
+                f.write(",\n")
+            f.write(",\n".join(geojson_features(valid, include_predictions, image_base_url)))
+            rows += len(valid)
+        f.write(GEOJSON_FOOTER)
+
+    print(f"GeoJSON generated correctly: {output_file} ({rows} points, {skipped} skipped without coordinates)")
+    return output_file
+
+
+def test():
+    import json
+    import tempfile
+
+    def reject_constant(constant):
+        # json acepta NaN/Infinity, pero no son JSON válido
+        raise ValueError(f"Invalid JSON constant {constant}")
+
+    n = 200_000
+    rng = np.random.default_rng(0)
+    alerts = pd.DataFrame({
+        "latitude": rng.uniform(-35, -30, n),
+        "longitude": rng.uniform(-58.5, -53, n),
+        "acq_date": "2025-01-10",
+        "acq_time": rng.integers(0, 2359, n),
+        "bright_ti4": rng.uniform(300, 360, n),
+        "confidence": rng.choice(["l", "n", "h"], n),
+        "image_name": "tile_<1>&.png",
+        "prediction": rng.choice(["Fire", "No_Fire", None], n),
+        "prediction_confidence": rng.uniform(0, 1, n),
+    })
+
+    # Filas sin coordenadas: se saltean, el archivo sigue siendo JSON/XML válido
+    missing = rng.choice(n, 100, replace=False)
+    alerts.loc[missing[:50], "latitude"] = np.nan
+    alerts.loc[missing[50:], "longitude"] = np.inf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_kml(alerts, os.path.join(tmp, "alerts.kml"), image_base_url="https://example.com/images")
+        write_geojson(alerts, os.path.join(tmp, "alerts.geojson"))
+
+        with open(os.path.join(tmp, "alerts.geojson"), encoding="utf-8") as f:
+            features = json.load(f, parse_constant=reject_constant)["features"]
+        assert len(features) == n - 100
+
+        import xml.etree.ElementTree as ET
+        placemarks = ET.parse(os.path.join(tmp, "alerts.kml")).getroot().iter("{http://www.opengis.net/kml/2.2}Placemark")
+        assert sum(1 for _ in placemarks) == n - 100
+
+
+if __name__ == "__main__":
+    test()
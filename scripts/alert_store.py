@@ -0,0 +1,167 @@
+import os
+import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# Alertas FIRMS en Parquet particionado sensor=<sensor>/acq_date=<YYYY-MM-DD>
+ALERT_STORE_DIR = os.getenv("ALERT_STORE_DIR", "data/firms_alert_store")
+
+ALERT_SCHEMA = pa.schema([
+    ("sensor", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("acq_date", pa.date32()),
+    ("acq_time", pa.int16()),
+    ("acq_datetime", pa.timestamp("s", tz="UTC")),
+    ("satellite", pa.string()),
+    ("instrument", pa.string()),
+    ("brightness", pa.float64()),
+    ("bright_t31", pa.float64()),
+    ("frp", pa.float64()),
+    ("confidence", pa.string()),
+    ("confidence_level", pa.string()),
+    ("daynight", pa.string()),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("sensor", pa.string()), ("acq_date", pa.date32())]),
+    flavor="hive",
+)
+
+
+def to_arrow(alerts):
+    """Tabla normalizada de firms_alerts (ALERT_COLUMNS) -> pa.Table con ALERT_SCHEMA."""
+    df = alerts.copy()
+
+    acq_time = df["acq_time"].astype(int)
+    df["acq_date"] = pd.to_datetime(df["acq_date"].astype(str), format="%Y-%m-%d")
+    df["acq_datetime"] = (
+        df["acq_date"]
+        + pd.to_timedelta(acq_time // 100, unit="h")
+        + pd.to_timedelta(acq_time % 100, unit="m")
+    ).dt.tz_localize("UTC")
+    df["acq_date"] = df["acq_date"].dt.date
+    df["acq_time"] = acq_time
+
+    for column in ["satellite", "instrument", "confidence", "confidence_level", "daynight"]:
+        df[column] = df[column].astype("string")
+
+    return pa.Table.from_pandas(df[ALERT_SCHEMA.names], schema=ALERT_SCHEMA, preserve_index=False)
+
+
+def write_alerts(alerts, root=ALERT_STORE_DIR):
+    """
+    Escribe las alertas en sus particiones sensor/fecha. Volver a escribir un
+    sensor-día reemplaza esa partición (las descargas NRT se pueden repetir)
+    y deja intactas las demás.
+    """
+    if alerts.empty:
+        return 0
+
+    ds.write_dataset(
+        to_arrow(alerts),
+        root,
+        format="parquet",
+        partitioning=PARTITIONING,
+        existing_data_behavior="delete_matching",
+        basename_template="alerts-{i}.parquet",
+    )
+
+    return len(alerts)
+
+
+def alerts_filter(start_date=None, end_date=None, dates=None, sensors=None, bbox=None):
+    """Expresión de pyarrow para filtrar por partición (fecha, sensor) y por estadísticas (bbox)."""
+    conditions = []
+
+    if start_date is not None:
+        conditions.append(ds.field("acq_date") >= pa.scalar(to_date(start_date), pa.date32()))
+    if end_date is not None:
+        conditions.append(ds.field("acq_date") <= pa.scalar(to_date(end_date), pa.date32()))
+    if dates is not None:
+        conditions.append(ds.field("acq_date").isin(pa.array([to_date(d) for d in dates], pa.date32())))
+    if sensors is not None:
+        conditions.append(ds.field("sensor").isin(list(sensors)))
+    if bbox is not None:
+        lon_min, lat_min, lon_max, lat_max = bbox
+        conditions.append(
+            (ds.field("longitude") >= lon_min) & (ds.field("longitude") <= lon_max) &
+            (ds.field("latitude") >= lat_min) & (ds.field("latitude") <= lat_max)
+        )
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def to_date(d):
+    if isinstance(d, datetime.datetime):
+        return d.date()
+    if isinstance(d, datetime.date):
+        return d
+    return datetime.datetime.strptime(d, "%Y-%m-%d").date()
+
+
+def read_alerts(start_date=None, end_date=None, dates=None, sensors=None, bbox=None, root=ALERT_STORE_DIR, columns=None):
+    """
+    Lee las alertas del store; solo se abren las particiones de las fechas y
+    sensores pedidos y los row groups que pueden caer en el bbox.
+    acq_date vuelve como texto YYYY-MM-DD, igual que en los CSV de FIRMS.
+    """
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or ALERT_SCHEMA.names)
+
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING, schema=ALERT_SCHEMA)
+
+    table = dataset.to_table(
+        columns=columns,
+        filter=alerts_filter(start_date, end_date, dates, sensors, bbox),
+    )
+
+    df = table.to_pandas()
+    if "acq_date" in df.columns:
+        df["acq_date"] = df["acq_date"].astype(str)
+
+    return df
+
+
+def test():
+    import tempfile
+
+    alerts = pd.DataFrame({
+        "sensor": ["NOAA21", "NOAA21", "MODIS"],
+        "latitude": [-32.5, -10.0, -33.1],
+        "longitude": [-55.1, -60.0, -54.2],
+        "acq_date": ["2025-01-10", "2025-01-10", "2025-01-11"],
+        "acq_time": [1705, 1705, 524],
+        "satellite": ["N21", "N21", "Aqua"],
+        "instrument": ["VIIRS", "VIIRS", "MODIS"],
+        "brightness": [330.1, 340.2, 320.5],
+        "bright_t31": [290.0, 291.0, 300.0],
+        "frp": [3.2, 4.1, 10.0],
+        "confidence": ["n", "h", "85"],
+        "confidence_level": ["nominal", "high", "high"],
+        "daynight": ["D", "D", "N"],
+    })
+
+    with tempfile.TemporaryDirectory() as root:
+        write_alerts(alerts, root)
+        # Reescribir el mismo sensor-día no duplica filas
+        write_alerts(alerts[alerts["sensor"] == "NOAA21"], root)
+
+        assert len(read_alerts(root=root)) == 3
+        assert len(read_alerts(start_date="2025-01-11", root=root)) == 1
+        assert len(read_alerts(sensors=["NOAA21"], bbox=(-58.5, -35.0, -53.0, -30.0), root=root)) == 1
+
+        print(read_alerts(root=root))
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,321 @@
+"""
+Fachada mínima de la API de Earth Engine para los benchmarks.
+
+Implementa solo lo que usan uruguay_tiles, image_from_coordinates y utils:
+las colecciones devuelven escenas sintéticas deterministas (por geometría y
+ventana de fechas), cada getInfo/getThumbURL duerme la latencia configurada y
+las URLs de thumbnails apuntan al servidor local de fake_servers.py.
+
+Se instala con install() antes de importar los módulos del pipeline.
+"""
+import sys
+import time
+import types
+import zlib
+import threading
+from datetime import datetime, timezone
+
+
+# Latencia simulada (segundos) por round trip
+LATENCY = {"getInfo": 0.3, "getThumbURL": 0.05, "listOperations": 0.3, "getOperation": 0.3}
+
+# Porcentaje de geometrías con al menos una escena en la ventana
+SCENE_COVERAGE_PCT = 95
+
+# Días entre pasadas del satélite sobre una misma geometría (Sentinel-2: 5)
+REVISIT_DAYS = 5
+
+# http://host:port del servidor de thumbnails (fake_servers.FakeServer)
+THUMB_BASE_URL = "http://127.0.0.1:0"
+THUMB_VARIANTS = 16
+
+# Polígono aproximado de Uruguay (lon, lat)
+URUGUAY_RING = [
+    [-58.43, -33.09], [-58.35, -33.98], [-58.14, -34.40], [-57.35, -34.47],
+    [-56.25, -34.90], [-55.05, -34.89], [-54.14, -34.66], [-53.37, -33.74],
+    [-53.52, -33.13], [-53.09, -32.72], [-53.81, -32.05], [-54.59, -31.45],
+    [-55.60, -30.85], [-56.01, -30.88], [-56.98, -30.11], [-57.63, -30.18],
+    [-57.88, -31.02], [-58.20, -32.45], [-58.43, -33.09],
+]
+
+# Tasks del proyecto {id: estado}; ee.data los lista como el cliente real
+TASKS = {}
+TASK_LIST_PAGE_SIZE = 500
+
+stats = {"getInfo": 0, "getThumbURL": 0, "listOperations": 0, "getOperation": 0}
+_stats_lock = threading.Lock()
+
+
+def _round_trip(kind):
+    with _stats_lock:
+        stats[kind] += 1
+    time.sleep(LATENCY[kind])
+
+
+def _hash(*values):
+    return zlib.crc32(repr(values).encode("utf-8"))
+
+
+def evaluate(value):
+    if isinstance(value, Lazy):
+        return value.value()
+    if isinstance(value, dict):
+        return {k: evaluate(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [evaluate(v) for v in value]
+    return value
+
+
+class Lazy:
+    """Valor "server-side" que se resuelve recién en getInfo."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def value(self):
+        return self.fn()
+
+    def getInfo(self):
+        _round_trip("getInfo")
+        return self.value()
+
+    def eq(self, other):
+        return Lazy(lambda: self.value() == evaluate(other))
+
+
+class Geometry:
+    def __init__(self, coordinates, kind="Point"):
+        self.coordinates = coordinates
+        self.kind = kind
+
+    @staticmethod
+    def Point(coordinates, *args, **kwargs):
+        return Geometry(coordinates, "Point")
+
+    @staticmethod
+    def Rectangle(coordinates, *args, **kwargs):
+        return Geometry(coordinates, "Rectangle")
+
+    @staticmethod
+    def BBox(*coordinates):
+        return Geometry(list(coordinates), "Rectangle")
+
+    def buffer(self, *args, **kwargs):
+        return self
+
+    def bounds(self, *args, **kwargs):
+        return self
+
+    def key(self):
+        return tuple(round(float(v), 6) for v in self.coordinates)
+
+    def getInfo(self):
+        _round_trip("getInfo")
+        if self.kind == "Uruguay":
+            return {"type": "Polygon", "coordinates": [URUGUAY_RING]}
+        return {"type": self.kind, "coordinates": self.coordinates}
+
+
+class Date:
+    def __init__(self, value):
+        if isinstance(value, Date):
+            self.millis = value.millis
+        elif isinstance(value, datetime):
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            self.millis = int(value.timestamp() * 1000)
+        elif isinstance(value, str):
+            self.millis = int(datetime.strptime(value[:10], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+        else:
+            self.millis = int(evaluate(value))
+
+    def advance(self, delta, unit):
+        seconds = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}[unit]
+        return Date(self.millis + int(delta * seconds * 1000))
+
+    def format(self, pattern=None):
+        dt = datetime.fromtimestamp(self.millis / 1000, tz=timezone.utc)
+        return Lazy(lambda: dt.strftime("%Y%m%d_%H%M%S"))
+
+
+class Filter:
+    @staticmethod
+    def eq(*args):
+        return None
+
+    @staticmethod
+    def lt(*args):
+        return None
+
+
+class Feature:
+    def __init__(self, geometry, properties=None):
+        self._geometry = geometry
+        self.properties = dict(properties or {})
+
+    def get(self, name):
+        return self.properties.get(name)
+
+    def geometry(self):
+        return self._geometry
+
+
+class FeatureCollection:
+    def __init__(self, source):
+        self.source = source
+        self.features = source if isinstance(source, list) else []
+
+    def filter(self, *args):
+        return self
+
+    def geometry(self):
+        return Geometry(URUGUAY_RING, "Uruguay")
+
+    def map(self, fn):
+        return FeatureCollection([fn(feature) for feature in self.features])
+
+    def getInfo(self):
+        _round_trip("getInfo")
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "geometry": None, "properties": evaluate(feature.properties)}
+                for feature in self.features
+            ],
+        }
+
+
+class ImageCollection:
+    """Una escena sintética por geometría y ventana, o ninguna según SCENE_COVERAGE_PCT."""
+
+    def __init__(self, collection_id):
+        self.collection_id = collection_id
+        self.geometry = None
+        self.start = None
+        self.end = None
+
+    def _copy(self, **changes):
+        other = ImageCollection(self.collection_id)
+        other.__dict__.update(self.__dict__)
+        other.__dict__.update(changes)
+        return other
+
+    def filterBounds(self, geometry):
+        return self._copy(geometry=geometry)
+
+    def filterDate(self, start, end):
+        return self._copy(start=Date(start), end=Date(end))
+
+    def filter(self, *args):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def _scene(self):
+        # La presencia depende solo de la geometría: los escaneos sucesivos ven los mismos huecos
+        seed = _hash(self.collection_id, self.geometry.key() if self.geometry else None)
+        if seed % 100 >= SCENE_COVERAGE_PCT:
+            return None
+
+        # Adquisiciones cada REVISIT_DAYS en instantes fijos por geometría: la
+        # misma escena para ventanas distintas mientras no haya una más nueva
+        revisit = REVISIT_DAYS * 86400000
+        offset = (seed % 1000) * revisit // 1000
+        end = self.end.millis if self.end else int(time.time() * 1000)
+        time_start = (end - offset) // revisit * revisit + offset
+        if self.start is not None and time_start < self.start.millis:
+            return None
+        when = datetime.fromtimestamp(time_start / 1000, tz=timezone.utc)
+
+        return {
+            "system:index": f"{when:%Y%m%dT%H%M%S}_{seed:08x}",
+            "system:time_start": time_start,
+            "CLOUDY_PIXEL_PERCENTAGE": float(seed % 100),
+        }
+
+    def aggregate_array(self, name):
+        def value():
+            scene = self._scene()
+            return [scene[name]] if scene else []
+        return Lazy(value)
+
+    def size(self):
+        return Lazy(lambda: 1 if self._scene() else 0)
+
+    def first(self):
+        return Image(Lazy(lambda: f"{self.collection_id}/{self._scene()['system:index']}"))
+
+
+class Image:
+    def __init__(self, image_id):
+        self.image_id = image_id.image_id if isinstance(image_id, Image) else image_id
+
+    def _self(self, *args, **kwargs):
+        return self
+
+    select = multiply = add = clip = rename = normalizedDifference = visualize = _self
+
+    def get(self, name):
+        if name == "system:id":
+            return self.image_id
+        if name == "system:time_start":
+            return Lazy(lambda: 0)
+        return None
+
+    def getThumbURL(self, params=None):
+        _round_trip("getThumbURL")
+        variant = _hash(evaluate(self.image_id)) % THUMB_VARIANTS
+        return f"{THUMB_BASE_URL}/thumb/{variant}.png"
+
+
+class Dictionary:
+    def __init__(self, values):
+        self.values = values
+
+    def getInfo(self):
+        _round_trip("getInfo")
+        return evaluate(self.values)
+
+
+def get_task_list():
+    """Como ee.data.getTaskList: un request de listOperations por página de 500."""
+    tasks = [{"id": task_id, "state": state} for task_id, state in list(TASKS.items())]
+    for _ in range(max(1, -(-len(tasks) // TASK_LIST_PAGE_SIZE))):
+        _round_trip("listOperations")
+    return tasks
+
+
+def get_task_status(task_ids):
+    """Como ee.data.getTaskStatus: un getOperation por id, UNKNOWN si no existe."""
+    if isinstance(task_ids, str):
+        task_ids = [task_ids]
+    statuses = []
+    for task_id in task_ids:
+        _round_trip("getOperation")
+        statuses.append({"id": task_id, "state": TASKS.get(task_id, "UNKNOWN")})
+    return statuses
+
+
+def install(latency=None, thumb_base_url=None):
+    """Registra este módulo como `ee` en sys.modules."""
+    global THUMB_BASE_URL
+
+    if latency:
+        LATENCY.update(latency)
+    if thumb_base_url:
+        THUMB_BASE_URL = thumb_base_url
+
+    module = sys.modules[__name__]
+    module.Authenticate = lambda *args, **kwargs: None
+    module.Initialize = lambda *args, **kwargs: None
+    module.data = types.SimpleNamespace(getTaskList=get_task_list, getTaskStatus=get_task_status)
+    sys.modules["ee"] = module
+
+    return module
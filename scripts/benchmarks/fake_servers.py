@@ -0,0 +1,208 @@
+"""
+Servidor HTTP local que reemplaza a FIRMS NRT y a los thumbnails de Earth
+Engine en los benchmarks.
+
+- /firms/<sensor>/South_America/<archivo><YYYYDDD>.txt: CSV continental
+  sintético (columnas MODIS o VIIRS según el nombre) con una parte de las
+  filas agrupadas dentro de Uruguay.
+- /thumb/<n>.png: uno de THUMB_VARIANTS PNG pre-generados.
+
+Cada respuesta espera `latency` segundos y falla con 503 con probabilidad
+`error_rate`, para ejercitar los reintentos de los clientes.
+"""
+import io
+import re
+import sys
+import time
+import random
+import threading
+import zlib
+import numpy as np
+from datetime import datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+
+
+FIRMS_PATH = re.compile(r"^/firms/[^/]+/South_America/(?P<name>[A-Za-z0-9_]+?)(?P<year>\d{4})(?P<day>\d{3})\.txt$")
+THUMB_PATH = re.compile(r"^/thumb/(?P<variant>\d+)\.png$")
+
+MODIS_COLUMNS = [
+    "latitude", "longitude", "brightness", "scan", "track", "acq_date", "acq_time",
+    "satellite", "confidence", "version", "bright_t31", "frp", "daynight",
+]
+VIIRS_COLUMNS = [
+    "latitude", "longitude", "bright_ti4", "scan", "track", "acq_date", "acq_time",
+    "satellite", "instrument", "confidence", "version", "bright_ti5", "frp", "daynight",
+]
+
+# Sudamérica (lon_min, lat_min, lon_max, lat_max) y zona de alertas en Uruguay
+SOUTH_AMERICA_BBOX = (-82.0, -56.0, -34.0, 13.0)
+URUGUAY_ALERTS_BBOX = (-58.0, -34.6, -53.5, -30.5)
+
+
+def synthetic_firms_csv(name, acq_date, rows, uruguay_rows, cluster_size=4):
+    """
+    CSV con `rows` detecciones, `uruguay_rows` de ellas en grupos de
+    cluster_size puntos a pocos cientos de metros y minutos entre sí.
+    Determinista por archivo.
+    """
+    rng = np.random.default_rng(zlib.crc32(f"{name}{acq_date}".encode("utf-8")))
+    modis = name.startswith("MODIS")
+
+    lon_min, lat_min, lon_max, lat_max = SOUTH_AMERICA_BBOX
+    lons = rng.uniform(lon_min, lon_max, rows)
+    lats = rng.uniform(lat_min, lat_max, rows)
+    times = rng.integers(0, 24 * 60, rows)
+
+    # Grupos dentro de Uruguay (los clusters de firms_clusters.py)
+    uruguay_rows = min(uruguay_rows, rows)
+    n_clusters = max(1, uruguay_rows // cluster_size)
+    u_lon_min, u_lat_min, u_lon_max, u_lat_max = URUGUAY_ALERTS_BBOX
+    centers = np.column_stack([
+        rng.uniform(u_lon_min, u_lon_max, n_clusters),
+        rng.uniform(u_lat_min, u_lat_max, n_clusters),
+        rng.integers(0, 24 * 60 - 60, n_clusters),
+    ])
+    members = rng.integers(0, n_clusters, uruguay_rows)
+    lons[:uruguay_rows] = centers[members, 0] + rng.normal(0, 0.002, uruguay_rows)
+    lats[:uruguay_rows] = centers[members, 1] + rng.normal(0, 0.002, uruguay_rows)
+    times[:uruguay_rows] = centers[members, 2] + rng.integers(0, 30, uruguay_rows)
+
+    acq_time = (times // 60) * 100 + times % 60
+    brightness = rng.uniform(300, 360, rows).round(2)
+    bright_31 = rng.uniform(280, 310, rows).round(2)
+    frp = rng.gamma(2.0, 5.0, rows).round(2)
+    scan = rng.uniform(0.3, 1.5, rows).round(2)
+    daynight = np.where((times >= 9 * 60) & (times < 21 * 60), "D", "N")
+
+    if modis:
+        confidence = rng.integers(0, 101, rows).astype(str)
+        satellite = np.where(rng.random(rows) < 0.5, "Terra", "Aqua")
+        columns = MODIS_COLUMNS
+        extra = {"confidence": confidence, "version": "6.1NRT"}
+    else:
+        confidence = rng.choice(["l", "n", "h"], rows, p=[0.2, 0.7, 0.1])
+        satellite = "N21" if "J2_" in name else "N20" if "J1_" in name else "N"
+        columns = VIIRS_COLUMNS
+        extra = {"confidence": confidence, "version": "2.0NRT", "instrument": "VIIRS"}
+
+    values = {
+        "latitude": lats.round(5), "longitude": lons.round(5),
+        "brightness": brightness, "bright_ti4": brightness,
+        "bright_t31": bright_31, "bright_ti5": bright_31,
+        "scan": scan, "track": scan, "acq_date": acq_date, "acq_time": acq_time,
+        "satellite": satellite, "frp": frp, "daynight": daynight, **extra,
+    }
+
+    out = io.StringIO()
+    out.write(",".join(columns) + "\n")
+    table = [np.broadcast_to(np.asarray(values[c]).astype(str), (rows,)) for c in columns]
+    for row in zip(*table):
+        out.write(",".join(row) + "\n")
+    return out.getvalue().encode("utf-8")
+
+
+def synthetic_thumbnail(seed, size=1024):
+    """PNG RGB con estructura de baja frecuencia más ruido, de tamaño similar a un thumbnail real."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 255, (size // 64, size // 64, 3), dtype=np.uint8)
+    image = np.asarray(Image.fromarray(coarse).resize((size, size), Image.BILINEAR), dtype=np.int16)
+    image = np.clip(image + rng.integers(-12, 12, image.shape), 0, 255).astype(np.uint8)
+
+    out = io.BytesIO()
+    Image.fromarray(image).save(out, format="PNG")
+    return out.getvalue()
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Los clientes cierran conexiones keep-alive al terminar; no es un error
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """ThreadingHTTPServer en un puerto libre, en un hilo de fondo."""
+
+    def __init__(self, latency=0.05, error_rate=0.0, firms_rows=50000, firms_uruguay_rows=1000,
+                 thumb_variants=16, thumb_size=1024, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.firms_rows = firms_rows
+        self.firms_uruguay_rows = firms_uruguay_rows
+        self.thumbs = [synthetic_thumbnail(i, thumb_size) for i in range(thumb_variants)]
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+        self.lock = threading.Lock()
+
+        # lru_cache por instancia: cada archivo FIRMS se genera una sola vez
+        self.firms_file = lru_cache(maxsize=64)(self._firms_file)
+
+        self.httpd = QuietHTTPServer((host, port), self._handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _firms_file(self, name, year, day):
+        acq_date = (datetime(int(year), 1, 1) + timedelta(days=int(day) - 1)).strftime("%Y-%m-%d")
+        return synthetic_firms_csv(name, acq_date, self.firms_rows, self.firms_uruguay_rows)
+
+    def _record(self, error=False, size=0):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["errors"] += error
+            self.stats["bytes"] += size
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(server.latency)
+
+                if random.random() < server.error_rate:
+                    server._record(error=True)
+                    return self.send_body(503, b"Service Unavailable", "text/plain")
+
+                firms = FIRMS_PATH.match(self.path)
+                thumb = THUMB_PATH.match(self.path)
+
+                if firms:
+                    body = server.firms_file(firms["name"], firms["year"], firms["day"])
+                    content_type = "text/csv"
+                elif thumb:
+                    body = server.thumbs[int(thumb["variant"]) % len(server.thumbs)]
+                    content_type = "image/png"
+                else:
+                    server._record(error=True)
+                    return self.send_body(404, b"Not Found", "text/plain")
+
+                server._record(size=len(body))
+                self.send_body(200, body, content_type)
+
+        return Handler
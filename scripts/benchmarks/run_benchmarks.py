@@ -0,0 +1,270 @@
+"""
+Benchmark offline del pipeline con Earth Engine, FIRMS y GCS simulados.
+
+Levanta fake_servers.FakeServer (FIRMS NRT + thumbnails), instala fake_ee
+como módulo `ee` y apunta GCS a un directorio local (GCS_LOCAL_ROOT); después
+corre las mismas funciones que los pipelines reales sobre un directorio de
+trabajo temporal:
+
+- tile_resolution: plan_tile_downloads sobre la grilla nacional completa
+- tiles: get_uruguay_tiles (resolución + descarga de --max_tiles thumbnails)
+- firms: firms_alerts_table para --days fechas y todos los sensores
+- alert_images: download_images_for_firms_alerts_parallel con esas alertas
+- inference: inference() sobre --inference_images tiles descargados
+
+El resultado (tiles/s, alerts/s, images/s y el reporte de instrumentation de
+cada etapa) se guarda en data/benchmarks/ con el commit actual, para comparar
+entre commits.
+
+Uso:
+    python scripts/benchmarks/run_benchmarks.py --max_tiles 500 --days 3
+"""
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCHMARKS_DIR)
+REPO_DIR = os.path.dirname(SCRIPTS_DIR)
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+OUTPUT_DIR = os.getenv("BENCHMARK_OUTPUT_DIR", os.path.join(REPO_DIR, "data", "benchmarks"))
+
+# Fechas fijas para que los números sean comparables entre corridas
+START_DATE = "2025-01-10"
+
+STAGES = ["tile_resolution", "tiles", "firms", "alert_images", "inference"]
+
+parser = argparse.ArgumentParser(description="Offline pipeline benchmarks with local EE / FIRMS / GCS stand-ins.")
+parser.add_argument("--stages", type=str, default=",".join(STAGES), help="Comma separated stages to run")
+parser.add_argument("--max_tiles", type=int, default=1000, help="Tile thumbnails to download (0 = full grid)")
+parser.add_argument("--days", type=int, default=3, help="FIRMS dates to download, starting at START_DATE")
+parser.add_argument("--sensors", type=str, default="all", help='FIRMS sensors: "all" or e.g. "NOAA21,MODIS"')
+parser.add_argument("--firms_rows", type=int, default=50000, help="Rows per continental FIRMS file")
+parser.add_argument("--firms_uruguay_rows", type=int, default=1000, help="Rows per file inside Uruguay")
+parser.add_argument("--inference_images", type=int, default=64, help="Images classified in the inference stage")
+parser.add_argument("--ee_latency", type=float, default=0.3, help="Seconds per simulated getInfo")
+parser.add_argument("--thumb_url_latency", type=float, default=0.05, help="Seconds per simulated getThumbURL")
+parser.add_argument("--http_latency", type=float, default=0.05, help="Seconds per local HTTP response")
+parser.add_argument("--error_rate", type=float, default=0.0, help="Probability of a 503 per HTTP request")
+parser.add_argument("--workdir", type=str, default=None, help="Working directory (default: temporary, deleted at the end)")
+parser.add_argument("--output_dir", type=str, default=OUTPUT_DIR, help="Where the JSON results are written")
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def random_model(model_dir):
+    """
+    Modelo con los pesos del repo si están, o uno con la misma arquitectura y
+    pesos aleatorios (el benchmark mide throughput, no exactitud).
+    """
+    source = os.path.join(REPO_DIR, "models", "efficientnet")
+    if any(os.path.exists(os.path.join(source, name)) for name in ("model.safetensors", "pytorch_model.bin")):
+        return source
+
+    from transformers import AutoConfig, AutoModelForImageClassification
+
+    config = AutoConfig.from_pretrained(source)
+    AutoModelForImageClassification.from_config(config).save_pretrained(model_dir)
+    shutil.copy(os.path.join(source, "preprocessor_config.json"), model_dir)
+    print(f"Model weights not found in {source}, using a randomly initialized model")
+
+    return model_dir
+
+
+def setup(args, workdir):
+    """Servidor local, variables de entorno y `ee` falso; debe correr antes de importar los pipelines."""
+    from fake_servers import FakeServer
+    import fake_ee
+
+    server = FakeServer(
+        latency=args.http_latency,
+        error_rate=args.error_rate,
+        firms_rows=args.firms_rows,
+        firms_uruguay_rows=args.firms_uruguay_rows,
+    ).__enter__()
+
+    fake_ee.install(
+        latency={"getInfo": args.ee_latency, "getThumbURL": args.thumb_url_latency},
+        thumb_base_url=server.base_url,
+    )
+
+    os.environ.update({
+        "FIRMS_BASE_URL": f"{server.base_url}/firms",
+        "FIRMS_TOKEN": "benchmark",
+        "BUCKET_NAME": "benchmark-bucket",
+        "GCS_LOCAL_ROOT": os.path.join(workdir, "gcs"),
+        "THUMB_CACHE_MAX_GB": "0",
+        "RUN_REPORTS_DIR": os.path.join(workdir, "data", "run_reports"),
+    })
+
+    os.chdir(workdir)
+    sys.path.insert(0, SCRIPTS_DIR)
+
+    return server, fake_ee
+
+
+def run_stage(results, name, fn, items_name):
+    """Corre una etapa con el registro de instrumentation limpio; fn devuelve la cantidad de items."""
+    from instrumentation import REGISTRY
+
+    print(f"\n===== {name} =====")
+    REGISTRY.reset()
+
+    t0 = time.perf_counter()
+    items = fn()
+    wall_s = time.perf_counter() - t0
+
+    results[name] = {
+        "wall_s": wall_s,
+        items_name: items,
+        f"{items_name}_per_s": items / wall_s if wall_s > 0 else None,
+        "report": REGISTRY.report(),
+    }
+    print(f"{name}: {items} {items_name} in {wall_s:.1f}s ({items / wall_s:.1f} {items_name}/s)")
+
+
+def run_benchmarks(args, workdir):
+    server, fake_ee = setup(args, workdir)
+    stages = args.stages.split(",")
+    results = {}
+
+    dates = [
+        (datetime.strptime(START_DATE, "%Y-%m-%d") + timedelta(days=i)).strftime("%Y-%m-%d")
+        for i in range(args.days)
+    ]
+    sensors = args.sensors if args.sensors == "all" else args.sensors.split(",")
+    state = {}
+
+    try:
+        import uruguay_tiles
+
+        if "tile_resolution" in stages:
+            run_stage(results, "tile_resolution", lambda: len(uruguay_tiles.plan_tile_downloads()), "tiles")
+
+        if "tiles" in stages:
+            def tiles():
+                state["tiles_dir"] = uruguay_tiles.get_uruguay_tiles(max_tiles=args.max_tiles or None)
+                return len([f for f in os.listdir(state["tiles_dir"]) if f.endswith(".png")])
+            run_stage(results, "tiles", tiles, "tiles")
+
+        if "firms" in stages or "alert_images" in stages:
+            from firms_alerts import firms_alerts_table
+
+            def firms():
+                state["alerts"] = firms_alerts_table(dates, sensor=sensors, copy_to_gcs=True)
+                return len(state["alerts"])
+            run_stage(results, "firms", firms, "alerts")
+
+        if "alert_images" in stages:
+            from pipeline_firms import download_images_for_firms_alerts_parallel
+
+            def alert_images():
+                images_dir = download_images_for_firms_alerts_parallel(state["alerts"], copy_to_gcs=True)
+                return len([f for f in os.listdir(images_dir) if f.endswith(".png")])
+            run_stage(results, "alert_images", alert_images, "images")
+
+        if "inference" in stages:
+            import inference
+
+            inference.MODEL_PATH = random_model(os.path.join(workdir, "model"))
+
+            # Subconjunto de tiles (o thumbnails sintéticos si no se corrió la etapa tiles)
+            images_dir = os.path.join(workdir, "inference_images")
+            os.makedirs(images_dir, exist_ok=True)
+            sources = sorted(glob.glob(os.path.join(state.get("tiles_dir", ""), "*.png")))
+            for i in range(args.inference_images):
+                path = os.path.join(images_dir, f"tile_{i}.png")
+                if sources:
+                    shutil.copyfile(sources[i % len(sources)], path)
+                else:
+                    with open(path, "wb") as f:
+                        f.write(server.thumbs[i % len(server.thumbs)])
+
+            run_stage(results, "inference", lambda: inference.inference(images_dir=images_dir) and args.inference_images, "images")
+    finally:
+        server.__exit__(None, None, None)
+
+    return {
+        "commit": git_commit(),
+        "started_utc": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("workdir", "output_dir")},
+        "fake_ee": dict(fake_ee.stats),
+        "fake_http": dict(server.stats),
+        "stages": results,
+    }
+
+
+def headline(result):
+    """{etapa: items/s} de un resultado."""
+    numbers = {}
+    for name, stage in result["stages"].items():
+        for key, value in stage.items():
+            if key.endswith("_per_s"):
+                numbers[name] = value
+    return numbers
+
+
+def print_history(output_dir):
+    """Items/s por etapa de todas las corridas guardadas, para comparar commits."""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(output_dir, "benchmark_*.json"))):
+        with open(path, encoding="utf-8") as f:
+            result = json.load(f)
+        rows.append((result["started_utc"], result["commit"], headline(result)))
+
+    print(f"\n{'started_utc':<21}{'commit':<16}" + "".join(f"{stage:>17}" for stage in STAGES))
+    for started, commit, numbers in rows:
+        cells = "".join(f"{numbers[s]:>17.1f}" if numbers.get(s) is not None else f"{'-':>17}" for s in STAGES)
+        print(f"{started:<21}{commit:<16}{cells}")
+
+
+def main():
+    args = parser.parse_args()
+    output_dir = os.path.abspath(args.output_dir)
+    cwd = os.getcwd()
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="wildfire_bench_")
+    os.makedirs(workdir, exist_ok=True)
+
+    try:
+        result = run_benchmarks(args, workdir)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(output_dir, f"benchmark_{stamp}_{result['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\nBenchmark results written: {path}")
+    print_history(output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import os
+import math
+import time
+import queue
+import random
+import asyncio
+import aiohttp
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import count, observe
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# Concurrencia adaptativa (AIMD): arranca en INITIAL, sube de a 1 por ventana
+# sin errores y se divide a la mitad ante 429/5xx
+INITIAL_CONCURRENCY = int(os.getenv("DOWNLOAD_INITIAL_CONCURRENCY", "8"))
+MAX_CONCURRENCY = int(os.getenv("DOWNLOAD_MAX_CONCURRENCY", "32"))
+MIN_CONCURRENCY = 1
+
+# Conexiones simultáneas por host dentro del pool compartido
+PER_HOST_LIMIT = int(os.getenv("DOWNLOAD_PER_HOST_LIMIT", "16"))
+
+# Hilos para resolver URLs (ej. getThumbURL de Earth Engine, que es bloqueante)
+RESOLVE_THREADS = int(os.getenv("MAX_THREADS", "10"))
+
+MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = float(os.getenv("DOWNLOAD_RETRY_BASE_DELAY", "1.0"))
+REQUEST_TIMEOUT = int(os.getenv("DOWNLOAD_TIMEOUT", "120"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Tope de la espera pedida por el servidor con Retry-After
+RETRY_AFTER_MAX = float(os.getenv("DOWNLOAD_RETRY_AFTER_MAX", "60"))
+
+# Jobs en curso más resultados sin consumir; con un consumidor lento no se arrancan más descargas
+MAX_PENDING = int(os.getenv("DOWNLOAD_MAX_PENDING", str(2 * MAX_CONCURRENCY)))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AdaptiveLimiter:
+    """Límite de concurrencia AIMD: +1 por ventana exitosa, /2 ante throttling."""
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.throttled = 0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def success(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def throttle(self):
+        self.throttled += 1
+        now = time.monotonic()
+        # Una sola reducción por ventana de congestión
+        if now - self.last_decrease > 1.0:
+            self.limit = max(self.minimum, self.limit / 2)
+            self.last_decrease = now
+
+
+def parse_retry_after(value):
+    """Retry-After en segundos o como fecha HTTP -> segundos a esperar, o None si no se entiende."""
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when is None:
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(timezone.utc)).total_seconds()
+
+    return seconds if not math.isnan(seconds) else None
+
+
+def retry_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        seconds = parse_retry_after(retry_after)
+        if seconds is not None:
+            return min(max(seconds, 0.0), RETRY_AFTER_MAX)
+    return RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+async def fetch(session, limiter, url, path=None):
+    """Descarga url a path (en streaming) o a memoria; reintenta 429/5xx y errores de red con jitter."""
+    host = urlparse(url).netloc
+
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            async with limiter:
+                async with session.get(url) as response:
+                    if response.status in RETRY_STATUSES:
+                        limiter.throttle()
+                        retry_after = response.headers.get("Retry-After")
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=f"{response.status} from {host}"
+                        )
+                    response.raise_for_status()
+
+                    if path is None:
+                        content = await response.read()
+                        limiter.success()
+                        return content, len(content)
+
+                    tmp_path = f"{path}.part"
+                    size = 0
+                    try:
+                        with open(tmp_path, "wb") as f:
+                            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                                f.write(chunk)
+                                size += len(chunk)
+                        os.replace(tmp_path, path)
+                    finally:
+                        # Corte a mitad del stream (error de red o cancelación): no queda el .part
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                    limiter.success()
+                    return None, size
+
+        except aiohttp.ClientResponseError as e:
+            if e.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES:
+                raise
+
+        await asyncio.sleep(retry_delay(attempt, retry_after))
+
+
+def unpack_request(request):
+    """(url, path) o (url, path, cache_key) -> (url, path, cache_key)."""
+    url, path, *rest = request
+    return url, path, rest[0] if rest else None
+
+
+async def run_job(session, limiter, resolve_pool, job, cache=None):
+    loop = asyncio.get_running_loop()
+    result = {"key": job.get("key"), "path": None, "content": None, "size": 0, "cached": False, "error": None}
+
+    try:
+        if "resolve" in job:
+            t0 = time.perf_counter()
+            resolved = await loop.run_in_executor(resolve_pool, job["resolve"])
+            observe("ee_resolve", time.perf_counter() - t0)
+            if resolved is None:
+                result["error"] = "nothing to download"
+                return result
+            url, path, cache_key = unpack_request(resolved)
+        else:
+            url, path, cache_key = job["url"], job.get("path"), job.get("cache_key")
+
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        if cache is not None and cache_key is not None:
+            if path is None:
+                content = cache.read(cache_key)
+                if content is not None:
+                    result.update(content=content, size=len(content), cached=True)
+                    count("thumb_cache_hits")
+                    return result
+            elif cache.copy_to(cache_key, path):
+                result.update(path=path, size=os.path.getsize(path), cached=True)
+                count("thumb_cache_hits")
+                return result
+
+        # La URL puede ser una función (ej. getThumbURL) que solo se llama si no hubo hit
+        if callable(url):
+            t0 = time.perf_counter()
+            url = await loop.run_in_executor(resolve_pool, url)
+            observe("ee_thumb_url", time.perf_counter() - t0)
+            count("ee_round_trips")
+
+        t0 = time.perf_counter()
+        content, size = await fetch(session, limiter, url, path)
+        observe("thumbnail_download", time.perf_counter() - t0)
+        count("downloads")
+        count("bytes_downloaded", size)
+        result.update(path=path, content=content, size=size)
+
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, content=content, src_path=path)
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+        count("download_errors")
+
+    return result
+
+
+async def download_jobs(jobs, on_result, max_concurrency=MAX_CONCURRENCY, per_host_limit=PER_HOST_LIMIT, cache=None,
+                        max_pending=MAX_PENDING, stop=None):
+    """
+    Corre los jobs con a lo sumo max_pending en curso: cada job nuevo arranca
+    recién cuando on_result aceptó el resultado de uno terminado, así que un
+    on_result que bloquea (cola acotada) frena las descargas.
+
+    Con stop (threading.Event) activado no se arrancan más jobs y se cancelan
+    los que están en curso.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = AdaptiveLimiter(maximum=max_concurrency)
+    connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=per_host_limit, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    jobs = iter(jobs)
+
+    with ThreadPoolExecutor(max_workers=RESOLVE_THREADS) as resolve_pool:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            in_flight = set()
+            while stop is None or not stop.is_set():
+                for job in jobs:
+                    in_flight.add(asyncio.ensure_future(run_job(session, limiter, resolve_pool, job, cache)))
+                    if len(in_flight) >= max_pending:
+                        break
+                if not in_flight:
+                    break
+
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # En un hilo: mientras el consumidor no hace lugar, las descargas en curso siguen
+                    await loop.run_in_executor(None, on_result, task.result())
+
+            if in_flight:
+                resolve_pool.shutdown(wait=False, cancel_futures=True)
+                for task in in_flight:
+                    task.cancel()
+                await asyncio.gather(*in_flight, return_exceptions=True)
+
+    print(f"Downloads finished (final concurrency {int(limiter.limit)}, throttled responses {limiter.throttled})")
+
+    if cache is not None:
+        print("Thumbnail cache:", cache.stats())
+
+
+def iter_downloads(jobs, max_concurrency=MAX_CONCURRENCY, per_host_limit=PER_HOST_LIMIT, cache=None,
+                   max_pending=MAX_PENDING):
+    """
+    Ejecuta las descargas en un event loop en segundo plano y devuelve los
+    resultados a medida que terminan.
+
+    Cada job es un dict con "key" y, o bien "url" (+ "path" y "cache_key"
+    opcionales), o bien "resolve": una función bloqueante que devuelve
+    (url, path[, cache_key]) o None. La url puede ser una función que se
+    llama solo si el thumbnail no está en `cache` (thumb_cache.ThumbCache).
+    Con path=None el contenido queda en memoria en result["content"].
+
+    Los resultados pasan por una cola de max_pending: si el consumidor no
+    avanza, la cola se llena y no se arrancan más jobs, así que la memoria
+    queda acotada aunque jobs tenga todo el país. Si el consumidor deja de
+    iterar (break o excepción) se cancelan las descargas pendientes.
+    """
+    results = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        # Sin consumidor (stop) no se espera lugar en la cola
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def run():
+        try:
+            asyncio.run(download_jobs(jobs, put, max_concurrency, per_host_limit, cache, max_pending, stop))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(None)
+
+    thread = threading.Thread(target=run, name="iter_downloads", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            yield result
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def download_all(jobs, **kwargs):
+    return list(iter_downloads(jobs, **kwargs))
+
+
+def test():
+    """Retry-After acotado, sin .part tras un stream cortado y sin hilos colgados si el consumidor corta."""
+    import sys
+    import tempfile
+    from email.utils import format_datetime
+    from http.server import BaseHTTPRequestHandler
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+    from fake_servers import FakeServer, QuietHTTPServer
+
+    global MAX_RETRIES
+
+    assert retry_delay(0, "3") == 3.0
+    assert retry_delay(0, "86400") == RETRY_AFTER_MAX
+    in_5s = format_datetime(datetime.fromtimestamp(time.time() + 5, timezone.utc), usegmt=True)
+    assert 3.0 < retry_delay(0, in_5s) <= 5.0
+    assert retry_delay(0, "Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert retry_delay(0, "soon") <= RETRY_BASE_DELAY * 1.5
+
+    class Truncated(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(1024 * 1024))
+            self.end_headers()
+            self.wfile.write(b"x" * 1024)
+
+        def log_message(self, *args):
+            pass
+
+    truncated = QuietHTTPServer(("127.0.0.1", 0), Truncated)
+    threading.Thread(target=truncated.serve_forever, daemon=True).start()
+    host, port = truncated.server_address[:2]
+
+    saved_retries, MAX_RETRIES = MAX_RETRIES, 0
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tile.png")
+            [result] = download_all([{"key": "tile", "url": f"http://{host}:{port}/tile.png", "path": path}])
+            assert result["error"], result
+            assert os.listdir(tmp) == [], os.listdir(tmp)
+    finally:
+        MAX_RETRIES = saved_retries
+        truncated.shutdown()
+        truncated.server_close()
+
+    with FakeServer(latency=0.05, thumb_variants=2, thumb_size=64) as server:
+        jobs = ({"key": i, "url": f"{server.base_url}/thumb/{i}.png"} for i in range(1000))
+        results = iter_downloads(jobs, max_pending=4)
+        for _ in range(3):
+            assert next(results)["error"] is None
+        results.close()
+
+        assert not any(t.name == "iter_downloads" for t in threading.enumerate())
+        assert server.stats["requests"] < 50, server.stats
+
+
+if __name__ == "__main__":
+    test()
@@ -3,8 +3,13 @@ import requests
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import pandas as pd
-import subprocess
+import itertools
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from utils import move_data_from_local_to_gcs
+from alert_store import ALERT_STORE_DIR, read_alerts, write_alerts
+from alert_export import write_kml
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 load_dotenv(".env")
@@ -18,12 +23,96 @@ sensor_basenames = {
     "SUOMI": ["suomi-npp-viirs-c2", "SUOMI_VIIRS_C2_South_America_VNP14IMGTDL_NRT_"],
 }
 
-def download_file_with_token(url, token, output_path):
+# Raíz del archivo NRT (se puede apuntar a un servidor local, ver benchmarks/)
+FIRMS_BASE_URL = os.getenv("FIRMS_BASE_URL", "https://nrt3.modaps.eosdis.nasa.gov/archive/FIRMS")
+
+# Descargas simultáneas sobre todo el producto sensores x fechas
+FIRMS_DOWNLOAD_WORKERS = int(os.getenv("FIRMS_DOWNLOAD_WORKERS", "8"))
+FIRMS_MAX_RETRIES = int(os.getenv("FIRMS_MAX_RETRIES", "5"))
+
+# Filtra el archivo continental por bbox mientras llega la respuesta HTTP, de a
+# bloques de FIRMS_CHUNK_ROWS filas; el .txt completo solo se guarda con FIRMS_KEEP_RAW=1
+FIRMS_STREAM = os.getenv("FIRMS_STREAM", "1") == "1"
+FIRMS_KEEP_RAW = os.getenv("FIRMS_KEEP_RAW", "0") == "1"
+FIRMS_CHUNK_ROWS = int(os.getenv("FIRMS_CHUNK_ROWS", "50000"))
+
+# lon_min, lat_min, lon_max, lat_max
+URUGUAY_BBOX = (-58.5, -35.0, -53.0, -30.0)
+
+# Tipos de las columnas de los archivos NRT (MODIS y VIIRS); las que no
+# vienen en un sensor se ignoran
+FIRMS_DTYPES = {
+    "latitude": "float64",
+    "longitude": "float64",
+    "brightness": "float64",
+    "bright_t31": "float64",
+    "bright_ti4": "float64",
+    "bright_ti5": "float64",
+    "scan": "float32",
+    "track": "float32",
+    "acq_date": "str",
+    "acq_time": "int32",
+    "satellite": "str",
+    "instrument": "str",
+    "confidence": "str",
+    "version": "str",
+    "frp": "float64",
+    "daynight": "str",
+}
+
+# Columnas comunes a MODIS y VIIRS en la tabla de alertas normalizada
+ALERT_COLUMNS = [
+    "sensor", "latitude", "longitude", "acq_date", "acq_time",
+    "satellite", "instrument", "brightness", "bright_t31", "frp",
+    "confidence", "confidence_level", "daynight",
+]
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Sesión HTTP compartida: pool de conexiones y reintentos con backoff ante 429/5xx."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=FIRMS_MAX_RETRIES,
+                backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"],
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=FIRMS_DOWNLOAD_WORKERS)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def normalize_sensors(sensor):
+    """"NOAA21", ["MODIS", "NOAA20"] o "all" -> lista de sensores."""
+    if sensor == "all":
+        return list(sensor_basenames)
+    if isinstance(sensor, str):
+        return [sensor]
+    return list(sensor)
+
+
+def sensor_from_filename(path):
+    name = os.path.basename(path)
+    for sensor, (_, basename) in sensor_basenames.items():
+        if name.startswith(basename):
+            return sensor
+    return None
+
+def download_file_with_token(url, token, output_path, session=None):
     headers = {
         "Authorization": f"Bearer {token}"
     }
     try:
-        with requests.get(url, headers=headers, stream=True) as r:
+        with (session or requests).get(url, headers=headers, stream=True) as r:
             if r.status_code == 404:
                 print(f"File not found at URL: {url}")
                 return False
@@ -46,20 +135,22 @@ def get_url_and_filename(date, sensor):
     julian_day = date.timetuple().tm_yday
     julian_date = f"{year}{julian_day:03d}"
     sensor_basename = sensor_basenames[sensor]
-    url = f"https://nrt3.modaps.eosdis.nasa.gov/archive/FIRMS/{sensor_basename[0]}/South_America/{sensor_basename[1]}{julian_date}.txt"
+    url = f"{FIRMS_BASE_URL}/{sensor_basename[0]}/South_America/{sensor_basename[1]}{julian_date}.txt"
     output_file = f"{sensor_basename[1]}{julian_date}.txt"
     return url, output_file
 
-def filter_uruguay_coordinates(input_file, output_file=None):
-    df = pd.read_csv(input_file)
-    
-    lat_min, lat_max = -35.0, -30.0
-    lon_min, lon_max = -58.5, -53.0
+def filter_bbox(df, bbox=URUGUAY_BBOX):
+    lon_min, lat_min, lon_max, lat_max = bbox
 
-    df_uy = df[
+    return df[
         (df['latitude'] >= lat_min) & (df['latitude'] <= lat_max) &
         (df['longitude'] >= lon_min) & (df['longitude'] <= lon_max)
     ]
+
+def filter_uruguay_coordinates(input_file, output_file=None):
+    df = pd.read_csv(input_file)
+
+    df_uy = filter_bbox(df)
     
     if output_file:
         df_uy.to_csv(output_file, index=False)
@@ -68,35 +159,95 @@ def filter_uruguay_coordinates(input_file, output_file=None):
     return df_uy
 
 def create_kml_from_csv(df, output_file):
-    kml_header = """<?xml version="1.0" encoding="UTF-8"?>
-    <kml xmlns="http://www.opengis.net/kml/2.2">
-    <Document>
-    <name>FIRMS Points</name>
+    """Wrapper de alert_export.write_kml, que escribe el KML por bloques."""
+    return write_kml(df, output_file)
+
+class TeeReader:
+    """File-like que copia a disco lo que pandas va leyendo de la respuesta HTTP."""
+
+    def __init__(self, raw, path):
+        self.raw = raw
+        self.file = open(path, "wb")
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.file.write(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def stream_filter_uruguay(url, token, output_file, raw_path=None, session=None, bbox=URUGUAY_BBOX):
     """
-    kml_footer = "</Document>\n</kml>"
-
-    placemarks = ""
-    for _, row in df.iterrows():
-        placemarks += f"""    <Placemark>
-        <name>{row['acq_date']} {row['acq_time']}</name>
-        <description>Brightness: {row['brightness']}, Confidence: {row['confidence']}</description>
-        <Point>
-            <coordinates>{row['longitude']},{row['latitude']},0</coordinates>
-        </Point>
-    </Placemark>
+    Descarga el archivo NRT y lo filtra por bbox bloque a bloque mientras
+    llega; en memoria solo queda un bloque y en disco solo las filas de
+    Uruguay (más el .txt completo si se pasa raw_path).
     """
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    tmp_file = f"{output_file}.tmp"
+    try:
+        with (session or requests).get(url, headers=headers, stream=True) as r:
+            if r.status_code == 404:
+                print(f"File not found at URL: {url}")
+                return False
+            r.raise_for_status()
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(kml_header + placemarks + kml_footer)
+            r.raw.decode_content = True
+            stream = TeeReader(r.raw, raw_path) if raw_path else r.raw
 
-    print(f"KML generated correctly: {output_file}")
+            rows = 0
+            kept = 0
+            try:
+                try:
+                    chunks = pd.read_csv(stream, chunksize=FIRMS_CHUNK_ROWS, dtype=FIRMS_DTYPES)
+                except pd.errors.EmptyDataError:
+                    # Respuesta vacía, sin encabezado
+                    chunks = []
+
+                with open(tmp_file, "w", newline="", encoding="utf-8") as f:
+                    header = True
+                    for chunk in chunks:
+                        filtered = filter_bbox(chunk, bbox)
+                        filtered.to_csv(f, header=header, index=False)
+                        header = False
+                        rows += len(chunk)
+                        kept += len(filtered)
+
+                    # El CSV de Uruguay siempre tiene encabezado, aunque no quede ninguna fila
+                    if header:
+                        pd.DataFrame(columns=list(FIRMS_DTYPES)).to_csv(f, index=False)
+            finally:
+                if raw_path:
+                    stream.close()
+
+        os.replace(tmp_file, output_file)
+        print(f"File saved: {output_file} ({kept} of {rows} rows inside bbox)")
+        return output_file
+    except Exception as e:
+        print("Error in download:", e)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
 
-def download_and_process(date, sensor):
-    """Función que descarga y filtra un archivo para una fecha dada."""
+def download_and_process(date, sensor, stream=FIRMS_STREAM, keep_raw=FIRMS_KEEP_RAW):
+    """
+    Función que descarga y filtra un archivo para una fecha dada. Devuelve
+    (archivo crudo o None, csv de Uruguay).
+    """
     url, filename = get_url_and_filename(date, sensor)
     local_txt = os.path.join("data/firms_alerts_nrt", filename)
 
-    downloaded_file = download_file_with_token(url, EDL_TOKEN, local_txt)
+    if stream:
+        uru_csv = local_txt.replace(".txt", "_Uruguay.csv")
+        raw_path = local_txt if keep_raw else None
+        if not stream_filter_uruguay(url, EDL_TOKEN, uru_csv, raw_path=raw_path, session=get_session()):
+            return None
+        return raw_path, uru_csv
+
+    downloaded_file = download_file_with_token(url, EDL_TOKEN, local_txt, session=get_session())
     if not downloaded_file:
         return None
 
@@ -105,9 +256,7 @@ def download_and_process(date, sensor):
 
     return downloaded_file, uru_csv
 
-def firms_alerts_by_dates(dates, sensor="NOAA21", copy_to_gcs=False, delete_local=False, output_dir="data/firms_alerts_nrt"):
-    os.makedirs(output_dir, exist_ok=True)
-
+def normalize_dates(dates):
     normalized_dates = []
     for d in dates:
         if isinstance(d, str):
@@ -119,31 +268,152 @@ def firms_alerts_by_dates(dates, sensor="NOAA21", copy_to_gcs=False, delete_loca
                 normalized_dates.append(datetime.strptime(d, "%Y-%m-%d"))
         else:
             normalized_dates.append(d)
+    return normalized_dates
+
+def firms_alerts_by_dates(dates, sensor="NOAA21", copy_to_gcs=False, delete_local=False, output_dir="data/firms_alerts_nrt", store=ALERT_STORE_DIR):
+    """
+    Descarga y filtra los archivos NRT de uno o varios sensores (str, lista o
+    "all") para las fechas dadas. Todo el producto sensores x fechas comparte
+    un solo pool y una sesión HTTP, así que el tiempo total lo marca el
+    archivo más lento y no la suma por sensor.
+
+    Con store (ver alert_store.py) cada sensor-día queda además en su
+    partición Parquet.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    sensors = normalize_sensors(sensor)
+    normalized_dates = normalize_dates(dates)
 
     generated_files = []
     uru_files = []
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_date = {executor.submit(download_and_process, date, sensor): date for date in normalized_dates}
-        for future in as_completed(future_to_date):
+    with ThreadPoolExecutor(max_workers=FIRMS_DOWNLOAD_WORKERS) as executor:
+        future_to_job = {
+            executor.submit(download_and_process, date, s): (s, date)
+            for s, date in itertools.product(sensors, normalized_dates)
+        }
+        for future in as_completed(future_to_job):
             result = future.result()
             if result:
                 downloaded_file, uru_csv = result
-                generated_files.extend([downloaded_file, uru_csv])
+                generated_files.extend(path for path in (downloaded_file, uru_csv) if path)
                 uru_files.append(uru_csv)
+
+                if store:
+                    s, _ = future_to_job[future]
+                    write_alerts(normalize_alerts(pd.read_csv(uru_csv), s), store)
     
     if copy_to_gcs and generated_files:
         gcs_dir = f"gs://{BUCKET_NAME}/firms_alerts/"
-        for file_path in generated_files:
-            move_data_from_local_to_gcs(file_path, gcs_dir)
-            if delete_local:
+        move_data_from_local_to_gcs(generated_files, gcs_dir)
+        if delete_local:
+            for file_path in generated_files:
                 os.remove(file_path)
                 print(f"Deleted local file: {file_path}")
 
-    return uru_files
+    return sorted(uru_files)
+
+
+def modis_confidence_level(confidence):
+    """MODIS reporta confianza 0-100; VIIRS usa l/n/h. Se lleva todo a low/nominal/high."""
+    confidence = pd.to_numeric(confidence, errors="coerce")
+    return pd.cut(confidence, bins=[-1, 29, 79, 100], labels=["low", "nominal", "high"]).astype(str)
+
+
+def normalize_alerts(df, sensor):
+    """Tabla de un sensor -> columnas ALERT_COLUMNS comunes a MODIS y VIIRS."""
+    df = df.copy()
+    df["sensor"] = sensor
+
+    if "bright_ti4" in df.columns:
+        # VIIRS: canales I4/I5 equivalen a brightness/bright_t31 de MODIS
+        df = df.rename(columns={"bright_ti4": "brightness", "bright_ti5": "bright_t31"})
+        df["confidence_level"] = df["confidence"].astype(str).str.lower().map(
+            {"l": "low", "n": "nominal", "h": "high"}
+        )
+    else:
+        df["confidence_level"] = modis_confidence_level(df["confidence"])
+
+    df["confidence"] = df["confidence"].astype(str)
+
+    for column in ALERT_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+
+    return df[ALERT_COLUMNS]
+
+
+def merge_alerts(uru_files):
+    """Une los CSV filtrados de todos los sensores en una sola tabla normalizada."""
+    dfs = []
+    for path in uru_files:
+        df = pd.read_csv(path)
+        if df.empty:
+            continue
+        dfs.append(normalize_alerts(df, sensor_from_filename(path)))
+
+    if not dfs:
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+
+    return pd.concat(dfs, ignore_index=True)
+
+
+def firms_alerts_table(dates, sensor="NOAA21", store=ALERT_STORE_DIR, **kwargs):
+    """
+    Alertas de Uruguay de todos los sensores pedidos. Descarga las fechas y
+    las lee del store filtrando por fecha, sensor y bbox; sin store une los
+    CSV descargados (merge_alerts).
+    """
+    uru_files = firms_alerts_by_dates(dates, sensor=sensor, store=store, **kwargs)
+
+    if store:
+        alerts = read_alerts(dates=normalize_dates(dates), sensors=normalize_sensors(sensor), bbox=URUGUAY_BBOX, root=store)
+        alerts = alerts[[column for column in alerts.columns if column in ALERT_COLUMNS]]
+    else:
+        alerts = merge_alerts(uru_files)
+
+    print(f"Loaded {len(alerts)} alerts:", alerts["sensor"].value_counts().to_dict())
+
+    return alerts
 
 
 def test():
+    import io
+    import tempfile
+
+    class FakeResponse:
+        status_code = 200
+
+        def __init__(self, body):
+            self.raw = io.BytesIO(body.encode("utf-8"))
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def raise_for_status(self):
+            pass
+
+    class FakeSession:
+        def __init__(self, body):
+            self.body = body
+
+        def get(self, url, **kwargs):
+            return FakeResponse(self.body)
+
+    # Sin filas dentro de Uruguay, solo encabezado o respuesta vacía: CSV legible y vacío
+    header = "latitude,longitude,bright_ti4,scan,track,acq_date,acq_time,satellite,instrument,confidence,version,bright_ti5,frp,daynight\n"
+    outside = "-10.5,-60.2,330.1,0.4,0.4,2025-01-10,1530,N21,VIIRS,n,2.0NRT,290.3,5.1,D\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        for body in (header + outside * 3, header, ""):
+            output_file = os.path.join(tmp, "uruguay.csv")
+            assert stream_filter_uruguay("http://firms.test/file.txt", "token", output_file, session=FakeSession(body))
+            df = pd.read_csv(output_file)
+            assert df.empty and "latitude" in df.columns
+            assert normalize_alerts(df, "NOAA21").empty
 
     dates = [
     "2025-01-10",
@@ -167,5 +437,8 @@ def test():
         delete_local=False
     )
 
+    alerts = firms_alerts_table(dates, sensor="all")
+    print(alerts.head())
+
 if __name__ == "__main__":
     test()
@@ -0,0 +1,150 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# Distancia máxima (m) de una alerta al representante de su cluster. Con el
+# buffer de 2 km de Sentinel-2 el recorte del representante cubre a todos.
+CLUSTER_DISTANCE_M = float(os.getenv("CLUSTER_DISTANCE_M", "1000"))
+
+# Diferencia máxima de adquisición con el representante (las detecciones de
+# un mismo pasaje VIIRS/MODIS quedan dentro)
+CLUSTER_TIME_WINDOW_HOURS = float(os.getenv("CLUSTER_TIME_WINDOW_HOURS", "3"))
+
+# Tabla alerta -> cluster -> imagen que se guarda junto a las imágenes descargadas
+ALERTS_CLUSTERS_CSV = "alerts_clusters.csv"
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def alert_times(alerts):
+    acq_time = alerts["acq_time"].astype(int).astype(str).str.zfill(4)
+    return pd.to_datetime(alerts["acq_date"].astype(str) + " " + acq_time, format="%Y-%m-%d %H%M")
+
+
+def project_meters(lat, lon):
+    """Proyección equirectangular local; suficiente para distancias de pocos km."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat.mean()) if len(lat) else 1.0
+    return lon * cos_lat * EARTH_RADIUS_M, lat * EARTH_RADIUS_M
+
+
+def cluster_alerts(alerts, distance_m=CLUSTER_DISTANCE_M, time_window_hours=CLUSTER_TIME_WINDOW_HOURS):
+    """
+    Clustering greedy por líder sobre una grilla hash de celdas de distance_m.
+
+    Las alertas se recorren en orden de adquisición; cada una se asigna al
+    primer líder a menos de distance_m y time_window_hours, o pasa a ser
+    líder de un cluster nuevo. Devuelve (cluster_id, es_representante) por fila.
+    """
+    n = len(alerts)
+    cluster_ids = np.full(n, -1, dtype=np.int64)
+    is_leader = np.zeros(n, dtype=bool)
+    if n == 0:
+        return cluster_ids, is_leader
+
+    x, y = project_meters(alerts["latitude"].to_numpy(), alerts["longitude"].to_numpy())
+    t = alert_times(alerts).to_numpy().astype("datetime64[s]").astype(np.int64)
+
+    cells_x = np.floor(x / distance_m).astype(np.int64)
+    cells_y = np.floor(y / distance_m).astype(np.int64)
+
+    max_dist2 = distance_m ** 2
+    max_dt = time_window_hours * 3600
+
+    grid = {}
+    leaders = 0
+
+    for i in np.argsort(t, kind="stable"):
+        cx, cy = cells_x[i], cells_y[i]
+        assigned = -1
+
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for leader in grid.get((cx + dx, cy + dy), ()):
+                    if t[i] - t[leader] > max_dt:
+                        continue
+                    if (x[i] - x[leader]) ** 2 + (y[i] - y[leader]) ** 2 <= max_dist2:
+                        assigned = cluster_ids[leader]
+                        break
+                if assigned >= 0:
+                    break
+            if assigned >= 0:
+                break
+
+        if assigned < 0:
+            assigned = leaders
+            leaders += 1
+            is_leader[i] = True
+            grid.setdefault((cx, cy), []).append(i)
+
+        cluster_ids[i] = assigned
+
+    return cluster_ids, is_leader
+
+
+def cluster_representatives(alerts, distance_m=CLUSTER_DISTANCE_M, time_window_hours=CLUSTER_TIME_WINDOW_HOURS):
+    """
+    Agrega cluster_id a las alertas y devuelve (alerts, representatives): una
+    fila por cluster (la alerta líder) con la cantidad de alertas que cubre.
+    """
+    alerts = alerts.reset_index(drop=True).copy()
+    cluster_ids, is_leader = cluster_alerts(alerts, distance_m, time_window_hours)
+    alerts["cluster_id"] = cluster_ids
+
+    representatives = alerts[is_leader].copy()
+    representatives["cluster_size"] = representatives["cluster_id"].map(alerts["cluster_id"].value_counts())
+
+    print(f"Clustered {len(alerts)} alerts into {len(representatives)} image requests "
+          f"(distance={distance_m:g} m, window={time_window_hours:g} h)")
+
+    return alerts, representatives
+
+
+def fan_out_predictions(alerts_clusters_csv, predictions_csv, output_csv):
+    """Copia la predicción de cada imagen representante a todas las alertas de su cluster."""
+    alerts = pd.read_csv(alerts_clusters_csv)
+    # confidence ya es una columna de FIRMS
+    predictions = pd.read_csv(predictions_csv).rename(
+        columns={"filename": "image_name", "confidence": "prediction_confidence"}
+    )
+
+    alerts = alerts.merge(predictions, on="image_name", how="left")
+    alerts.to_csv(output_csv, index=False)
+
+    fire = int((alerts["prediction"] == "Fire").sum())
+    print(f"Predictions fanned out to {len(alerts)} alerts ({fire} Fire): {output_csv}")
+
+    return output_csv
+
+
+def test():
+    # Dos focos densos (grilla de píxeles VIIRS de 375 m) y un tercero en otra pasada
+    rng = np.random.default_rng(0)
+    lat = np.concatenate([-32.5 + rng.uniform(0, 0.005, 30), -33.4 + rng.uniform(0, 0.005, 20), [-32.5]])
+    lon = np.concatenate([-55.1 + rng.uniform(0, 0.005, 30), -54.2 + rng.uniform(0, 0.005, 20), [-55.1]])
+    alerts = pd.DataFrame({
+        "latitude": lat,
+        "longitude": lon,
+        "acq_date": ["2025-01-10"] * 50 + ["2025-01-11"],
+        "acq_time": [1705] * 50 + [524],
+    })
+
+    alerts, representatives = cluster_representatives(alerts)
+
+    x, y = project_meters(alerts["latitude"], alerts["longitude"])
+    leaders = representatives.set_index("cluster_id").index
+    for i, cid in enumerate(alerts["cluster_id"]):
+        j = representatives.index[leaders.get_loc(cid)]
+        assert np.hypot(x[i] - x[j], y[i] - y[j]) <= CLUSTER_DISTANCE_M
+
+    print(representatives[["latitude", "longitude", "acq_date", "acq_time", "cluster_size"]])
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,380 @@
+import os
+import base64
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import count, span
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# Transferencias simultáneas (y tamaño del pool de conexiones del cliente)
+GCS_TRANSFER_WORKERS = int(os.getenv("GCS_TRANSFER_WORKERS", "16"))
+
+# Archivos más grandes que esto se suben en partes en paralelo (XML multipart)
+GCS_CHUNKED_UPLOAD_MB = int(os.getenv("GCS_CHUNKED_UPLOAD_MB", "100"))
+GCS_CHUNK_SIZE_MB = int(os.getenv("GCS_CHUNK_SIZE_MB", "32"))
+
+# Si está definido, gs://bucket/obj se lee y escribe en GCS_LOCAL_ROOT/bucket/obj
+# en lugar de Cloud Storage (pruebas sin credenciales)
+GCS_LOCAL_ROOT = os.getenv("GCS_LOCAL_ROOT")
+
+
+def parse_gcs_path(gcs_path):
+    """gs://bucket/a/b -> ("bucket", "a/b")."""
+    if not gcs_path.startswith("gs://"):
+        raise ValueError(f"Not a GCS path: {gcs_path}")
+    bucket, _, name = gcs_path[len("gs://"):].partition("/")
+    return bucket, name
+
+
+def local_md5(path):
+    """MD5 en base64, el mismo formato que Blob.md5_hash."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode("ascii")
+
+
+def local_crc32c(path):
+    """CRC32C en base64 (formato de Blob.crc32c), o None si no está google-crc32c."""
+    try:
+        import google_crc32c
+    except ImportError:
+        return None
+
+    crc = google_crc32c.Checksum()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc.update(chunk)
+    return base64.b64encode(crc.digest()).decode("ascii")
+
+
+def is_same_object(local_path, info):
+    """
+    Compara un archivo local con la metadata de un objeto ({"size", "md5",
+    "crc32c"}). Los objetos compuestos (subidas en partes) no tienen MD5: ahí
+    se usa CRC32C. Sin ningún hash para comparar se considera distinto (el
+    mismo tamaño no alcanza) y se vuelve a transferir.
+    """
+    if info is None or not os.path.exists(local_path) or os.path.getsize(local_path) != info["size"]:
+        return False
+    if info.get("md5"):
+        return info["md5"] == local_md5(local_path)
+    if not info.get("crc32c"):
+        return False
+    return local_crc32c(local_path) == info["crc32c"]
+
+
+def blob_info(blob):
+    return {"size": blob.size, "md5": blob.md5_hash, "crc32c": blob.crc32c}
+
+
+class GCSBackend:
+    """Cloud Storage con un cliente compartido por todos los hilos."""
+
+    def __init__(self, workers=GCS_TRANSFER_WORKERS):
+        from google.cloud import storage
+        from google.cloud.storage import transfer_manager
+        from requests.adapters import HTTPAdapter
+
+        self.transfer_manager = transfer_manager
+        self.client = storage.Client()
+
+        # Pool del tamaño de la concurrencia para no reabrir conexiones
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.client._http.mount("https://", adapter)
+
+    def list(self, bucket, prefix):
+        """{nombre: metadata} de los objetos bajo prefix."""
+        return {blob.name: blob_info(blob) for blob in self.client.list_blobs(bucket, prefix=prefix)}
+
+    def stat(self, bucket, names, workers=GCS_TRANSFER_WORKERS):
+        """{nombre: metadata} de los objetos existentes entre names (un GET de metadata por nombre)."""
+        bucket = self.client.bucket(bucket)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            blobs = list(executor.map(bucket.get_blob, names))
+        return {blob.name: blob_info(blob) for blob in blobs if blob is not None}
+
+    def upload(self, local_path, bucket, name):
+        blob = self.client.bucket(bucket).blob(name)
+        if os.path.getsize(local_path) > GCS_CHUNKED_UPLOAD_MB * 1024 ** 2:
+            self.transfer_manager.upload_chunks_concurrently(
+                local_path, blob, chunk_size=GCS_CHUNK_SIZE_MB * 1024 ** 2, max_workers=4
+            )
+        else:
+            blob.upload_from_filename(local_path)
+
+    def download(self, bucket, name, local_path):
+        self.client.bucket(bucket).blob(name).download_to_filename(local_path)
+
+
+class LocalBackend:
+    """Mismo contrato que GCSBackend sobre un directorio local (root/bucket/objeto)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, name):
+        return os.path.join(self.root, bucket, *name.split("/"))
+
+    def _info(self, path):
+        return {"size": os.path.getsize(path), "md5": local_md5(path), "crc32c": None}
+
+    def list(self, bucket, prefix):
+        objects = {}
+        bucket_dir = os.path.join(self.root, bucket)
+        # Solo se recorre el directorio que contiene al prefijo
+        start = os.path.join(bucket_dir, *prefix.split("/")[:-1])
+        for dirpath, _, filenames in os.walk(start):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, bucket_dir).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    objects[name] = self._info(path)
+        return objects
+
+    def stat(self, bucket, names):
+        paths = {name: self._path(bucket, name) for name in names}
+        return {name: self._info(path) for name, path in paths.items() if os.path.isfile(path)}
+
+    def upload(self, local_path, bucket, name):
+        path = self._path(bucket, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(local_path, path)
+
+    def download(self, bucket, name, local_path):
+        shutil.copyfile(self._path(bucket, name), local_path)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+
+    with _backend_lock:
+        if _backend is None:
+            _backend = LocalBackend(GCS_LOCAL_ROOT) if GCS_LOCAL_ROOT else GCSBackend()
+        return _backend
+
+
+def expand_local_paths(local_paths):
+    """
+    Archivos y directorios -> [(archivo, nombre relativo, directorio)], como
+    gsutil cp -r. directorio es el nombre relativo del directorio subido, o
+    None para archivos sueltos.
+    """
+    files = []
+    for local_path in local_paths:
+        local_path = local_path.rstrip("/")
+        if os.path.isdir(local_path):
+            base = os.path.dirname(local_path)
+            for dirpath, _, filenames in os.walk(local_path):
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    files.append((path, os.path.relpath(path, base).replace(os.sep, "/"), os.path.basename(local_path)))
+        else:
+            files.append((local_path, os.path.basename(local_path), None))
+    return files
+
+
+class TransferError(RuntimeError):
+    """Algunos archivos no se pudieron transferir; failed = [(archivo u objeto, error)]."""
+
+    def __init__(self, stage, failed):
+        self.failed = failed
+        super().__init__(f"{stage}: {len(failed)} files failed, first: {failed[0][0]} ({failed[0][1]})")
+
+
+def run_transfers(transfers, workers, stage):
+    """Ejecuta (función, args, archivo local) en paralelo; devuelve [(args[0], error)] de los que fallaron."""
+    def run(fn, args, local_path):
+        with span(stage):
+            fn(*args)
+        count(f"{stage}_files")
+        count(f"{stage}_bytes", os.path.getsize(local_path))
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [(executor.submit(run, fn, args, local_path), args) for fn, args, local_path in transfers]
+        for future, args in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed.append((args[0], e))
+                count(f"{stage}_errors")
+                print(f"Error transferring {args[0]}: {e}")
+    return failed
+
+
+def remote_objects(backend, bucket, prefix, files):
+    """
+    Metadata de los destinos de files: un listado por directorio subido (el
+    prefijo de esa corrida, no todo gcs_dir) y un stat por archivo suelto.
+    """
+    remote = {}
+    for directory in sorted({directory for _, _, directory in files if directory is not None}):
+        remote.update(backend.list(bucket, f"{prefix}{directory}/"))
+
+    singles = [prefix + relative for _, relative, directory in files if directory is None]
+    if singles:
+        remote.update(backend.stat(bucket, singles))
+
+    return remote
+
+
+def upload_paths(local_paths, gcs_dir, backend=None, workers=GCS_TRANSFER_WORKERS):
+    """
+    Sube archivos y directorios (recursivos) bajo gcs_dir en una sola
+    operación: se consulta la metadata de los destinos, se saltean los
+    objetos iguales y el resto se sube en paralelo. Devuelve los gs:// subidos
+    o ya al día; si alguno falla levanta TransferError al terminar.
+    """
+    backend = backend or get_backend()
+    bucket, prefix = parse_gcs_path(gcs_dir.rstrip("/") + "/")
+
+    files = expand_local_paths(local_paths)
+    remote = remote_objects(backend, bucket, prefix, files)
+
+    transfers = []
+    skipped = 0
+    for path, relative, _ in files:
+        name = prefix + relative
+        if is_same_object(path, remote.get(name)):
+            skipped += 1
+            continue
+        transfers.append((backend.upload, (path, bucket, name), path))
+
+    failed = run_transfers(transfers, workers, "gcs_upload")
+
+    print(f"Uploaded {len(transfers) - len(failed)} files to gs://{bucket}/{prefix} ({skipped} unchanged, {len(failed)} errors)")
+
+    if failed:
+        raise TransferError("gcs_upload", failed)
+
+    return [f"gs://{bucket}/{prefix}{relative}" for _, relative, _ in files]
+
+
+def download_paths(gcs_paths, local_dir, backend=None, workers=GCS_TRANSFER_WORKERS):
+    """
+    Baja objetos o prefijos (recursivos) a local_dir, salteando los archivos
+    locales iguales. Devuelve los paths locales; si alguno falla, o si un
+    objeto o prefijo pedido no existe, levanta TransferError al terminar.
+    """
+    backend = backend or get_backend()
+    os.makedirs(local_dir, exist_ok=True)
+
+    transfers = []
+    local_paths = []
+    missing = []
+    skipped = 0
+
+    for gcs_path in gcs_paths:
+        bucket, name = parse_gcs_path(gcs_path.rstrip("/"))
+        base = name.rsplit("/", 1)[0] + "/" if "/" in name else ""
+
+        found = False
+        for object_name, info in backend.list(bucket, name).items():
+            # Solo el objeto exacto o lo que está debajo de él como "directorio"
+            if object_name != name and not object_name.startswith(name + "/"):
+                continue
+            found = True
+
+            local_path = os.path.join(local_dir, *object_name[len(base):].split("/"))
+            local_paths.append(local_path)
+
+            if is_same_object(local_path, info):
+                skipped += 1
+                continue
+
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            transfers.append((backend.download, (bucket, object_name, local_path), local_path))
+
+        if not found:
+            missing.append((gcs_path, FileNotFoundError(f"No such object or prefix: {gcs_path}")))
+            count("gcs_download_errors")
+            print(f"Error transferring {gcs_path}: not found")
+
+    failed = missing + run_transfers(transfers, workers, "gcs_download")
+
+    print(f"Downloaded {len(transfers) - len(failed) + len(missing)} files to {local_dir} ({skipped} unchanged, {len(failed)} errors)")
+
+    if failed:
+        raise TransferError("gcs_download", failed)
+
+    return local_paths
+
+
+def test():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = LocalBackend(os.path.join(tmp, "gcs"))
+
+        run_dir = os.path.join(tmp, "run_20250101")
+        os.makedirs(os.path.join(run_dir, "sub"))
+        for i in range(50):
+            with open(os.path.join(run_dir, f"tile_{i}.png"), "wb") as f:
+                f.write(os.urandom(1024))
+        with open(os.path.join(run_dir, "sub", "predictions.csv"), "w") as f:
+            f.write("filename,prediction\n")
+
+        uploaded = upload_paths([run_dir], "gs://bucket/tiles", backend)
+        assert len(uploaded) == 51
+        # Segunda subida: todo al día
+        upload_paths([run_dir], "gs://bucket/tiles", backend)
+
+        local = download_paths(["gs://bucket/tiles/run_20250101"], os.path.join(tmp, "out"), backend)
+        assert len(local) == 51
+        assert local_md5(os.path.join(tmp, "out", "run_20250101", "sub", "predictions.csv")) == \
+            local_md5(os.path.join(run_dir, "sub", "predictions.csv"))
+
+        # Archivos sueltos: stat de los nombres exactos, sin listar el prefijo
+        listed = []
+        backend_list = backend.list
+        backend.list = lambda bucket, prefix: listed.append(prefix) or backend_list(bucket, prefix)
+        single = os.path.join(run_dir, "tile_0.png")
+        upload_paths([single], "gs://bucket/tiles/run_20250101", backend)
+        assert listed == []
+        backend.list = backend_list
+
+        # Objeto compuesto (sin MD5): se compara por CRC32C; sin hash se vuelve a transferir
+        info = dict(backend.stat("bucket", ["tiles/run_20250101/tile_0.png"])["tiles/run_20250101/tile_0.png"], md5=None)
+        assert not is_same_object(single, info)
+        crc32c = local_crc32c(single)
+        if crc32c is not None:
+            assert is_same_object(single, dict(info, crc32c=crc32c))
+            assert not is_same_object(single, dict(info, crc32c=local_crc32c(os.path.join(run_dir, "tile_1.png"))))
+
+        # Un objeto pedido que no existe es un error, no 0 descargas
+        try:
+            download_paths(["gs://bucket/tiles/run_20250101/tile_0.png", "gs://bucket/tiles/missing.tif"],
+                           os.path.join(tmp, "out"), backend)
+            raise AssertionError("missing objects should raise TransferError")
+        except TransferError as e:
+            assert [path for path, _ in e.failed] == ["gs://bucket/tiles/missing.tif"]
+
+        # Los errores por archivo no se tragan
+        backend_upload = backend.upload
+        def upload(local_path, bucket, name):
+            if local_path.endswith("tile_1.png"):
+                raise OSError("boom")
+            backend_upload(local_path, bucket, name)
+        backend.upload = upload
+        with open(os.path.join(run_dir, "tile_1.png"), "wb") as f:
+            f.write(os.urandom(1024))
+        try:
+            upload_paths([run_dir], "gs://bucket/tiles", backend)
+            raise AssertionError("upload errors should raise TransferError")
+        except TransferError as e:
+            assert [path for path, _ in e.failed] == [os.path.join(run_dir, "tile_1.png")]
+
+
+if __name__ == "__main__":
+    test()
@@ -1,11 +1,12 @@
 import os
 import ee
 import datetime
-import requests
 from dotenv import load_dotenv
-from utils import wait_for_task
+from utils import get_info_paged, wait_for_task, move_data_from_local_to_gcs
+from downloader import download_all
+from thumb_cache import get_thumb_cache, thumb_cache_key
+from functools import partial
 from datetime import timezone
-import subprocess
 
 ee.Authenticate()
 ee.Initialize(project="cellular-retina-276416")
@@ -18,23 +19,48 @@ BUCKET_NAME = os.getenv("BUCKET_NAME")
 
 SATELLITE_LIST=["landsat-8", "sentinel-2", "aqua"]
 
-def download_image_from_coordinates(lat, lon, firms_datetime, output_dir, satellite="sentinel-2", format="PNG", copy_to_gcs=True, time_widnow_hours=10):
-    point = ee.Geometry.Point([lon, lat])
+# satellite -> (colección, buffer en metros, escala)
+SATELLITE_PARAMS = {
+    "landsat-8": ("LANDSAT/LC08/C02/T1_L2", 3000, 30),
+    "sentinel-2": ("COPERNICUS/S2_SR_HARMONIZED", 2000, 10),
+    "aqua": ("MODIS/061/MYD09GA", 5000, 500),
+    "fengyun": ("CMA/FY4A/AGRI/L1", 5000, 1000),
+}
 
+def satellite_params(satellite):
+    if satellite not in SATELLITE_PARAMS:
+        raise ValueError(f"Satellite not supported: {satellite}")
+    return SATELLITE_PARAMS[satellite]
+
+def rgb_image(image, satellite):
+    """Bandas RGB (y escala en Landsat) de la imagen; devuelve (image, bands)."""
     if satellite == "landsat-8":
-        buffer_m = 3000
-        scale = 30
+        bands = ['SR_B4', 'SR_B3', 'SR_B2']
+        image = image.select(bands).multiply(0.0000275).add(-0.2)
     elif satellite == "sentinel-2":
-        buffer_m = 2000
-        scale = 10
+        bands = ['B4', 'B3', 'B2']
+        image = image.select(bands)
     elif satellite == "aqua":
-        buffer_m = 5000
-        scale = 500
+        bands = ['sur_refl_b01','sur_refl_b04','sur_refl_b03']
+        image = image.select(bands)
     elif satellite == "fengyun":
-        buffer_m = 5000
-        scale = 1000
-    else:
-        raise ValueError(f"Satellite not supported: {satellite}")
+        bands = ['Channel0001','Channel0002','Channel0003']
+        image = image.select(bands)
+
+    return image, bands
+
+def alert_cache_key(image_id, lat, lon, satellite, bands):
+    _, buffer_m, scale = satellite_params(satellite)
+    return thumb_cache_key(
+        image_id, [lon, lat, lon, lat],
+        satellite=satellite, buffer_m=buffer_m, scale=scale, bands=bands, min=0, max=3000, format="png"
+    )
+
+def select_image_from_coordinates(lat, lon, firms_datetime, satellite="sentinel-2", time_widnow_hours=10):
+    """Busca la imagen para la alerta; devuelve (image, bands, region, scale, prefix, cache_key) o None."""
+    point = ee.Geometry.Point([lon, lat])
+
+    _, buffer_m, scale = satellite_params(satellite)
 
     region = point.buffer(buffer_m).bounds()
 
@@ -55,23 +81,142 @@ def download_image_from_coordinates(lat, lon, firms_datetime, output_dir, satell
 
     image = ee.Image(collection.first())
 
-    if satellite == "landsat-8":
-        bands = ['SR_B4', 'SR_B3', 'SR_B2']
-        image = image.select(bands).multiply(0.0000275).add(-0.2)
-    elif satellite == "sentinel-2":
-        bands = ['B4', 'B3', 'B2']
-        image = image.select(bands)
-    elif satellite == "aqua":
-        bands = ['sur_refl_b01','sur_refl_b04','sur_refl_b03']
-        image = image.select(bands)
-    elif satellite == "fengyun":
-        bands = ['Channel0001','Channel0002','Channel0003']
-        image = image.select(bands)
+    # Fecha e id en un solo round trip; el id es parte de la clave del thumb_cache
+    image_info = ee.Dictionary({
+        "time": ee.Date(image.get('system:time_start')).format('YYYYMMdd_HHmmss'),
+        "id": image.get('system:id'),
+    }).getInfo()
+
+    image, bands = rgb_image(image, satellite)
+
+    image_time = image_info["time"]
 
-    image_time = ee.Date(image.get('system:time_start')).format('YYYYMMdd_HHmmss').getInfo()
+    prefix = f"wildfire_rgb_{satellite}_{lat}_{lon}_{image_time}"
+
+    cache_key = alert_cache_key(image_info["id"], lat, lon, satellite, bands)
+
+    return image, bands, region, scale, prefix, cache_key
+
+
+def earliest_image_feature(collection_id, time_window_hours):
+    """Función server-side: alerta -> Feature con la primera imagen dentro de su ventana."""
+    def fn(feature):
+        alert_time = ee.Date(feature.get("alert_time"))
+        first = (
+            ee.ImageCollection(collection_id)
+            .filterBounds(feature.geometry())
+            .filterDate(alert_time.advance(-time_window_hours, "hour"), alert_time.advance(time_window_hours, "hour"))
+            .limit(1, "system:time_start")
+        )
+        return ee.Feature(None, {
+            "alert_index": feature.get("alert_index"),
+            "image_index": first.aggregate_array("system:index"),
+            "time_start": first.aggregate_array("system:time_start"),
+        })
+
+    return fn
+
+
+def resolve_images_for_alerts(alerts, satellite="sentinel-2", time_widnow_hours=10):
+    """
+    Versión en lote de select_image_from_coordinates: elige la misma imagen
+    (la primera de la ventana) para todas las alertas con un getInfo por
+    página. alerts necesita latitude, longitude y firms_datetime. Devuelve
+    una lista alineada con las filas: {"image_id", "time_start"} o None.
+    """
+    collection_id, _, _ = satellite_params(satellite)
+
+    features = []
+    for i, (lat, lon, firms_datetime) in enumerate(zip(alerts["latitude"], alerts["longitude"], alerts["firms_datetime"])):
+        alert_dt = datetime.datetime.strptime(firms_datetime, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+        features.append(ee.Feature(ee.Geometry.Point([float(lon), float(lat)]), {
+            "alert_index": i,
+            "alert_time": int(alert_dt.timestamp() * 1000),
+        }))
+
+    print(f"Resolving {satellite} images for {len(features)} alerts...")
+    results = get_info_paged(features, earliest_image_feature(collection_id, time_widnow_hours))
+
+    images = [None] * len(features)
+    for props in results:
+        if props.get("image_index"):
+            images[int(props["alert_index"])] = {
+                "image_id": f"{collection_id}/{props['image_index'][0]}",
+                "time_start": props["time_start"][0],
+            }
+
+    print(f"Alerts with images: {sum(image is not None for image in images)} / {len(features)}")
+
+    return images
+
+
+def alert_png_url(image_id, lat, lon, satellite="sentinel-2"):
+    _, buffer_m, scale = satellite_params(satellite)
+    image, bands = rgb_image(ee.Image(image_id), satellite)
+    region = ee.Geometry.Point([lon, lat]).buffer(buffer_m).bounds()
+    return png_thumb_url(image, bands, region, scale)
 
+
+def png_download_for_image(lat, lon, image_meta, output_dir, satellite="sentinel-2"):
+    """
+    Job del downloader para una imagen ya resuelta (resolve_images_for_alerts):
+    mismo nombre de archivo y clave de cache que resolve_png_download.
+    """
+    _, bands = rgb_image(ee.Image(image_meta["image_id"]), satellite)
+
+    image_time = datetime.datetime.fromtimestamp(image_meta["time_start"] / 1000, tz=timezone.utc).strftime("%Y%m%d_%H%M%S")
     prefix = f"wildfire_rgb_{satellite}_{lat}_{lon}_{image_time}"
 
+    return {
+        "url": partial(alert_png_url, image_meta["image_id"], lat, lon, satellite),
+        "path": f"{output_dir}/{prefix}.png",
+        "cache_key": alert_cache_key(image_meta["image_id"], lat, lon, satellite, bands),
+    }
+
+
+def png_thumb_url(image, bands, region, scale):
+    return image.visualize(
+        bands=bands,
+        min=0,
+        max=3000
+    ).getThumbURL({
+        "region": region,
+        "scale": scale,
+        "crs": "EPSG:4326",
+        "format": "png"
+    })
+
+
+def resolve_png_download(lat, lon, firms_datetime, output_dir, satellite="sentinel-2", time_widnow_hours=10):
+    """
+    Parte Earth Engine de la descarga PNG para downloader.py; devuelve
+    (png_url, png_local_path, cache_key) o None. La URL se genera solo si el
+    thumbnail no está en el cache.
+    """
+    selected = select_image_from_coordinates(lat, lon, firms_datetime, satellite, time_widnow_hours)
+    if selected is None:
+        return None
+
+    image, bands, region, scale, prefix, cache_key = selected
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    return partial(png_thumb_url, image, bands, region, scale), f"{output_dir}/{prefix}.png", cache_key
+
+
+def copy_png_to_gcs(png_local_paths):
+    """Sube uno o varios PNG a gs://BUCKET_NAME/firms_alerts/ en una sola operación."""
+    gcs_dir = f"gs://{BUCKET_NAME}/firms_alerts/"
+    return move_data_from_local_to_gcs(png_local_paths, gcs_dir)
+
+
+def download_image_from_coordinates(lat, lon, firms_datetime, output_dir, satellite="sentinel-2", format="PNG", copy_to_gcs=True, time_widnow_hours=10):
+    selected = select_image_from_coordinates(lat, lon, firms_datetime, satellite, time_widnow_hours)
+    if selected is None:
+        return None
+
+    image, bands, region, scale, prefix, cache_key = selected
+
     if format.lower() == "tiff":
 
         task = ee.batch.Export.image.toCloudStorage(
@@ -102,41 +247,25 @@ def download_image_from_coordinates(lat, lon, firms_datetime, output_dir, satell
 
     elif format.lower() == "png":
 
-        png_url = image.visualize(
-            bands=bands,
-            min=0,
-            max=3000
-        ).getThumbURL({
-            "region": region,
-            "scale": scale,
-            "crs": "EPSG:4326",
-            "format": "png"
-        })
-
-        print("Downloading PNG from:")
-        print(png_url)
+        print("Downloading PNG:", prefix)
 
         os.makedirs(output_dir, exist_ok=True)
         png_local_path = f"{output_dir}/{prefix}.png"
 
-        r = requests.get(png_url)
-        r.raise_for_status()
-        with open(png_local_path, "wb") as f:
-            f.write(r.content)
+        job = {
+            "key": prefix,
+            "url": partial(png_thumb_url, image, bands, region, scale),
+            "path": png_local_path,
+            "cache_key": cache_key,
+        }
+        result = download_all([job], cache=get_thumb_cache())[0]
+        if result["error"]:
+            raise RuntimeError(f"Error downloading {prefix}: {result['error']}")
 
         print("PNG saved locally as:", png_local_path)
 
         if copy_to_gcs:
-            gcs_dir = f"gs://{BUCKET_NAME}/firms_alerts/"
-
-            cmd = ["gsutil", "cp", png_local_path, gcs_dir]
-            print("Running command: ", " ".join(cmd))
-            gcs_path = gcs_dir + png_local_path
-            try:
-                subprocess.run(cmd, check=True, shell=True)
-                print(f"File uploaded: {gcs_path}")
-            except subprocess.CalledProcessError as e:
-                print(f"Error uploading {gcs_path}: {e}")
+            copy_png_to_gcs(png_local_path)
 
         return png_local_path
 
@@ -1,14 +1,27 @@
 import re
 import os
+import sys
 import csv
+import io
+import queue
 import torch
 import shutil
+import hashlib
 import argparse
+import threading
 import numpy as np
 from PIL import Image
 from tqdm import tqdm
 from datetime import datetime
-from transformers import AutoModelForImageClassification, AutoImageProcessor
+from concurrent.futures import ThreadPoolExecutor
+from preprocessing import BatchPreprocessor
+from inference_client import InferenceClient
+from inference_engines import ENGINES, load_engine
+from inference_autotune import autotune, load_tuned_config
+from inference_journal import InferenceJournal, journal_path
+from instrumentation import count, span
+from torch.utils.data import Dataset, DataLoader
+from transformers import AutoModelForImageClassification
 
 
 # =========================
@@ -22,16 +35,49 @@ MODEL_PATH = "./models/efficientnet"
 
 date_now = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
 
-OUTPUT_FIRE_IMAGES_DIR = f"{DATA_DIR}/predictions_fire_images_{date_now}"
+# Identificador de la corrida: por defecto se deriva de las imágenes, el
+# modelo y el engine (default_run_id), así que relanzar la misma corrida
+# después de una caída escribe en el mismo directorio y retoma desde su
+# journal (ver inference_journal.py). INFERENCE_RUN_ID o --run_id lo fijan.
+RUN_ID = os.getenv("INFERENCE_RUN_ID")
 
-CSV_PATH = f"{OUTPUT_FIRE_IMAGES_DIR}/predictions_{date_now}.csv"
-CSV_FIRE_PATH = f"{OUTPUT_FIRE_IMAGES_DIR}/predictions_fire_only_{date_now}.csv"
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-os.makedirs(OUTPUT_FIRE_IMAGES_DIR, exist_ok=True)
+# fp32 | int8 | bf16 | compile | torchscript | onnx (ver inference_engines.py)
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "fp32")
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Configuración medida en esta máquina con `python inference.py --benchmark`
+# (ver inference_autotune.py) para cada engine; las variables de entorno
+# tienen prioridad. Se resuelve con el engine que se usa (inference_settings)
+
+
+def inference_settings(engine=INFERENCE_ENGINE):
+    """
+    Batch size, threads y workers para engine: variables de entorno, si no lo
+    medido por el autotune para ese engine, si no los defaults de la máquina.
+    """
+    tuned = load_tuned_config(MODEL_PATH, engine)
+    cpus = os.cpu_count() or 2
+
+    return {
+        "batch_size": int(os.getenv("INFERENCE_BATCH_SIZE", tuned.get("batch_size", 8 if DEVICE == "cpu" else 32))),
+        # Threads de torch dentro de cada operación y entre operaciones (0 = default de torch)
+        "intra_op_threads": int(os.getenv("INFERENCE_THREADS", tuned.get("intra_op_threads", max(1, cpus // 2)))),
+        "interop_threads": int(os.getenv("INFERENCE_INTEROP_THREADS", tuned.get("interop_threads", 0))),
+        # Procesos que decodifican y preprocesan el siguiente batch mientras el
+        # modelo procesa el actual (0 = todo en el hilo principal)
+        "num_workers": int(os.getenv("NUM_WORKERS", tuned.get("num_workers", max(1, cpus // 4)))),
+    }
 
-BATCH_SIZE = 8 if DEVICE == "cpu" else 32
+
+# Batches preparados por adelantado por cada worker
+PREFETCH_BATCHES = int(os.getenv("PREFETCH_BATCHES", "2"))
+
+# Hilos que decodifican imágenes recibidas en memoria (inference_stream)
+DECODE_THREADS = int(os.getenv("DECODE_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# URL de un inference_server.py con el modelo ya cargado (ej. http://127.0.0.1:8765)
+INFERENCE_SERVER_URL = os.getenv("INFERENCE_SERVER_URL")
 
 FIELDNAMES = [
     "filename",
@@ -41,16 +87,34 @@ FIELDNAMES = [
     "prob_no_fire",
 ]
 
+IMAGES_DIR = f"{DATA_DIR}/uruguay_tiles"
+ENGINE = INFERENCE_ENGINE
+
 parser = argparse.ArgumentParser(description="Run fire classification on images.")
 parser.add_argument(
     "--images_dir",
     type=str,
-    default=f"{DATA_DIR}/uruguay_tiles",
+    default=IMAGES_DIR,
     help="Path to the directory containing images to process (default: ./data/uruguay_tiles)"
 )
-args = parser.parse_args()
-
-IMAGES_DIR = args.images_dir
+parser.add_argument(
+    "--engine",
+    type=str,
+    default=ENGINE,
+    choices=ENGINES,
+    help="Inference engine (default: INFERENCE_ENGINE env var or fp32)"
+)
+parser.add_argument(
+    "--run_id",
+    type=str,
+    default=None,
+    help="Run identifier; rerunning with the same id resumes it (default: INFERENCE_RUN_ID env var or a hash of the images, model and engine)"
+)
+parser.add_argument(
+    "--benchmark",
+    action="store_true",
+    help="Sweep batch size, threads and loader workers on synthetic images and save the fastest configuration for this machine"
+)
 
 # =========================
 # UTILIDADES
@@ -68,144 +132,451 @@ def extract_number(s):
     return int(m.group(1)) if m else float("inf")
 
 
-def chunks(lst, n):
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+class ImageFolderDataset(Dataset):
+    """Decodifica y redimensiona imágenes de un directorio; se ejecuta en los workers del DataLoader."""
 
+    def __init__(self, images_dir, image_files, preprocessor):
+        self.images_dir = images_dir
+        self.image_files = image_files
+        self.preprocessor = preprocessor
+
+    def __len__(self):
+        return len(self.image_files)
+
+    def __getitem__(self, idx):
+        fname = self.image_files[idx]
+        img_path = os.path.join(self.images_dir, fname)
+        try:
+            with Image.open(img_path) as img:
+                return fname, self.preprocessor.resize(img)
+        except Exception as e:
+            print(f"Skipping {fname}: {e}")
+            return fname, None
+
+
+def collate_uint8(items):
+    """Apila el batch como uint8 (N, H, W, 3); la normalización se hace en el proceso principal."""
+    valid_fnames = [fname for fname, arr in items if arr is not None]
+    arrays = [arr for _, arr in items if arr is not None]
+
+    if not arrays:
+        return valid_fnames, None
+
+    return valid_fnames, torch.from_numpy(np.stack(arrays))
+
+
+def make_loader(images_dir, image_files, preprocessor, batch_size, num_workers):
+    return DataLoader(
+        ImageFolderDataset(images_dir, image_files, preprocessor),
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        collate_fn=collate_uint8,
+        prefetch_factor=PREFETCH_BATCHES if num_workers > 0 else None,
+        pin_memory=DEVICE == "cuda",
+    )
+
+
+def default_run_id(images_dir, engine=ENGINE, model_path=None):
+    """
+    Id estable de una corrida: hash del directorio resuelto, de los nombres,
+    tamaños y fechas de sus imágenes, del modelo y del engine. El mismo
+    directorio sin cambios da el mismo id; imágenes nuevas dan otro.
+    """
+    images_dir = os.path.realpath(images_dir)
+    digest = hashlib.sha1()
+    digest.update(f"{images_dir}|{os.path.realpath(model_path or MODEL_PATH)}|{engine}".encode("utf-8"))
+
+    for fname in list_images(images_dir):
+        stat = os.stat(os.path.join(images_dir, fname))
+        digest.update(f"|{fname}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+
+    return f"{os.path.basename(images_dir)}_{digest.hexdigest()[:12]}"
 
-def inference(images_dir=IMAGES_DIR):
-    # =========================
-    # INICIALIZACIÓN
-    # =========================
 
-    init_csv(CSV_PATH)
+def run_paths(run_id):
+    """Directorio de salida, CSVs y journal de una corrida."""
+    output_dir = f"{DATA_DIR}/predictions_fire_images_{run_id}"
+
+    return {
+        "output_dir": output_dir,
+        "csv": f"{output_dir}/predictions_{run_id}.csv",
+        "csv_fire": f"{output_dir}/predictions_fire_only_{run_id}.csv",
+        "journal": journal_path(run_id),
+    }
+
+
+def write_fire_only_csv(paths):
+    print("Generating Fire-only CSV...")
+
+    fire_rows = []
+
+    with open(paths["csv"], newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if row["prediction"] == "Fire":
+                fire_rows.append(row)
+
+    with open(paths["csv_fire"], mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for row in fire_rows:
+            writer.writerow(row)
+
+    print(f"Fire-only CSV written: {paths['csv_fire']}")
+    print(f"Total Fire detections: {len(fire_rows)}")
+
+    return fire_rows
+
+
+def set_threads(intra_op, interop=0):
+    torch.set_num_threads(intra_op)
+
+    # Solo se puede fijar una vez y antes del primer trabajo en paralelo
+    if interop:
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError:
+            pass
+
+
+def load_classifier(engine=ENGINE, threads=None):
+    """
+    Carga modelo, preprocesador y engine; devuelve (forward, preprocessor,
+    id2label, label2id). threads reemplaza a los intra_op_threads de
+    inference_settings(engine) (ej. shards fijados a un grupo de CPUs).
+    """
+    settings = inference_settings(engine)
 
     print("Loading model...")
     model = AutoModelForImageClassification.from_pretrained(MODEL_PATH)
-    processor = AutoImageProcessor.from_pretrained(MODEL_PATH)
+    preprocessor = BatchPreprocessor(MODEL_PATH, batch_size=settings["batch_size"])
 
     model.to(DEVICE)
     model.eval()
 
-    # Limitar threads (mejora estabilidad en CPU)
-    torch.set_num_threads(max(1, os.cpu_count() // 2))
+    set_threads(threads or settings["intra_op_threads"], settings["interop_threads"])
+
+    print(f"Inference engine: {engine}")
+    forward = load_engine(model, engine, MODEL_PATH, (preprocessor.height, preprocessor.width))
 
     id2label = model.config.id2label
     label2id = model.config.label2id
 
     print("Labels:", id2label)
 
-    # =========================
-    # LISTADO Y ORDEN DE IMÁGENES
-    # =========================
+    return forward, preprocessor, id2label, label2id
+
+
+def predict_rows(forward, preprocessor, fnames, batch, id2label, label2id):
+    """Batch uint8 (N, H, W, 3) -> filas del CSV de predicciones."""
+    with span("preprocess"):
+        pixel_values = preprocessor.normalize(batch).to(DEVICE, non_blocking=True)
+
+    with span("model_forward"), torch.no_grad():
+        logits = forward(pixel_values)
+        probs = torch.softmax(logits.float(), dim=-1).cpu().numpy()
+
+    count("images", len(fnames))
+
+    rows = []
+    for fname, p in zip(fnames, probs):
+        pred_idx = int(np.argmax(p))
+        pred_label = id2label[pred_idx]
 
+        rows.append({
+            "filename": fname,
+            "prediction": pred_label,
+            "confidence": float(p[pred_idx]),
+            "prob_fire": float(p[label2id["Fire"]]),
+            "prob_no_fire": float(p[label2id["No_Fire"]]),
+        })
+
+    return rows
+
+
+def local_predictions(images_dir, image_files, engine=ENGINE, threads=None, num_workers=None):
+    forward, preprocessor, id2label, label2id = load_classifier(engine, threads)
+
+    settings = inference_settings(engine)
+    if num_workers is None:
+        num_workers = settings["num_workers"]
+    loader = make_loader(images_dir, image_files, preprocessor, settings["batch_size"], num_workers)
+
+    # Tiempo que el modelo espera al DataLoader (decode + resize en los workers)
+    batches = iter(tqdm(loader, total=len(loader)))
+    while True:
+        with span("loader_wait"):
+            item = next(batches, None)
+        if item is None:
+            break
+
+        valid_fnames, batch = item
+        if batch is None:
+            continue
+
+        yield predict_rows(forward, preprocessor, valid_fnames, batch, id2label, label2id)
+
+
+def server_predictions(images_dir, image_files, client, chunk_size):
+    paths = [os.path.abspath(os.path.join(images_dir, f)) for f in image_files]
+    total = (len(paths) + chunk_size - 1) // chunk_size
+
+    for rows in tqdm(client.predict_many(paths, chunk_size=chunk_size), total=total):
+        yield rows
+
+
+def list_images(images_dir):
+    """Imágenes del directorio en orden numérico (el orden de las filas del CSV)."""
     image_files = [
         f for f in os.listdir(images_dir)
         if f.lower().endswith((".jpg", ".jpeg", ".png"))
     ]
 
-    image_files = sorted(image_files, key=lambda x: (extract_number(x), x))
+    return sorted(image_files, key=lambda x: (extract_number(x), x))
 
-    print(f"Found {len(image_files)} images (sorted numerically)")
 
+def make_predictions(images_dir, image_files, engine=ENGINE, server_url=INFERENCE_SERVER_URL, threads=None, num_workers=None):
+    """
+    Generador de filas por batch, con el inference_server si está levantado o
+    con el modelo local (threads y num_workers reemplazan a los de la configuración).
+    """
+    # Si hay un inference_server levantado se usa el modelo ya cargado en él
+    if server_url:
+        client = InferenceClient(server_url)
+        if client.available():
+            print(f"Using inference server at {server_url}")
+            return server_predictions(images_dir, image_files, client, inference_settings(engine)["batch_size"])
+        print(f"Inference server not available at {server_url}, loading model locally")
+
+    return local_predictions(images_dir, image_files, engine, threads, num_workers)
 
-    # =========================
-    # REANUDACIÓN (opcional)
-    # =========================
 
-    processed = set()
-    if os.path.exists(CSV_PATH):
-        with open(CSV_PATH, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                processed.add(row["filename"])
+def copy_fire_images(images_dir, paths):
+    """Escribe el CSV de Fire y copia esas imágenes al directorio de salida de la corrida."""
+    fire_rows = write_fire_only_csv(paths)
 
-    if processed:
-        image_files = [f for f in image_files if f not in processed]
-        print(f"Resuming: {len(image_files)} images remaining")
+    print("Copying Fire images to:", paths["output_dir"])
+
+    for row in fire_rows:
+        src_path = os.path.join(images_dir, row["filename"])
+        dst_path = os.path.join(paths["output_dir"], row["filename"])
+        try:
+            shutil.copy2(src_path, dst_path)
+        except Exception as e:
+            print(f"Failed to copy {row['filename']}: {e}")
+
+    print("Fire images copied successfully.")
 
 
+def record_predictions(journal, predictions):
+    for rows in predictions:
+        # Un batch = una transacción: persiste aunque el proceso se caiga después
+        with span("journal_write"):
+            journal.add_batch(rows)
+
+
+def inference(images_dir=IMAGES_DIR, engine=ENGINE, server_url=INFERENCE_SERVER_URL, run_id=RUN_ID):
+    """Clasifica images_dir; devuelve el directorio de salida (ver run_paths para los CSVs)."""
     # =========================
-    # INFERENCIA + CSV INCREMENTAL
+    # LISTADO Y ORDEN DE IMÁGENES
     # =========================
 
-    csv_file = open(CSV_PATH, mode="a", newline="", encoding="utf-8")
-    writer = csv.DictWriter(csv_file, fieldnames=FIELDNAMES)
+    image_files = list_images(images_dir)
 
-    for batch_files in tqdm(list(chunks(image_files, BATCH_SIZE))):
-        images = []
-        valid_fnames = []
+    print(f"Found {len(image_files)} images (sorted numerically)")
 
-        for fname in batch_files:
-            img_path = os.path.join(images_dir, fname)
-            try:
-                with Image.open(img_path) as img:
-                    images.append(img.convert("RGB"))
-                    valid_fnames.append(fname)
-            except Exception as e:
-                print(f"Skipping {fname}: {e}")
+    run_id = run_id or default_run_id(images_dir, engine)
+    paths = run_paths(run_id)
+    os.makedirs(paths["output_dir"], exist_ok=True)
 
-        if not images:
-            continue
+    print(f"Run id: {run_id}")
 
-        inputs = processor(images=images, return_tensors="pt")
-        inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
+    with InferenceJournal(paths["journal"]) as journal:
 
-        with torch.no_grad():
-            outputs = model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=-1).cpu().numpy()
+        # =========================
+        # REANUDACIÓN
+        # =========================
 
-        for fname, p in zip(valid_fnames, probs):
-            pred_idx = int(np.argmax(p))
-            pred_label = id2label[pred_idx]
+        pending = journal.pending(image_files)
 
-            writer.writerow({
-                "filename": fname,
-                "prediction": pred_label,
-                "confidence": float(p[pred_idx]),
-                "prob_fire": float(p[label2id["Fire"]]),
-                "prob_no_fire": float(p[label2id["No_Fire"]]),
-            })
+        if len(pending) < len(image_files):
+            print(f"Resuming run {run_id}: {len(pending)} images remaining")
 
-        # Persistir resultados aunque el proceso se caiga
-        csv_file.flush()
+        # =========================
+        # INFERENCIA + JOURNAL
+        # =========================
 
-    csv_file.close()
+        record_predictions(journal, make_predictions(images_dir, pending, engine, server_url))
 
-    print("Generating Fire-only CSV...")
+        # El CSV se genera completo desde el journal, en el orden del listado
+        with span("csv_export"):
+            journal.export_csv(paths["csv"], order=image_files, fieldnames=FIELDNAMES)
 
-    fire_rows = []
+    copy_fire_images(images_dir, paths)
 
-    with open(CSV_PATH, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row["prediction"] == "Fire":
-                fire_rows.append(row)
+    print("All done.")
 
-    with open(CSV_FIRE_PATH, mode="w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
-        writer.writeheader()
-        for row in fire_rows:
-            writer.writerow(row)
+    return paths["output_dir"]
 
-    print(f"Fire-only CSV written: {CSV_FIRE_PATH}")
-    print(f"Total Fire detections: {len(fire_rows)}")
 
-    print("Copying Fire images to:", OUTPUT_FIRE_IMAGES_DIR)
+def decode_bytes(preprocessor, fname, content):
+    with span("decode"), Image.open(io.BytesIO(content)) as img:
+        return preprocessor.resize(img)
 
-    for row in fire_rows:
-        src_path = os.path.join(images_dir, row["filename"])
-        dst_path = os.path.join(OUTPUT_FIRE_IMAGES_DIR, row["filename"])
+
+def inference_stream(items, engine=ENGINE, save_fire_images=True, run_id=RUN_ID):
+    """
+    Clasifica imágenes que llegan en memoria como (filename, bytes) a medida que
+    se descargan (ej. uruguay_tiles.stream_uruguay_tiles), sin escribir los
+    tiles a disco. Solo se guardan las imágenes clasificadas como Fire.
+
+    Sin directorio de imágenes no hay id que derivar: el llamador pasa un
+    run_id estable (ej. uruguay_tiles.scan_run_id) y relanzar con el mismo id
+    retoma la corrida.
+    """
+    if not run_id:
+        raise ValueError("inference_stream needs a run_id to journal and resume the run")
+    paths = run_paths(run_id)
+    os.makedirs(paths["output_dir"], exist_ok=True)
+
+    journal = InferenceJournal(paths["journal"])
+    if len(journal):
+        print(f"Resuming run {run_id}: {len(journal)} images already processed")
+
+    forward, preprocessor, id2label, label2id = load_classifier(engine)
+    batch_size = inference_settings(engine)["batch_size"]
+
+    # Cola acotada: si el modelo va más lento que la descarga, la descarga espera
+    decoded = queue.Queue(maxsize=batch_size * PREFETCH_BATCHES * 2)
+    feeder_errors = []
+
+    def feed(executor):
         try:
-            shutil.copy2(src_path, dst_path)
+            for fname, content in items:
+                if journal.is_done(fname):
+                    continue
+                future = executor.submit(decode_bytes, preprocessor, fname, content)
+                decoded.put((fname, content, future))
         except Exception as e:
-            print(f"Failed to copy {row['filename']}: {e}")
+            feeder_errors.append(e)
+        finally:
+            decoded.put(None)
+
+    def run_batch(batch_items):
+        fnames = [fname for fname, _, _ in batch_items]
+        batch = torch.from_numpy(np.stack([array for _, _, array in batch_items]))
+        rows = predict_rows(forward, preprocessor, fnames, batch, id2label, label2id)
+
+        if save_fire_images:
+            for (fname, content, _), row in zip(batch_items, rows):
+                if row["prediction"] == "Fire":
+                    with open(os.path.join(paths["output_dir"], fname), "wb") as f:
+                        f.write(content)
+
+        # Después de guardar las imágenes de Fire: si el proceso se cae antes, el batch se repite
+        with span("journal_write"):
+            journal.add_batch(rows)
+
+    with ThreadPoolExecutor(max_workers=DECODE_THREADS) as executor:
+        feeder = threading.Thread(target=feed, args=(executor,), daemon=True)
+        feeder.start()
+
+        batch_items = []
+        with tqdm(desc="Classifying streamed images") as pbar:
+            while True:
+                item = decoded.get()
+                if item is None:
+                    break
+
+                fname, content, future = item
+                try:
+                    batch_items.append((fname, content, future.result()))
+                except Exception as e:
+                    print(f"Skipping {fname}: {e}")
+                    continue
+
+                if len(batch_items) == batch_size:
+                    run_batch(batch_items)
+                    pbar.update(len(batch_items))
+                    batch_items = []
+
+            if batch_items:
+                run_batch(batch_items)
+                pbar.update(len(batch_items))
+
+        feeder.join()
+
+    if feeder_errors:
+        journal.close()
+        raise feeder_errors[0]
+
+    with span("csv_export"):
+        journal.export_csv(paths["csv"], fieldnames=FIELDNAMES)
+    journal.close()
+
+    write_fire_only_csv(paths)
 
-    print("Fire images copied successfully.")
     print("All done.")
 
-    return OUTPUT_FIRE_IMAGES_DIR
+    return paths["output_dir"]
+
+def test(n_images=12):
+    """Mata una corrida a mitad de camino y la relanza con el id por defecto: debe retomar."""
+    import time
+    import signal
+    import tempfile
+    import subprocess
+
+    with tempfile.TemporaryDirectory() as cwd:
+        # Mismo modelo, corrida aislada en un cwd temporal (data/ y journal propios)
+        os.makedirs(os.path.join(cwd, "models"))
+        os.symlink(os.path.abspath(MODEL_PATH), os.path.join(cwd, "models", "efficientnet"))
+
+        images_dir = os.path.join(cwd, "images")
+        os.makedirs(images_dir)
+        rng = np.random.default_rng(0)
+        for i in range(n_images):
+            Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)).save(os.path.join(images_dir, f"tile_{i}.png"))
+
+        cmd = [sys.executable, os.path.abspath(__file__), "--images_dir", images_dir, "--engine", "fp32"]
+        env = dict(os.environ, INFERENCE_BATCH_SIZE="2", NUM_WORKERS="0")
+        env.pop("INFERENCE_RUN_ID", None)
+
+        run_id = default_run_id(images_dir, "fp32", os.path.join(cwd, MODEL_PATH))
+        paths = run_paths(run_id)
+        journal_file = os.path.join(cwd, paths["journal"])
+
+        def journaled():
+            if not os.path.exists(journal_file):
+                return 0
+            with InferenceJournal(journal_file) as journal:
+                return len(journal)
+
+        # Primera corrida: se mata apenas el journal tiene algún batch
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        while journaled() == 0 and proc.poll() is None:
+            time.sleep(0.05)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+
+        done = journaled()
+        assert 0 < done < n_images, f"run should have been killed midway ({done} of {n_images} done)"
+
+        # Segunda corrida, sin --run_id: mismo id por defecto, retoma
+        proc = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, text=True)
+        assert proc.returncode == 0, proc.stderr[-2000:]
+        assert f"Resuming run {run_id}: {n_images - done} images remaining" in proc.stdout, proc.stdout[-2000:]
+
+        with open(os.path.join(cwd, paths["csv"]), newline="", encoding="utf-8") as f:
+            assert [row["filename"] for row in csv.DictReader(f)] == [f"tile_{i}.png" for i in range(n_images)]
+
 
 if __name__ == "__main__":
-    
-    inference()
+
+    args = parser.parse_args()
+
+    if args.benchmark:
+        autotune(MODEL_PATH, engine=args.engine)
+    else:
+        inference(images_dir=args.images_dir, engine=args.engine, run_id=args.run_id or RUN_ID)
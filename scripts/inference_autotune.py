@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import subprocess
+import numpy as np
+from datetime import datetime
+from PIL import Image
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+MODEL_PATH = "./models/efficientnet"
+
+# Mejor configuración por máquina y engine, junto al modelo (como los artefactos de inference_engines.py)
+TUNING_FILE = "inference_tuning.json"
+TUNING_PATH = os.getenv("INFERENCE_TUNING_PATH")
+
+# Imágenes sintéticas del tamaño de los thumbnails reales
+SYNTHETIC_SIZE = 1024
+SYNTHETIC_VARIANTS = 16
+
+# Imágenes medidas por configuración (más un batch de calentamiento)
+TRIAL_IMAGES = int(os.getenv("AUTOTUNE_TRIAL_IMAGES", "128"))
+TRIAL_MIN_BATCHES = 5
+TRIAL_TIMEOUT = int(os.getenv("AUTOTUNE_TRIAL_TIMEOUT", "1800"))
+
+
+def tuning_path(model_path=MODEL_PATH):
+    return TUNING_PATH or os.path.join(model_path, TUNING_FILE)
+
+
+def cpu_model():
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def machine_signature():
+    """Identifica el tipo de nodo: CPU, cantidad de cores y GPU si hay."""
+    import torch
+
+    signature = f"{cpu_model()} x{os.cpu_count()}"
+    if torch.cuda.is_available():
+        signature += f" | {torch.cuda.get_device_name(0)}"
+    return signature
+
+
+def load_tuning(model_path=MODEL_PATH):
+    path = tuning_path(model_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_tuned_config(model_path=MODEL_PATH, engine="fp32"):
+    """Mejor configuración medida en esta máquina para engine, o {} si nunca se corrió el autotune."""
+    try:
+        return load_tuning(model_path).get(machine_signature(), {}).get(engine, {})
+    except (OSError, ValueError) as e:
+        print(f"Ignoring inference tuning file: {e}")
+        return {}
+
+
+def save_tuned_config(config, model_path=MODEL_PATH, engine="fp32"):
+    path = tuning_path(model_path)
+    tuning = load_tuning(model_path)
+    tuning.setdefault(machine_signature(), {})[engine] = config
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(tuning, f, indent=2)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def write_synthetic_images(output_dir, n=SYNTHETIC_VARIANTS, size=SYNTHETIC_SIZE):
+    """PNG RGB de size x size con estructura suave más ruido (decodifican como un thumbnail real)."""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+
+    for i in range(n):
+        coarse = rng.integers(0, 255, (size // 64, size // 64, 3), dtype=np.uint8)
+        image = np.asarray(Image.fromarray(coarse).resize((size, size), Image.BILINEAR), dtype=np.int16)
+        image = np.clip(image + rng.integers(-12, 12, image.shape), 0, 255).astype(np.uint8)
+        Image.fromarray(image).save(os.path.join(output_dir, f"synthetic_{i}.png"))
+
+    return sorted(os.listdir(output_dir))
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def run_trial(model_path, images_dir, engine, n_images):
+    """
+    Se ejecuta en un proceso nuevo con la configuración ya puesta en las
+    variables de entorno (los threads inter-op de torch solo se pueden fijar
+    una vez por proceso). Devuelve images/s, latencia por batch y RSS pico.
+    """
+    import inference
+
+    inference.MODEL_PATH = model_path
+    forward, preprocessor, id2label, label2id = inference.load_classifier(engine)
+
+    files = sorted(os.listdir(images_dir))
+    settings = inference.inference_settings(engine)
+    batch_size = settings["batch_size"]
+    n_batches = max(TRIAL_MIN_BATCHES, -(-n_images // batch_size)) + 1
+    image_files = [files[i % len(files)] for i in range(n_batches * batch_size)]
+
+    loader = inference.make_loader(images_dir, image_files, preprocessor, batch_size, settings["num_workers"])
+
+    latencies = []
+    images = 0
+    started = None
+    for i, (fnames, batch) in enumerate(loader):
+        t0 = time.perf_counter()
+        inference.predict_rows(forward, preprocessor, fnames, batch, id2label, label2id)
+        latency = time.perf_counter() - t0
+
+        # El primer batch (arranque de workers, caches de torch) no se mide
+        if i == 0:
+            started = time.perf_counter()
+            continue
+        latencies.append(latency)
+        images += len(fnames)
+
+    wall_s = time.perf_counter() - started
+    del loader
+
+    latencies = np.asarray(latencies)
+    return {
+        "images": images,
+        "images_per_s": images / wall_s,
+        "batch_p50_s": float(np.quantile(latencies, 0.5)),
+        "batch_p99_s": float(np.quantile(latencies, 0.99)),
+        "peak_rss_mb": peak_rss_mb(),
+        "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def trial(config, model_path, images_dir, engine, n_images=TRIAL_IMAGES):
+    """Corre run_trial en un subproceso con config; devuelve el resultado o None si falló."""
+    env = dict(
+        os.environ,
+        INFERENCE_BATCH_SIZE=str(config["batch_size"]),
+        INFERENCE_THREADS=str(config["intra_op_threads"]),
+        INFERENCE_INTEROP_THREADS=str(config["interop_threads"]),
+        NUM_WORKERS=str(config["num_workers"]),
+    )
+    args = json.dumps({"model_path": model_path, "images_dir": images_dir, "engine": engine, "n_images": n_images})
+
+    # cwd temporal: inference.py crea ./data al importarse
+    with tempfile.TemporaryDirectory() as cwd:
+        try:
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--trial", args],
+                cwd=cwd, env=env, capture_output=True, text=True, timeout=TRIAL_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            print(f"Trial timed out: {config}")
+            return None
+
+    if proc.returncode != 0:
+        print(f"Trial failed: {config}\n{proc.stderr[-2000:]}")
+        return None
+
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def sweep_values(cuda):
+    cpus = os.cpu_count() or 1
+    return {
+        "batch_size": [8, 16, 32, 64, 128] if cuda else [1, 2, 4, 8, 16, 32],
+        "intra_op_threads": sorted({max(1, cpus // 4), max(1, cpus // 2), cpus}),
+        "num_workers": sorted({0, 1, 2, 4, cpus // 4, cpus // 2} & set(range(cpus + 1))),
+        "interop_threads": [n for n in (1, 2, 4) if n <= cpus],
+    }
+
+
+def autotune(model_path=MODEL_PATH, engine="fp32", n_images=TRIAL_IMAGES, max_rss_mb=None, save=True):
+    """
+    Busca la configuración de mayor images/s moviendo un parámetro por vez
+    (batch size, threads intra-op, workers del DataLoader, threads inter-op)
+    con los demás fijos en el mejor valor hasta el momento. Cada prueba corre
+    en un proceso nuevo sobre imágenes sintéticas de 1024 px.
+    """
+    import torch
+
+    model_path = os.path.abspath(model_path)
+    cpus = os.cpu_count() or 1
+    values = sweep_values(torch.cuda.is_available())
+
+    best = {
+        "batch_size": 32 if torch.cuda.is_available() else 8,
+        "intra_op_threads": max(1, cpus // 2),
+        "num_workers": max(1, cpus // 4),
+        "interop_threads": 1,
+    }
+
+    results = {}
+    images_dir = tempfile.mkdtemp(prefix="autotune_images_")
+
+    def measure(config):
+        key = tuple(sorted(config.items()))
+        if key not in results:
+            print(f"Trial: {config}")
+            result = trial(config, model_path, images_dir, engine, n_images)
+            if result is not None and max_rss_mb and result["peak_rss_mb"] + result["workers_peak_rss_mb"] > max_rss_mb:
+                print(f"Discarded (peak RSS above {max_rss_mb} MB)")
+                result = None
+            results[key] = result
+            if result is not None:
+                print(
+                    f"  {result['images_per_s']:.2f} images/s, p50 {result['batch_p50_s'] * 1000:.0f}ms, "
+                    f"p99 {result['batch_p99_s'] * 1000:.0f}ms, peak RSS {result['peak_rss_mb']:.0f} MB"
+                )
+        return results[key]
+
+    try:
+        write_synthetic_images(images_dir)
+
+        for param, candidates in values.items():
+            scores = {}
+            for value in candidates:
+                result = measure({**best, param: value})
+                if result is not None:
+                    scores[value] = result["images_per_s"]
+            if scores:
+                best[param] = max(scores, key=scores.get)
+    finally:
+        shutil.rmtree(images_dir, ignore_errors=True)
+
+    best_result = results.get(tuple(sorted(best.items())))
+    if best_result is None:
+        raise RuntimeError("No inference configuration could be measured")
+
+    print_trials(results)
+
+    config = {
+        **best,
+        **best_result,
+        "engine": engine,
+        "device": "cuda" if torch.cuda.is_available() else "cpu",
+        "tuned_utc": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    print(f"Best configuration: {best} ({best_result['images_per_s']:.2f} images/s)")
+
+    if save:
+        path = save_tuned_config(config, model_path, engine)
+        print(f"Inference tuning saved for '{machine_signature()}': {path}")
+
+    return config
+
+
+def print_trials(results):
+    print(f"{'batch':>6}{'intra':>7}{'workers':>9}{'inter':>7}{'images/s':>10}{'p50':>9}{'p99':>9}{'peak RSS':>10}")
+    for key, result in sorted(results.items(), key=lambda item: -(item[1] or {}).get("images_per_s", 0)):
+        config = dict(key)
+        prefix = (
+            f"{config['batch_size']:>6}{config['intra_op_threads']:>7}"
+            f"{config['num_workers']:>9}{config['interop_threads']:>7}"
+        )
+        if result is None:
+            print(f"{prefix}{'failed':>10}")
+            continue
+        print(
+            f"{prefix}{result['images_per_s']:>10.2f}{result['batch_p50_s'] * 1000:>7.0f}ms"
+            f"{result['batch_p99_s'] * 1000:>7.0f}ms{result['peak_rss_mb']:>8.0f}MB"
+        )
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) == 3 and sys.argv[1] == "--trial":
+        # Subproceso de trial(): el resultado va en la última línea de stdout
+        print(json.dumps(run_trial(**json.loads(sys.argv[2]))))
+    else:
+        autotune()
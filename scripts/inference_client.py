@@ -0,0 +1,48 @@
+import os
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+
+INFERENCE_SERVER_URL = os.getenv("INFERENCE_SERVER_URL", "http://127.0.0.1:8765")
+
+# Requests simultáneos por cliente; el servidor los junta en micro-batches
+MAX_IN_FLIGHT = int(os.getenv("INFERENCE_CLIENT_IN_FLIGHT", "4"))
+
+REQUEST_TIMEOUT = int(os.getenv("INFERENCE_CLIENT_TIMEOUT", "600"))
+
+
+class InferenceClient:
+    """Cliente HTTP mínimo para inference_server.py."""
+
+    def __init__(self, url=INFERENCE_SERVER_URL):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def available(self):
+        try:
+            r = self.session.get(f"{self.url}/health", timeout=2)
+            return r.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def predict(self, paths):
+        """Clasifica imágenes ya guardadas en disco; devuelve filas con el formato de FIELDNAMES."""
+        r = self.session.post(f"{self.url}/predict", json={"paths": list(paths)}, timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        results = r.json()["results"]
+
+        rows = []
+        for result in results:
+            if "error" in result:
+                print(f"Skipping {result['filename']}: {result['error']}")
+                continue
+            rows.append(result)
+        return rows
+
+    def predict_many(self, paths, chunk_size=8, max_in_flight=MAX_IN_FLIGHT):
+        """Envía los paths en chunks concurrentes y devuelve las filas de cada chunk en orden."""
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for rows in executor.map(self.predict, chunks):
+                yield rows
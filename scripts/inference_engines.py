@@ -0,0 +1,406 @@
+import os
+import copy
+import json
+import time
+import torch
+import argparse
+import numpy as np
+from PIL import Image
+from preprocessing import BatchPreprocessor
+from transformers import AutoModelForImageClassification
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+MODEL_PATH = "./models/efficientnet"
+
+ENGINES = ["fp32", "int8", "bf16", "compile", "torchscript", "onnx"]
+
+# Artefactos exportados (TorchScript / ONNX) se guardan junto al modelo
+TORCHSCRIPT_FILE = "efficientnet_torchscript.pt"
+ONNX_FILE = "efficientnet.onnx"
+INT8_FILE = "efficientnet_int8.pt"
+
+# Pesos, calibración y backend con los que se generó INT8_FILE; si alguno
+# cambia el artefacto se vuelve a generar
+INT8_SETTINGS_FILE = "efficientnet_int8.json"
+
+# Imágenes para calibrar los rangos de activación del engine int8 (sin
+# directorio se usan imágenes sintéticas, peor calibración)
+INT8_CALIBRATION_DIR = os.getenv("INT8_CALIBRATION_DIR")
+INT8_CALIBRATION_IMAGES = int(os.getenv("INT8_CALIBRATION_IMAGES", "32"))
+
+# Por debajo de esta fracción de parámetros en int8 el engine es fp32 con overhead
+MIN_QUANTIZED_FRACTION = 0.5
+
+WEIGHTS_FILES = ["model.safetensors", "pytorch_model.bin", "model.safetensors.index.json", "pytorch_model.bin.index.json"]
+
+DRIFT_REPORT_FILE = "engine_drift_report.json"
+
+
+class LogitsModule(torch.nn.Module):
+    """Envuelve el modelo de HF para que devuelva solo los logits (necesario para trace/export)."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).logits
+
+
+def weights_file(model_path=MODEL_PATH):
+    for name in WEIGHTS_FILES:
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def artifact_is_fresh(path, model_path=MODEL_PATH):
+    """El artefacto existe y es posterior a los pesos; sin pesos para comparar nunca está al día."""
+    weights = weights_file(model_path)
+    if weights is None or not os.path.exists(path):
+        return False
+    return os.path.getmtime(path) >= os.path.getmtime(weights)
+
+
+def int8_settings(model_path=MODEL_PATH):
+    """Todo lo que determina el artefacto int8: pesos, imágenes de calibración y backend."""
+    weights = weights_file(model_path)
+    stat = os.stat(weights) if weights else None
+
+    return {
+        "weights": {"file": os.path.basename(weights), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns} if weights else None,
+        "calibration_dir": os.path.realpath(INT8_CALIBRATION_DIR) if INT8_CALIBRATION_DIR else None,
+        "calibration_images": INT8_CALIBRATION_IMAGES,
+        "backend": torch.backends.quantized.engine,
+    }
+
+
+def int8_is_fresh(path, settings_path, settings, model_path=MODEL_PATH):
+    if not artifact_is_fresh(path, model_path) or not os.path.exists(settings_path):
+        return False
+    try:
+        with open(settings_path, encoding="utf-8") as f:
+            return json.load(f) == settings
+    except (OSError, ValueError):
+        return False
+
+
+def example_input(model, image_size=(380, 380), batch_size=2):
+    device = next(model.parameters()).device
+    return torch.randn(batch_size, 3, *image_size, device=device)
+
+
+def load_torchscript(model, model_path=MODEL_PATH, image_size=(380, 380)):
+    path = os.path.join(model_path, TORCHSCRIPT_FILE)
+
+    if artifact_is_fresh(path, model_path):
+        print(f"Loading cached TorchScript artifact: {path}")
+        return torch.jit.load(path, map_location="cpu")
+
+    print(f"Tracing TorchScript artifact: {path}")
+    with torch.no_grad():
+        traced = torch.jit.trace(LogitsModule(model).eval(), example_input(model, image_size), strict=False)
+    traced = torch.jit.freeze(traced)
+    torch.jit.save(traced, path)
+    return traced
+
+
+def explicit_padding(model):
+    """
+    Cambia padding="same"/"valid" de las Conv2d (así las define EfficientNet en
+    transformers) por el padding numérico equivalente, que es lo único que
+    aceptan las convoluciones cuantizadas. Devuelve los nombres de las que no
+    tienen equivalente simétrico (kernel par con "same").
+    """
+    skipped = []
+    for name, module in model.named_modules():
+        if not isinstance(module, torch.nn.Conv2d) or not isinstance(module.padding, str):
+            continue
+        if module.padding == "valid":
+            padding = (0, 0)
+        elif all(k % 2 == 1 for k in module.kernel_size):
+            padding = tuple(d * (k // 2) for k, d in zip(module.kernel_size, module.dilation))
+        else:
+            skipped.append(name)
+            continue
+        module.padding = padding
+        module._reversed_padding_repeated_twice = [p for p in reversed(padding) for _ in range(2)]
+    return skipped
+
+
+def quantized_param_fraction(quantized, model):
+    """Fracción de los parámetros de model que quedaron con pesos int8 en quantized."""
+    total = sum(p.numel() for p in model.parameters())
+    int8 = 0
+    for module in quantized.modules():
+        weight = getattr(module, "weight", None)
+        if callable(weight):
+            weight = weight()
+            if isinstance(weight, torch.Tensor) and weight.is_quantized:
+                int8 += weight.numel()
+    return int8 / total if total else 0.0
+
+
+def load_int8(model, model_path=MODEL_PATH, image_size=(380, 380)):
+    """
+    Cuantización estática (FX) de convoluciones y Linear a int8, con rangos de
+    activación calibrados sobre imágenes reales. La conversión tarda minutos,
+    así que el resultado se guarda como TorchScript junto al modelo y se
+    reutiliza mientras no cambien los pesos ni int8_settings.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    path = os.path.join(model_path, INT8_FILE)
+    settings_path = os.path.join(model_path, INT8_SETTINGS_FILE)
+    settings = int8_settings(model_path)
+
+    if int8_is_fresh(path, settings_path, settings, model_path):
+        print(f"Loading cached int8 artifact: {path}")
+        extra_files = {"quantization.json": ""}
+        quantized = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+        info = json.loads(extra_files["quantization.json"])
+    else:
+        print(f"Quantizing int8 artifact (calibration + conversion, may take several minutes): {path}")
+        module = copy.deepcopy(LogitsModule(model)).cpu().eval()
+
+        qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+        for name in explicit_padding(module):
+            qconfig_mapping.set_module_name(name, None)
+
+        preprocessor = BatchPreprocessor(model_path, batch_size=8)
+        if not INT8_CALIBRATION_DIR:
+            print("INT8_CALIBRATION_DIR not set, calibrating int8 on synthetic images")
+        calibration = load_sample_batch(INT8_CALIBRATION_DIR, preprocessor, INT8_CALIBRATION_IMAGES)
+
+        prepared = prepare_fx(module, qconfig_mapping, (example_input(model, image_size).cpu(),))
+        with torch.no_grad():
+            for i in range(0, calibration.shape[0], 8):
+                prepared(preprocessor.normalize(calibration[i:i + 8]).cpu())
+        converted = convert_fx(prepared)
+
+        info = {
+            "quantized_param_fraction": quantized_param_fraction(converted, model),
+            "calibration_images": int(calibration.shape[0]),
+            "calibration_dir": INT8_CALIBRATION_DIR,
+            "backend": torch.backends.quantized.engine,
+        }
+
+        with torch.no_grad():
+            quantized = torch.jit.freeze(torch.jit.trace(converted, example_input(model, image_size).cpu(), strict=False))
+
+        # Sin settings mientras se escribe el artefacto: si se corta, se vuelve a generar
+        if os.path.exists(settings_path):
+            os.remove(settings_path)
+        torch.jit.save(quantized, path, _extra_files={"quantization.json": json.dumps(info)})
+        with open(settings_path, "w", encoding="utf-8") as f:
+            json.dump(settings, f, indent=2)
+
+    fraction = info["quantized_param_fraction"]
+    print(f"int8 engine: {fraction:.1%} of the parameters quantized")
+    if fraction < MIN_QUANTIZED_FRACTION:
+        print(f"Warning: int8 engine quantizes only {fraction:.1%} of the parameters; it runs mostly in fp32")
+
+    def forward(pixel_values):
+        return quantized(pixel_values.cpu())
+
+    forward.quantized_param_fraction = fraction
+    return forward
+
+
+def load_onnx(model, model_path=MODEL_PATH, image_size=(380, 380)):
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("The onnx engine requires onnxruntime (pip install onnxruntime)") from e
+
+    path = os.path.join(model_path, ONNX_FILE)
+
+    if not artifact_is_fresh(path, model_path):
+        print(f"Exporting ONNX artifact: {path}")
+        with torch.no_grad():
+            torch.onnx.export(
+                LogitsModule(model).eval(),
+                (example_input(model, image_size),),
+                path,
+                input_names=["pixel_values"],
+                output_names=["logits"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+                dynamo=False,
+            )
+    else:
+        print(f"Loading cached ONNX artifact: {path}")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def forward(pixel_values):
+        logits = session.run(["logits"], {"pixel_values": pixel_values.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+    return forward
+
+
+def load_engine(model, engine="fp32", model_path=MODEL_PATH, image_size=(380, 380)):
+    """
+    Devuelve una función pixel_values -> logits para el engine pedido.
+
+    - fp32: modelo eager tal como se carga con from_pretrained
+    - int8: cuantización estática de convoluciones y Linear, calibrada y cacheada
+      junto al modelo (ver load_int8)
+    - bf16: autocast bfloat16 en CPU
+    - compile: torch.compile del modelo
+    - torchscript / onnx: artefacto exportado y cacheado junto al modelo
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Engine not supported: {engine}")
+
+    model.eval()
+
+    if engine == "fp32":
+        return LogitsModule(model)
+
+    if engine == "int8":
+        return load_int8(model, model_path, image_size)
+
+    if engine == "bf16":
+        module = LogitsModule(model)
+
+        def forward(pixel_values):
+            with torch.autocast(device_type=pixel_values.device.type, dtype=torch.bfloat16):
+                return module(pixel_values).float()
+
+        return forward
+
+    if engine == "compile":
+        return torch.compile(LogitsModule(model))
+
+    if engine == "torchscript":
+        return load_torchscript(model, model_path, image_size)
+
+    return load_onnx(model, model_path, image_size)
+
+
+def load_sample_batch(images_dir, preprocessor, n_images, seed=0):
+    """Toma hasta n_images del directorio; si no hay, genera imágenes sintéticas de 1024px."""
+    arrays = []
+
+    if images_dir and os.path.isdir(images_dir):
+        files = sorted(
+            f for f in os.listdir(images_dir)
+            if f.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+        for fname in files[:n_images]:
+            try:
+                with Image.open(os.path.join(images_dir, fname)) as img:
+                    arrays.append(preprocessor.resize(img))
+            except Exception as e:
+                print(f"Skipping {fname}: {e}")
+
+    rng = np.random.default_rng(seed)
+    while len(arrays) < n_images:
+        img = Image.fromarray(rng.integers(0, 256, (1024, 1024, 3), dtype=np.uint8))
+        arrays.append(preprocessor.resize(img))
+
+    return torch.from_numpy(np.stack(arrays))
+
+
+def run_engine(forward, batch, preprocessor, batch_size):
+    probs = []
+    start = time.perf_counter()
+
+    with torch.no_grad():
+        for i in range(0, batch.shape[0], batch_size):
+            pixel_values = preprocessor.normalize(batch[i:i + batch_size])
+            logits = forward(pixel_values)
+            probs.append(torch.softmax(logits.float(), dim=-1).numpy())
+
+    elapsed = time.perf_counter() - start
+    return np.concatenate(probs), elapsed
+
+
+def drift_report(images_dir=None, engines=ENGINES, n_images=64, batch_size=8, model_path=MODEL_PATH):
+    """Compara cada engine contra el baseline fp32 (drift de probabilidades, acuerdo top-1 y tiles/s)."""
+    model = AutoModelForImageClassification.from_pretrained(model_path)
+    model.eval()
+
+    preprocessor = BatchPreprocessor(model_path, batch_size=batch_size)
+    image_size = (preprocessor.height, preprocessor.width)
+    batch = load_sample_batch(images_dir, preprocessor, n_images)
+
+    baseline_forward = load_engine(model, "fp32", model_path, image_size)
+    run_engine(baseline_forward, batch[:batch_size], preprocessor, batch_size)
+    baseline, baseline_time = run_engine(baseline_forward, batch, preprocessor, batch_size)
+
+    report = {
+        "n_images": n_images,
+        "batch_size": batch_size,
+        "threads": torch.get_num_threads(),
+        "engines": {},
+    }
+
+    for engine in engines:
+        try:
+            if engine == "fp32":
+                forward = baseline_forward
+                probs, elapsed = baseline, baseline_time
+            else:
+                forward = load_engine(model, engine, model_path, image_size)
+                # Un batch de warmup (compile/trace pagan su costo en la primera llamada)
+                run_engine(forward, batch[:batch_size], preprocessor, batch_size)
+                probs, elapsed = run_engine(forward, batch, preprocessor, batch_size)
+        except Exception as e:
+            print(f"Engine {engine} failed: {e}")
+            report["engines"][engine] = {"error": str(e)}
+            continue
+
+        diff = np.abs(probs - baseline)
+        report["engines"][engine] = {
+            "tiles_per_second": n_images / elapsed,
+            "max_abs_prob_diff": float(diff.max()),
+            "mean_abs_prob_diff": float(diff.mean()),
+            "top1_agreement": float(np.mean(probs.argmax(axis=1) == baseline.argmax(axis=1))),
+        }
+
+        # Un engine "int8" que casi no cuantizó nada es fp32 con overhead
+        fraction = getattr(forward, "quantized_param_fraction", None)
+        if fraction is not None:
+            report["engines"][engine]["quantized_param_fraction"] = fraction
+
+    report_path = os.path.join(model_path, DRIFT_REPORT_FILE)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'engine':<12} {'tiles/s':>9} {'max diff':>10} {'mean diff':>10} {'top1':>7} {'int8 params':>12}")
+    for engine, r in report["engines"].items():
+        if "error" in r:
+            print(f"{engine:<12} error: {r['error']}")
+            continue
+        fraction = f"{r['quantized_param_fraction']:.1%}" if "quantized_param_fraction" in r else "-"
+        print(
+            f"{engine:<12} {r['tiles_per_second']:>9.2f} {r['max_abs_prob_diff']:>10.2e} "
+            f"{r['mean_abs_prob_diff']:>10.2e} {r['top1_agreement']:>7.2%} {fraction:>12}"
+        )
+        if "quantized_param_fraction" in r and r["quantized_param_fraction"] < MIN_QUANTIZED_FRACTION:
+            print(f"Warning: {engine} quantizes only {r['quantized_param_fraction']:.1%} of the parameters")
+    print(f"Drift report written: {report_path}")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy drift and throughput of CPU inference engines vs fp32.")
+    parser.add_argument("--images_dir", type=str, default=None, help="Images to evaluate (default: synthetic 1024px images)")
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    parser.add_argument("--n_images", type=int, default=64)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--model_path", type=str, default=MODEL_PATH)
+    args = parser.parse_args()
+
+    drift_report(args.images_dir, args.engines, args.n_images, args.batch_size, args.model_path)
@@ -0,0 +1,144 @@
+import os
+import csv
+import sqlite3
+import threading
+from datetime import datetime
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+JOURNAL_DIR = os.getenv("INFERENCE_JOURNAL_DIR", "data/inference_journal")
+
+JOURNAL_COLUMNS = ["filename", "prediction", "confidence", "prob_fire", "prob_no_fire"]
+
+
+def journal_path(run_id, journal_dir=JOURNAL_DIR):
+    return os.path.join(journal_dir, f"{run_id}.sqlite")
+
+
+class InferenceJournal:
+    """
+    Resultados de una corrida de inferencia en SQLite (modo WAL), una fila por
+    imagen con el nombre como clave primaria.
+
+    Cada batch se escribe en una sola transacción: tras una caída el batch a
+    medio escribir no queda registrado y se vuelve a clasificar entero, y
+    saber si una imagen ya está hecha es una búsqueda por clave, sin leer
+    todos los resultados anteriores. Se puede usar desde varios hilos.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Con WAL, NORMAL no corrompe la base ante una caída; solo puede perder el último commit
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS predictions (
+                filename TEXT PRIMARY KEY,
+                prediction TEXT NOT NULL,
+                confidence REAL NOT NULL,
+                prob_fire REAL NOT NULL,
+                prob_no_fire REAL NOT NULL,
+                updated_utc TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def is_done(self, fname):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM predictions WHERE filename = ?", (fname,)).fetchone() is not None
+
+    def pending(self, image_files):
+        return [f for f in image_files if not self.is_done(f)]
+
+    def add_batch(self, rows):
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+                [tuple(row[c] for c in JOURNAL_COLUMNS) + (now,) for row in rows],
+            )
+
+    def rows(self, order=None):
+        """Filas como dicts; con order (lista de nombres) en ese orden, el resto al final."""
+        with self.lock:
+            cursor = self.conn.execute(f"SELECT {', '.join(JOURNAL_COLUMNS)} FROM predictions ORDER BY rowid")
+            rows = [dict(zip(JOURNAL_COLUMNS, values)) for values in cursor]
+
+        if order is not None:
+            position = {fname: i for i, fname in enumerate(order)}
+            rows.sort(key=lambda row: (position.get(row["filename"], len(position)), row["filename"]))
+
+        return rows
+
+    def export_csv(self, csv_path, order=None, fieldnames=JOURNAL_COLUMNS):
+        """Escribe el CSV de predicciones completo (atómico) a partir del journal."""
+        tmp_path = f"{csv_path}.tmp"
+        with open(tmp_path, mode="w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(self.rows(order))
+        os.replace(tmp_path, csv_path)
+
+        return csv_path
+
+
+def test():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = journal_path("run_test", tmp)
+
+        def batch(names):
+            return [
+                {"filename": n, "prediction": "Fire", "confidence": 0.9, "prob_fire": 0.9, "prob_no_fire": 0.1}
+                for n in names
+            ]
+
+        with InferenceJournal(path) as journal:
+            journal.add_batch(batch(["tile_2.png", "tile_10.png"]))
+
+            # Un batch que falla a mitad de escritura no deja filas
+            try:
+                with journal.conn:
+                    journal.conn.execute(
+                        "INSERT INTO predictions VALUES ('tile_3.png', 'Fire', 1, 1, 0, '')"
+                    )
+                    raise RuntimeError("crash")
+            except RuntimeError:
+                pass
+
+        # Reapertura (como tras reiniciar el proceso)
+        with InferenceJournal(path) as journal:
+            assert len(journal) == 2
+            assert journal.pending(["tile_1.png", "tile_2.png", "tile_3.png", "tile_10.png"]) == ["tile_1.png", "tile_3.png"]
+
+            journal.add_batch(batch(["tile_1.png", "tile_3.png"]))
+            csv_path = journal.export_csv(os.path.join(tmp, "predictions.csv"), order=["tile_1.png", "tile_2.png", "tile_3.png", "tile_10.png"])
+
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            assert [row["filename"] for row in csv.DictReader(f)] == ["tile_1.png", "tile_2.png", "tile_3.png", "tile_10.png"]
+
+
+if __name__ == "__main__":
+    test()
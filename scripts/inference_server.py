@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import queue
+import torch
+import argparse
+import threading
+import numpy as np
+from PIL import Image
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from inference import ENGINE, ENGINES, inference_settings, load_classifier, predict_rows
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+HOST = os.getenv("INFERENCE_SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("INFERENCE_SERVER_PORT", "8765"))
+
+# Tamaño máximo de cada micro-batch (sin definir: el batch size del engine servido)
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_SERVER_MAX_BATCH", "0")) or None
+
+# Tiempo máximo que espera el primer item de un batch a que lleguen más
+MAX_LATENCY_MS = float(os.getenv("INFERENCE_SERVER_MAX_LATENCY_MS", "50"))
+
+
+class MicroBatcher:
+    """
+    Junta imágenes de varios requests en batches de hasta max_batch_size.
+
+    Un batch sale cuando se llena o cuando su primer item lleva max_latency_ms
+    esperando. Un único hilo ejecuta el modelo, que queda cargado en memoria.
+    """
+
+    def __init__(self, engine=ENGINE, max_batch_size=MAX_BATCH_SIZE, max_latency_ms=MAX_LATENCY_MS):
+        self.forward, self.preprocessor, self.id2label, self.label2id = load_classifier(engine)
+        self.engine = engine
+        self.max_batch_size = max_batch_size or inference_settings(engine)["batch_size"]
+        self.max_latency = max_latency_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.images = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, fname, array):
+        future = Future()
+        self.queue.put((fname, array, future))
+        return future
+
+    def _next_batch(self):
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.max_latency
+
+        while len(items) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return items
+
+    def _run(self):
+        while True:
+            items = self._next_batch()
+
+            # Una imagen con otra forma (ej. PNG en escala de grises) falla sola, sin tirar el batch
+            expected = (self.preprocessor.height, self.preprocessor.width, 3)
+            valid = []
+            for fname, array, future in items:
+                if np.shape(array) != expected:
+                    future.set_exception(ValueError(f"{fname}: expected an image of shape {expected}, got {np.shape(array)}"))
+                else:
+                    valid.append((fname, array, future))
+
+            items = valid
+            if not items:
+                continue
+
+            try:
+                fnames = [fname for fname, _, _ in items]
+                batch = torch.from_numpy(np.stack([array for _, array, _ in items]))
+                rows = predict_rows(self.forward, self.preprocessor, fnames, batch, self.id2label, self.label2id)
+            except Exception as e:
+                for _, _, future in items:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, future), row in zip(items, rows):
+                future.set_result(row)
+
+            self.batches += 1
+            self.images += len(items)
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    batcher = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        self._send_json(200, {
+            "status": "ok",
+            "engine": self.batcher.engine,
+            "batches": self.batcher.batches,
+            "images": self.batcher.images,
+        })
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            paths = json.loads(self.rfile.read(length))["paths"]
+        except Exception as e:
+            self._send_json(400, {"error": f"invalid request: {e}"})
+            return
+
+        # La decodificación se hace en el hilo de cada request, en paralelo con el modelo
+        pending = []
+        for path in paths:
+            fname = os.path.basename(path)
+            try:
+                with Image.open(path) as img:
+                    pending.append((fname, self.batcher.submit(fname, self.batcher.preprocessor.resize(img))))
+            except Exception as e:
+                pending.append((fname, e))
+
+        results = []
+        for fname, item in pending:
+            if isinstance(item, Exception):
+                results.append({"filename": fname, "error": str(item)})
+                continue
+            try:
+                results.append(item.result())
+            except Exception as e:
+                results.append({"filename": fname, "error": str(e)})
+
+        self._send_json(200, {"results": results})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host=HOST, port=PORT, engine=ENGINE, max_batch_size=MAX_BATCH_SIZE, max_latency_ms=MAX_LATENCY_MS):
+    InferenceHandler.batcher = MicroBatcher(engine, max_batch_size, max_latency_ms)
+
+    server = ThreadingHTTPServer((host, port), InferenceHandler)
+    server.daemon_threads = True
+
+    print(f"Inference server listening on http://{host}:{port} (engine={engine}, max_batch={InferenceHandler.batcher.max_batch_size}, max_latency={max_latency_ms}ms)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down inference server")
+    finally:
+        server.server_close()
+
+
+def test(engine="fp32"):
+    batcher = MicroBatcher(engine, max_batch_size=4, max_latency_ms=200)
+    height, width = batcher.preprocessor.height, batcher.preprocessor.width
+
+    good = np.zeros((height, width, 3), dtype=np.uint8)
+    gray = np.zeros((height, width), dtype=np.uint8)
+
+    # Request con forma inválida y después uno válido: el hilo del batcher sigue vivo
+    bad = batcher.submit("gray.png", gray)
+    try:
+        bad.result(timeout=60)
+        raise AssertionError("bad-shape image should fail")
+    except ValueError:
+        pass
+    assert batcher.submit("tile_1.png", good).result(timeout=60)["filename"] == "tile_1.png"
+
+    # Las dos en el mismo micro-batch: solo falla la inválida
+    futures = [batcher.submit("gray.png", gray), batcher.submit("tile_2.png", good)]
+    try:
+        futures[0].result(timeout=60)
+        raise AssertionError("bad-shape image should fail")
+    except ValueError:
+        pass
+    assert futures[1].result(timeout=60)["filename"] == "tile_2.png"
+    assert batcher.thread.is_alive()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the fire classifier loaded and serve micro-batched predictions.")
+    parser.add_argument("--host", type=str, default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--engine", type=str, default=ENGINE, choices=ENGINES)
+    parser.add_argument("--max_batch_size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max_latency_ms", type=float, default=MAX_LATENCY_MS)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.engine, args.max_batch_size, args.max_latency_ms)
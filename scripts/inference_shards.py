@@ -0,0 +1,232 @@
+import os
+import sys
+import csv
+import zlib
+import argparse
+import subprocess
+from inference import (
+    DATA_DIR, ENGINE, ENGINES, FIELDNAMES, IMAGES_DIR, INFERENCE_SERVER_URL, RUN_ID,
+    copy_fire_images, default_run_id, list_images, make_predictions, record_predictions, run_paths,
+)
+from inference_journal import InferenceJournal, journal_path
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# CPUs asignadas a este proceso, ej. "0-3,8" (modo local: una porción disjunta por worker)
+INFERENCE_CPUS = os.getenv("INFERENCE_CPUS")
+
+
+def shards_dir(run_id):
+    """Directorio por defecto de los CSV de shards de una corrida (con --run_dir puede ser uno de red)."""
+    return f"{DATA_DIR}/inference_shards_{run_id}"
+
+
+def shard_of(fname, num_shards):
+    """Shard de una imagen: crc32 del nombre, igual en cualquier máquina y corrida."""
+    return zlib.crc32(fname.encode("utf-8")) % num_shards
+
+
+def shard_files(image_files, num_shards, shard_index):
+    return [f for f in image_files if shard_of(f, num_shards) == shard_index]
+
+
+def shard_csv_path(run_dir, num_shards, shard_index):
+    return os.path.join(run_dir, f"shard_{shard_index:04d}_of_{num_shards:04d}.csv")
+
+
+def shard_done_path(run_dir, num_shards, shard_index):
+    return shard_csv_path(run_dir, num_shards, shard_index)[:-len(".csv")] + ".done"
+
+
+def shard_journal_path(run_id, num_shards, shard_index):
+    # Journal local de la máquina que corre el shard (SQLite en WAL no va sobre filesystems de red)
+    return journal_path(f"{run_id}_shard_{shard_index:04d}_of_{num_shards:04d}")
+
+
+def parse_cpus(value):
+    """"0-3,8" -> {0, 1, 2, 3, 8}."""
+    cpus = set()
+    for part in value.split(","):
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def pin_cpus(cpus=INFERENCE_CPUS):
+    """Fija el proceso a cpus ("0-3,8") si se indicó; devuelve las CPUs en las que puede correr."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, parse_cpus(cpus))
+    return available_cpus()
+
+
+def shard_parallelism(n_cpus):
+    """(threads de torch, workers del DataLoader) para un shard con n_cpus: un worker cada 4 CPUs, el resto para torch."""
+    num_workers = n_cpus // 4
+    return max(1, n_cpus - num_workers), num_workers
+
+
+def read_shard(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def require_run_id(run_id):
+    # default_run_id depende de los paths y fechas de cada máquina: shards de
+    # distintas máquinas con el id por defecto nunca se unirían
+    if not run_id:
+        raise ValueError("run_id is required for a single shard or a merge (the same on every machine)")
+
+
+def run_shard(images_dir, num_shards, shard_index, run_dir=None, engine=ENGINE, server_url=INFERENCE_SERVER_URL,
+              run_id=RUN_ID):
+    """
+    Clasifica las imágenes de un shard; se puede correr en distintas máquinas
+    con el mismo run_dir y run_id. Los resultados van a un journal local por
+    run_id e índice de shard (un proceso caído retoma desde ahí) y al terminar
+    se exporta el CSV del shard a run_dir.
+    """
+    require_run_id(run_id)
+    cpus = pin_cpus()
+    threads, num_workers = shard_parallelism(len(cpus))
+
+    run_dir = run_dir or shards_dir(run_id)
+    os.makedirs(run_dir, exist_ok=True)
+
+    image_files = shard_files(list_images(images_dir), num_shards, shard_index)
+
+    with InferenceJournal(shard_journal_path(run_id, num_shards, shard_index)) as journal:
+        remaining = journal.pending(image_files)
+
+        print(
+            f"Shard {shard_index}/{num_shards}: {len(image_files)} images, {len(remaining)} remaining "
+            f"({len(cpus)} CPUs: {threads} torch threads, {num_workers} loader workers)"
+        )
+
+        predictions = make_predictions(images_dir, remaining, engine, server_url, threads=threads, num_workers=num_workers)
+        record_predictions(journal, predictions)
+
+        csv_path = journal.export_csv(
+            shard_csv_path(run_dir, num_shards, shard_index), order=image_files, fieldnames=FIELDNAMES
+        )
+
+    # Marca de shard completo para el merge
+    with open(shard_done_path(run_dir, num_shards, shard_index), "w", encoding="utf-8") as f:
+        f.write(f"{len(image_files)}\n")
+
+    return csv_path
+
+
+def merge_shards(images_dir, num_shards, run_dir=None, engine=ENGINE, run_id=RUN_ID):
+    """
+    Une los CSV de los shards en el CSV de la corrida (run_paths) con el mismo
+    orden que inference() (numérico por nombre de archivo) y genera el CSV de
+    Fire y la copia de imágenes. Falla si falta algún shard.
+    """
+    require_run_id(run_id)
+    run_dir = run_dir or shards_dir(run_id)
+
+    missing = [i for i in range(num_shards) if not os.path.exists(shard_done_path(run_dir, num_shards, i))]
+    if missing:
+        raise RuntimeError(f"Shards not finished in {run_dir}: {missing}")
+
+    rows = {}
+    for i in range(num_shards):
+        for row in read_shard(shard_csv_path(run_dir, num_shards, i)):
+            rows[row["filename"]] = row
+
+    order = {fname: i for i, fname in enumerate(list_images(images_dir))}
+    merged = sorted(rows.values(), key=lambda row: (order.get(row["filename"], len(order)), row["filename"]))
+
+    paths = run_paths(run_id)
+    os.makedirs(paths["output_dir"], exist_ok=True)
+
+    with open(paths["csv"], mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(merged)
+
+    print(f"Merged {len(merged)} predictions from {num_shards} shards: {paths['csv']}")
+
+    copy_fire_images(images_dir, paths)
+
+    return paths["output_dir"]
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cpus(num_workers):
+    """Reparte las CPUs disponibles en num_workers grupos disjuntos y contiguos."""
+    cpus = available_cpus()
+    per_worker = max(1, len(cpus) // num_workers)
+    return [cpus[(i * per_worker) % len(cpus):][:per_worker] for i in range(num_workers)]
+
+
+def inference_sharded(images_dir=IMAGES_DIR, num_workers=None, run_dir=None, engine=ENGINE, run_id=RUN_ID):
+    """
+    Modo multiproceso en una máquina: un proceso por shard, cada uno fijado a
+    su propio grupo de CPUs, y merge al final. Relanzar la misma corrida
+    retoma los shards desde sus journals.
+    """
+    num_workers = num_workers or max(1, len(available_cpus()) // 4)
+    run_id = run_id or default_run_id(images_dir, engine)
+    run_dir = run_dir or shards_dir(run_id)
+
+    processes = []
+    for shard_index, cpus in enumerate(split_cpus(num_workers)):
+        # Threads y workers del DataLoader los deriva cada shard de sus CPUs (shard_parallelism)
+        env = dict(os.environ, INFERENCE_CPUS=",".join(map(str, cpus)), INFERENCE_INTEROP_THREADS="1")
+        cmd = [
+            sys.executable, os.path.abspath(__file__),
+            "--images_dir", images_dir, "--engine", engine, "--run_dir", run_dir, "--run_id", run_id,
+            "--num_shards", str(num_workers), "--shard_index", str(shard_index),
+        ]
+        processes.append(subprocess.Popen(cmd, env=env))
+
+    failed = [i for i, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Inference shards failed: {failed} (rerun to resume them)")
+
+    return merge_shards(images_dir, num_workers, run_dir, engine, run_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded fire classification across processes or machines.")
+    parser.add_argument("--images_dir", type=str, default=IMAGES_DIR)
+    parser.add_argument("--engine", type=str, default=ENGINE, choices=ENGINES)
+    parser.add_argument("--num_shards", type=int, default=None, help="Total shards (default: one per 4 CPUs)")
+    parser.add_argument(
+        "--shard_index", type=int, default=None,
+        help="Run only this shard (one per machine); without it all shards run locally and are merged"
+    )
+    parser.add_argument(
+        "--run_dir", type=str, default=None,
+        help="Directory shared by the shards of a run (default: data/inference_shards_<run id>)"
+    )
+    parser.add_argument(
+        "--run_id", type=str, default=RUN_ID,
+        help="Run identifier, the same on every machine; required with --shard_index and --merge "
+             "(default for a local run: a hash of the images, model and engine)"
+    )
+    parser.add_argument("--merge", action="store_true", help="Only merge finished shards from --run_dir")
+    args = parser.parse_args()
+
+    if (args.merge or args.shard_index is not None) and not args.num_shards:
+        parser.error("--num_shards is required with --shard_index and --merge")
+    if (args.merge or args.shard_index is not None) and not args.run_id:
+        parser.error("--run_id (or INFERENCE_RUN_ID) is required with --shard_index and --merge")
+
+    if args.merge:
+        merge_shards(args.images_dir, args.num_shards, args.run_dir, args.engine, args.run_id)
+    elif args.shard_index is not None:
+        run_shard(args.images_dir, args.num_shards, args.shard_index, args.run_dir, args.engine, run_id=args.run_id)
+    else:
+        inference_sharded(args.images_dir, args.num_shards, args.run_dir, args.engine, args.run_id)
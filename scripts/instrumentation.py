@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import random
+import threading
+import functools
+from datetime import datetime
+from contextlib import contextmanager
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+RUN_REPORTS_DIR = os.getenv("RUN_REPORTS_DIR", "data/run_reports")
+
+# Escribe también un .prom con el formato de texto de Prometheus
+PROMETHEUS_REPORT = os.getenv("PROMETHEUS_REPORT", "0") == "1"
+
+# Límites (segundos) de los buckets de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float("inf"))
+
+# Muestras que se guardan por etapa para calcular p50/p99
+MAX_SAMPLES = 10000
+
+
+class Histogram:
+    """Histograma de latencias con buckets fijos y un reservoir para cuantiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            j = random.randrange(self.count)
+            if j < MAX_SAMPLES:
+                self.samples[j] = value
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_s": self.sum,
+            "mean_s": self.sum / self.count if self.count else None,
+            "p50_s": self.quantile(0.5),
+            "p99_s": self.quantile(0.99),
+            "max_s": self.max,
+        }
+
+
+class Registry:
+    """Spans, contadores e histogramas de un proceso; thread-safe."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def span(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def timed(self, name):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self):
+        with self.lock:
+            wall_s = time.time() - self.started
+            stages = {name: h.summary() for name, h in self.histograms.items()}
+            counters = dict(self.counters)
+
+        # Throughput de los contadores de items (ej. images, tiles, alerts)
+        throughput = {
+            f"{name}_per_s": value / wall_s
+            for name, value in counters.items() if wall_s > 0
+        }
+
+        return {
+            "started_utc": datetime.utcfromtimestamp(self.started).strftime("%Y-%m-%d %H:%M:%S"),
+            "wall_s": wall_s,
+            "counters": counters,
+            "throughput": throughput,
+            "stages": stages,
+        }
+
+    def prometheus_text(self, prefix="wildfire"):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+
+            for name, h in sorted(self.histograms.items()):
+                metric = f"{prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+                lines.append(f"{metric}_sum {h.sum}")
+                lines.append(f"{metric}_count {h.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, run_name, output_dir=RUN_REPORTS_DIR, prometheus=PROMETHEUS_REPORT):
+        """Guarda el reporte JSON de la corrida (y el .prom opcional); devuelve el path del JSON."""
+        os.makedirs(output_dir, exist_ok=True)
+
+        stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(output_dir, f"{run_name}_{stamp}.json")
+
+        report = {"run": run_name, **self.report()}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        if prometheus:
+            with open(path[:-len(".json")] + ".prom", "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+
+        print_report(report)
+        print(f"Run report written: {path}")
+
+        return path
+
+
+def print_report(report):
+    print(f"{'stage':<24}{'count':>8}{'total':>10}{'p50':>10}{'p99':>10}")
+    for name, stage in sorted(report["stages"].items(), key=lambda item: -item[1]["total_s"]):
+        print(
+            f"{name:<24}{stage['count']:>8}{stage['total_s']:>9.2f}s"
+            f"{stage['p50_s'] * 1000:>8.1f}ms{stage['p99_s'] * 1000:>8.1f}ms"
+        )
+    for name, value in sorted(report["counters"].items()):
+        print(f"{name:<24}{value:>12g}")
+
+
+REGISTRY = Registry()
+
+count = REGISTRY.count
+observe = REGISTRY.observe
+span = REGISTRY.span
+timed = REGISTRY.timed
+write_report = REGISTRY.write_report
+
+
+def test():
+    import tempfile
+
+    registry = Registry()
+
+    @registry.timed("work")
+    def work():
+        time.sleep(0.001)
+
+    for _ in range(20):
+        work()
+        registry.count("images", 8)
+        registry.count("bytes_downloaded", 1024)
+
+    with registry.span("write_csv"):
+        time.sleep(0.002)
+
+    report = registry.report()
+    assert report["stages"]["work"]["count"] == 20
+    assert report["counters"]["images"] == 160
+
+    text = registry.prometheus_text()
+    assert 'wildfire_work_seconds_bucket{le="+Inf"} 20' in text
+
+    with tempfile.TemporaryDirectory() as tmp:
+        registry.write_report("test", output_dir=tmp, prometheus=True)
+
+
+if __name__ == "__main__":
+    test()
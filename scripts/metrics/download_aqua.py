@@ -11,7 +11,7 @@ ee.Initialize(project="cellular-retina-276416")
 load_dotenv(".env")
 BUCKET = os.getenv("BUCKET_NAME")
 
-def export_modis_aqua_rgb():
+def start_modis_aqua_rgb_export():
     
     # --- DATE RANGE: last 30 days ---
     end = datetime.date.today()
@@ -52,14 +52,22 @@ def export_modis_aqua_rgb():
     )
 
     task.start()
-    print("RGB Export started… waiting for completion.")
+    print("RGB Export started.")
+
+    gcs_path = f"gs://{BUCKET}/{prefix}.tif"
+
+    return task, gcs_path
+
+
+def export_modis_aqua_rgb():
+    task, gcs_path = start_modis_aqua_rgb_export()
+    print("Waiting for completion…")
 
     success = wait_for_task(task)
 
     if not success:
         return None
 
-    gcs_path = f"gs://{BUCKET}/{prefix}.tif"
     print("Export completed:", gcs_path)
     return gcs_path
 
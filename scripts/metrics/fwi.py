@@ -12,7 +12,7 @@ ee.Initialize(project="cellular-retina-276416")
 load_dotenv(".env")
 BUCKET = os.getenv("BUCKET_NAME")
 
-def fwi():
+def start_fwi_export():
 
     obs = datetime.date.today() - datetime.timedelta(days=1)
     timezone = 'America/Montevideo'
@@ -50,14 +50,22 @@ def fwi():
     )
 
     task.start()
+    print("FWI export started.")
+
+    gcs_path = f"gs://{BUCKET}/{file_name}.tif"
+
+    return task, gcs_path
+
+
+def fwi():
+    task, gcs_path = start_fwi_export()
+    print("Waiting for completion…")
 
-    print("FWI export started… waiting for completion.")
     success = wait_for_task(task)
 
     if not success:
         return None
 
-    gcs_path = f"gs://{BUCKET}/{file_name}.tif"
     print("Export completed:", gcs_path)
     return gcs_path
 
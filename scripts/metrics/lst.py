@@ -11,7 +11,7 @@ ee.Initialize(project="cellular-retina-276416")
 load_dotenv(".env")
 BUCKET = os.getenv("BUCKET_NAME")
 
-def download_modis_lst():
+def start_lst_export():
 
     # --- DATE RANGE: LAST 1 DAY ---
     end = datetime.date.today()
@@ -53,14 +53,22 @@ def download_modis_lst():
     )
 
     task.start()
-    print("Export started… waiting for completion.")
+    print("LST export started.")
+
+    gcs_path = f"gs://{BUCKET}/{prefix}.tif"
+
+    return task, gcs_path
+
+
+def download_modis_lst():
+    task, gcs_path = start_lst_export()
+    print("Waiting for completion…")
 
     success = wait_for_task(task)
 
     if not success:
         return None
 
-    gcs_path = f"gs://{BUCKET}/{prefix}.tif"
     print("Export completed:", gcs_path)
     return gcs_path
 
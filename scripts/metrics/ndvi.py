@@ -10,7 +10,7 @@ ee.Initialize(project="cellular-retina-276416")
 load_dotenv(".env")
 BUCKET = os.getenv("BUCKET_NAME")
 
-def ndvi():
+def start_ndvi_export():
 
     end = datetime.date.today()
     start = end - datetime.timedelta(days=7)
@@ -44,13 +44,22 @@ def ndvi():
     )
 
     task.start()
-    print("NDVI export started… waiting for completion.")
+    print("NDVI export started.")
+
+    gcs_path = f"gs://{BUCKET}/{file_name}.tif"
+
+    return task, gcs_path
+
+
+def ndvi():
+    task, gcs_path = start_ndvi_export()
+    print("Waiting for completion…")
+
     success = wait_for_task(task)
 
     if not success:
         return None
 
-    gcs_path = f"gs://{BUCKET}/{file_name}.tif"
     print("Export completed:", gcs_path)
     return gcs_path
 
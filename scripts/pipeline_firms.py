@@ -2,34 +2,70 @@ import os
 import tqdm
 import pandas as pd
 from datetime import datetime
-from inference import inference
-from firms_alerts import firms_alerts_by_dates
-from image_from_coordinates import download_image_from_coordinates
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from inference import inference, default_run_id, run_paths, date_now
+from firms_alerts import firms_alerts_table
+from downloader import iter_downloads
+from thumb_cache import get_thumb_cache
+from alert_export import write_geojson, write_kml
+from instrumentation import count, span, write_report
+from firms_clusters import ALERTS_CLUSTERS_CSV, cluster_representatives, fan_out_predictions
+from image_from_coordinates import download_image_from_coordinates, copy_png_to_gcs, resolve_images_for_alerts, png_download_for_image
+
+# Sensores FIRMS a consultar: "NOAA21", "MODIS,NOAA20,NOAA21,SUOMI" o "all"
+FIRMS_SENSORS = os.getenv("FIRMS_SENSORS", "NOAA21")
+FIRMS_SENSORS = FIRMS_SENSORS if FIRMS_SENSORS == "all" else FIRMS_SENSORS.split(",")
 
 def get_datetime_from_firms_row(row):
     
     acq_date = row['acq_date']
     acq_time = str(row['acq_time']).zfill(4)
-    firms_datetime = f"{acq_date}T{acq_time[:2]}{acq_time[2:]}:00"
+    firms_datetime = f"{acq_date}T{acq_time[:2]}:{acq_time[2:]}:00"
 
     return firms_datetime
 
-def download_images_for_firms_alerts_parallel(alerts):
+def download_images_for_firms_alerts_parallel(alerts, copy_to_gcs=True, cluster=True):
+    """
+    Descarga una imagen por alerta o, con cluster=True, una por cluster de
+    alertas cercanas en espacio y tiempo (ver firms_clusters.py). La tabla
+    alerta -> imagen queda en output_dir/ALERTS_CLUSTERS_CSV.
+    """
     output_dir = f"./data/wildfire_rgb_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
     os.makedirs(output_dir, exist_ok=True)
-    
-    args_list = [(row['latitude'], row['longitude'], get_datetime_from_firms_row(row), output_dir) for _, row in alerts.iterrows()]
 
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = [executor.submit(download_image_from_coordinates, *args) for args in args_list]
+    if cluster:
+        alerts, requests = cluster_representatives(alerts)
+    else:
+        alerts = alerts.reset_index(drop=True).copy()
+        alerts["cluster_id"] = alerts.index
+        requests = alerts
+
+    # Las imágenes de todas las alertas se eligen en lote (un getInfo por
+    # página); solo la URL del thumbnail y la descarga quedan por alerta
+    requests = requests.assign(firms_datetime=[get_datetime_from_firms_row(row) for _, row in requests.iterrows()])
+    images = resolve_images_for_alerts(requests)
+
+    jobs = [
+        {"key": cluster_id, **png_download_for_image(lat, lon, image_meta, output_dir)}
+        for cluster_id, lat, lon, image_meta in zip(requests['cluster_id'], requests['latitude'], requests['longitude'], images)
+        if image_meta is not None
+    ]
+
+    image_names = {}
+
+    for result in tqdm.tqdm(iter_downloads(jobs, cache=get_thumb_cache()), total=len(jobs), desc="Downloading images"):
+        if result["error"]:
+            print(f"Error downloading image for cluster {result['key']}: {result['error']}")
+            continue
+
+        image_names[result["key"]] = os.path.basename(result["path"])
 
-        for future in as_completed(futures):
-            try:
-                future.result()
-            except Exception as e:
-                print(f"Error downloading image: {e}")
+    # Una sola subida en lote para todas las imágenes
+    if copy_to_gcs and image_names:
+        copy_png_to_gcs([os.path.join(output_dir, name) for name in image_names.values()])
+
+    alerts["image_name"] = alerts["cluster_id"].map(image_names)
+    alerts.to_csv(os.path.join(output_dir, ALERTS_CLUSTERS_CSV), index=False)
 
     return output_dir
 
@@ -63,20 +99,37 @@ def firms_pipeline():
 
     #dates = ["today", "yesterday"]
 
-    firms_files = firms_alerts_by_dates(dates)
+    with span("stage_firms_download"):
+        all_alerts = firms_alerts_table(dates, sensor=FIRMS_SENSORS)
+    count("alerts", len(all_alerts))
 
-    dfs = [pd.read_csv(f) for f in firms_files]
+    with span("stage_image_download"):
+        images_dir = download_images_for_firms_alerts_parallel(all_alerts)
 
-    all_alerts = pd.concat(dfs, ignore_index=True)
+    print(f"Images downloaded to: {images_dir}")
 
-    images_dir = download_images_for_firms_alerts_parallel(all_alerts)
+    # Id estable por directorio de imágenes: relanzar tras una caída retoma la inferencia
+    run_id = default_run_id(images_dir)
+    predictions = run_paths(run_id)
 
-    print(f"Images downloaded to: {images_dir}")
+    with span("stage_inference"):
+        inferences_path = inference(images_dir=images_dir, run_id=run_id)
 
-    inferences_path = inference(images_dir=images_dir)
+    # Cada alerta hereda la predicción de la imagen de su cluster
+    with span("stage_export"):
+        alerts_predictions = fan_out_predictions(
+            os.path.join(images_dir, ALERTS_CLUSTERS_CSV),
+            predictions["csv"],
+            os.path.join(predictions["output_dir"], f"alerts_predictions_{date_now}.csv"),
+        )
+
+        write_kml(alerts_predictions, alerts_predictions.replace(".csv", ".kml"))
+        write_geojson(alerts_predictions, alerts_predictions.replace(".csv", ".geojson"))
 
     print(f"Inferences saved at: {inferences_path}")
 
+    write_report("firms_pipeline")
+
 if __name__ == "__main__":
 
     firms_pipeline()
\ No newline at end of file
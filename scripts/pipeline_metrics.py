@@ -1,38 +1,121 @@
 import os
-from metrics.fwi import fwi
-from metrics.ndvi import ndvi
-from metrics.lst import download_modis_lst
-from utils import move_data_from_gcs_to_local
-from metrics.download_aqua import export_modis_aqua_rgb
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from metrics.fwi import start_fwi_export
+from metrics.ndvi import start_ndvi_export
+from metrics.lst import start_lst_export
+from utils import get_task_monitor, move_data_from_gcs_to_local
+from instrumentation import observe, write_report
+from metrics.download_aqua import start_modis_aqua_rgb_export
 
-def pipeline_metrics():
+METRIC_EXPORTS = {
+    "FWI": start_fwi_export,
+    "NDVI": start_ndvi_export,
+    "LST": start_lst_export,
+    "MODIS AQUA RGB": start_modis_aqua_rgb_export,
+}
 
-    gcs_paths = []
+def submit_exports(exports):
+    """Arranca todos los exports a la vez; devuelve {nombre: timing} con task y gcs_path."""
+    timings = {}
 
-    print("Starting data exports to GCS bucket...")
-    
-    fwi_path = fwi()
-    gcs_paths.append(fwi_path)
-    print("FWI exported to:", fwi_path)
-    
-    ndvi_path = ndvi()
-    gcs_paths.append(ndvi_path)
-    print("NDVI exported to:", ndvi_path)
-    
-    lst_path = download_modis_lst()
-    gcs_paths.append(lst_path)
-    print("LST exported to:", lst_path)
-    
-    aqua_rgb_path = export_modis_aqua_rgb()
-    gcs_paths.append(aqua_rgb_path)
-    print("MODIS AQUA RGB exported to:", aqua_rgb_path)
-    
-    print("All exports completed.")
-
-    local_dir = "data"
+    def submit(name):
+        t0 = time.monotonic()
+        try:
+            started = exports[name]()
+        except Exception as e:
+            print(f"{name} export could not be started: {e}")
+            started = None
+
+        timing = {"name": name, "task": None, "gcs_path": None, "submitted": time.monotonic(), "submit_s": time.monotonic() - t0}
+        if started is not None:
+            timing["task"], timing["gcs_path"] = started
+        return timing
+
+    # La construcción del grafo de EE (ej. FWI) también se hace en paralelo
+    with ThreadPoolExecutor(max_workers=len(exports)) as executor:
+        for timing in executor.map(submit, exports):
+            timings[timing["name"]] = timing
+
+    return timings
+
+def run_exports(exports=METRIC_EXPORTS, local_dir="data"):
+    """
+    Envía todos los exports, los sigue juntos con el TaskMonitor y baja cada
+    resultado de GCS apenas su task termina. Devuelve {nombre: timing} con
+    los tiempos de submit, export y descarga de cada uno.
+    """
     os.makedirs(local_dir, exist_ok=True)
-    move_data_from_gcs_to_local(gcs_paths, local_dir)
+
+    t0 = time.monotonic()
+    timings = submit_exports(exports)
+
+    monitor = get_task_monitor()
+    downloads = {}
+
+    with ThreadPoolExecutor(max_workers=len(exports)) as download_pool:
+
+        def download(name):
+            start = time.monotonic()
+            move_data_from_gcs_to_local([timings[name]["gcs_path"]], local_dir)
+            timings[name]["download_s"] = time.monotonic() - start
+            observe("metric_download", timings[name]["download_s"])
+
+        futures = {
+            monitor.watch(timing["task"]): name
+            for name, timing in timings.items() if timing["task"] is not None
+        }
+
+        for future in as_completed(futures):
+            name = futures[future]
+            status = future.result()
+            timings[name]["state"] = status["state"]
+            timings[name]["export_s"] = time.monotonic() - timings[name]["submitted"]
+            observe("metric_export", timings[name]["export_s"])
+
+            if status["state"] == "COMPLETED":
+                print(f"{name} exported to: {timings[name]['gcs_path']}")
+                downloads[download_pool.submit(download, name)] = name
+            else:
+                timings[name]["error"] = status.get("error_message")
+                print(f"{name} export failed:", status.get("error_message"))
+
+        # Una descarga que falla no corta las demás ni el reporte
+        for future, name in downloads.items():
+            try:
+                future.result()
+            except Exception as e:
+                timings[name]["state"] = "DOWNLOAD_FAILED"
+                timings[name]["error"] = str(e)
+                print(f"{name} download failed: {e}")
+
+    print_timings(timings, time.monotonic() - t0)
+
+    return timings
+
+def print_timings(timings, total_s):
+    def seconds(value):
+        return f"{value:.1f}s" if value is not None else "-"
+
+    print(f"{'export':<16}{'state':<16}{'submit':>8}{'export':>8}{'download':>10}")
+    for name, timing in timings.items():
+        print(
+            f"{name:<16}{timing.get('state', 'NOT_STARTED'):<16}"
+            f"{seconds(timing['submit_s']):>8}{seconds(timing.get('export_s')):>8}{seconds(timing.get('download_s')):>10}"
+        )
+    print(f"Total wall time: {total_s:.1f}s")
+
+def pipeline_metrics():
+
+    print("Starting data exports to GCS bucket...")
+
+    timings = run_exports(METRIC_EXPORTS, local_dir="data")
+
+    completed = [name for name, timing in timings.items() if timing.get("state") == "COMPLETED"]
+    print(f"All exports completed ({len(completed)}/{len(timings)} succeeded).")
+
+    write_report("metrics")
 
 if __name__ == "__main__":
 
-    pipeline_metrics()
\ No newline at end of file
+    pipeline_metrics()
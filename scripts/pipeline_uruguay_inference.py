@@ -1,11 +1,23 @@
 import os
 import shutil
-from inference import inference
-from uruguay_tiles import get_uruguay_tiles
+from inference import inference, inference_stream, run_paths
+from inference_journal import InferenceJournal
+from uruguay_tiles import (
+    get_uruguay_tiles, stream_uruguay_tiles, plan_tile_downloads, scan_run_id, tiles_dir, metadata_csv_path,
+    tile_file_name, STATE_PATH as SCAN_STATE_PATH
+)
+from scan_state import update_scan_state
 from utils import move_data_from_local_to_gcs
+from instrumentation import span, write_report
 
 OUTPUT_BUCKET_PATH = "gs://wildfires_data_um/inferences"
 
+# Clasifica los tiles en memoria a medida que se descargan (solo se guardan los Fire)
+STREAM_TILES = os.getenv("STREAM_TILES", "0") == "1"
+
+# Solo descarga y clasifica tiles con imágenes nuevas desde el último escaneo
+INCREMENTAL_SCAN = os.getenv("INCREMENTAL_SCAN", "0") == "1"
+
 def delete_local_files(paths):
     for path in paths:
         if not os.path.exists(path):
@@ -20,17 +32,120 @@ def delete_local_files(paths):
             shutil.rmtree(path)
             print(f"Deleted directory: {path}")
 
-def inference_pipeline():
+def inference_pipeline(streaming=STREAM_TILES, incremental=INCREMENTAL_SCAN, max_tiles=None):
+
+    with span("stage_tile_plan"):
+        downloads = plan_tile_downloads(max_tiles=max_tiles, incremental=incremental)
+
+    # El id sale de los tiles e imágenes a procesar: si la corrida se corta,
+    # relanzarla retoma el mismo directorio de tiles y el mismo journal
+    run_id = scan_run_id(downloads, incremental)
+    tiles_path = tiles_dir(run_id)
+    print(f"Scan run {run_id}: {len(downloads)} tiles")
+
+    if streaming:
+        # Los tiles ya clasificados en el journal de esta corrida no se vuelven a bajar
+        file_names = [tile_file_name(tile) for tile, _ in downloads]
+        with InferenceJournal(run_paths(run_id)["journal"]) as journal:
+            classified = set(file_names) - set(journal.pending(file_names))
 
-    tiles_path=get_uruguay_tiles()
-    
-    inferences_path = inference(images_dir=tiles_path)
+        with span("stage_tiles_and_inference"):
+            tiles = stream_uruguay_tiles(downloads=downloads, tiles_path=tiles_path, skip=classified)
+            inferences_path = inference_stream(tiles, run_id=run_id)
+    else:
+        with span("stage_tiles"):
+            get_uruguay_tiles(downloads=downloads, tiles_path=tiles_path)
+        with span("stage_inference"):
+            inferences_path = inference(images_dir=tiles_path, run_id=run_id)
 
-    gcs_output_path = move_data_from_local_to_gcs(inferences_path, OUTPUT_BUCKET_PATH)
+    # Tabla nacional con la última predicción por tile (base del próximo escaneo incremental)
+    update_scan_state(metadata_csv_path(tiles_path), run_paths(run_id)["csv"], SCAN_STATE_PATH)
+
+    with span("stage_gcs_upload"):
+        gcs_output_path = move_data_from_local_to_gcs(inferences_path, OUTPUT_BUCKET_PATH)
 
     print(f"Inferences saved at: {gcs_output_path}")
 
-    delete_local_files([tiles_path, inferences_path])
+    # Corrida terminada: sin journal, el próximo escaneo con el mismo id empieza de cero
+    delete_local_files([tiles_path, inferences_path, run_paths(run_id)["journal"]])
+
+    write_report("uruguay_inference")
+
+def test(n_tiles=10):
+    """
+    Mata el pipeline (en un proceso con el `ee` falso de benchmarks/) con la
+    inferencia a medio hacer y lo relanza: debe retomar el mismo escaneo y
+    terminar con cada tile clasificado una sola vez.
+    """
+    import sys
+    import csv
+    import glob
+    import time
+    import signal
+    import tempfile
+    import subprocess
+
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    benchmarks_dir = os.path.join(scripts_dir, "benchmarks")
+    sys.path.insert(0, benchmarks_dir)
+    from fake_servers import FakeServer
+    from inference import MODEL_PATH
+    from inference_journal import InferenceJournal
+
+    for streaming in (False, True):
+        with tempfile.TemporaryDirectory() as cwd, FakeServer(latency=0.01, thumb_size=256) as server:
+            os.makedirs(os.path.join(cwd, "models"))
+            os.symlink(os.path.abspath(MODEL_PATH), os.path.join(cwd, "models", "efficientnet"))
+
+            code = (
+                f"import sys; sys.path[:0] = [{scripts_dir!r}, {benchmarks_dir!r}]\n"
+                f"import fake_ee; fake_ee.install(latency=dict.fromkeys(fake_ee.LATENCY, 0), thumb_base_url={server.base_url!r})\n"
+                f"import pipeline_uruguay_inference as p; p.inference_pipeline(streaming={streaming}, max_tiles={n_tiles})\n"
+            )
+            cmd = [sys.executable, "-c", code]
+            env = dict(
+                os.environ, GCS_LOCAL_ROOT=os.path.join(cwd, "gcs"), THUMB_CACHE_MAX_GB="0",
+                INFERENCE_BATCH_SIZE="2", NUM_WORKERS="0", RUN_REPORTS_DIR=os.path.join(cwd, "reports"),
+            )
+            env.pop("INFERENCE_RUN_ID", None)
+
+            def journaled():
+                for path in glob.glob(os.path.join(cwd, "data", "inference_journal", "*.sqlite")):
+                    with InferenceJournal(path) as journal:
+                        return os.path.basename(path)[:-len(".sqlite")], len(journal)
+                return None, 0
+
+            # Primera corrida: se mata apenas el journal tiene algún batch
+            proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            while journaled()[1] == 0 and proc.poll() is None:
+                time.sleep(0.05)
+            proc.send_signal(signal.SIGKILL)
+            proc.wait()
+
+            run_id, done = journaled()
+            assert run_id and done > 0, "pipeline should have been killed during inference"
+
+            # Segunda corrida: mismo escaneo, mismo id, retoma el journal
+            proc = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, text=True)
+            assert proc.returncode == 0, proc.stderr[-2000:]
+            assert f"Resuming run {run_id}" in proc.stdout, proc.stdout[-2000:]
+            if streaming:
+                assert f"Skipping {done} tiles already classified" in proc.stdout, proc.stdout[-2000:]
+
+            uploaded = os.path.join(cwd, "gcs", "wildfires_data_um", "inferences", f"predictions_fire_images_{run_id}", f"predictions_{run_id}.csv")
+            with open(uploaded, newline="", encoding="utf-8") as f:
+                filenames = [row["filename"] for row in csv.DictReader(f)]
+            assert len(filenames) == len(set(filenames)) > done, (done, filenames)
+
+            with open(os.path.join(cwd, "data", "uruguay_scan_state_4km.csv"), newline="", encoding="utf-8") as f:
+                assert len(list(csv.DictReader(f))) == len(filenames)
+
+            # Corrida terminada: sin tiles ni journal locales
+            assert not glob.glob(os.path.join(cwd, "data", "uruguay_tiles_*"))
+            assert journaled() == (None, 0)
+
+            print(f"streaming={streaming}: killed after {done} tiles, resumed run {run_id} to {len(filenames)} tiles")
+
 
 if __name__ == "__main__":
     inference_pipeline()
\ No newline at end of file
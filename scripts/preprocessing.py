@@ -0,0 +1,136 @@
+import os
+import json
+import torch
+import numpy as np
+from PIL import Image
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+MODEL_PATH = "./models/efficientnet"
+
+PREPROCESSOR_CONFIG = "preprocessor_config.json"
+
+# PIL.Image.NEAREST; es el resample del preprocessor_config del modelo
+RESAMPLE_NEAREST = 0
+
+
+def load_preprocess_config(model_path=MODEL_PATH):
+    with open(os.path.join(model_path, PREPROCESSOR_CONFIG), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def nearest_indices(in_size, out_size):
+    # Igual que PIL NEAREST: centro de cada pixel de salida, acumulando el paso
+    # en float64 como hace PIL (cumsum es secuencial, reproduce el redondeo)
+    step = in_size / out_size
+    coords = np.full(out_size, step)
+    coords[0] = step * 0.5
+    idx = np.floor(np.cumsum(coords)).astype(np.intp)
+    return np.minimum(idx, in_size - 1)
+
+
+class BatchPreprocessor:
+    """
+    Reemplazo vectorizado de EfficientNetImageProcessor.
+
+    Lee resize/rescale/normalize del preprocessor_config.json una única vez.
+    `resize` trabaja en uint8 (se ejecuta en los workers de decodificación) y
+    `normalize` aplica rescale + normalize al batch completo en una sola
+    operación uint8 -> float32 sobre un buffer preasignado.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, batch_size=8):
+        config = load_preprocess_config(model_path)
+
+        if config.get("do_center_crop"):
+            raise ValueError("Center crop is not supported by BatchPreprocessor")
+        if config.get("rescale_offset"):
+            raise ValueError("rescale_offset is not supported by BatchPreprocessor")
+
+        self.do_resize = config.get("do_resize", True)
+        self.height = config["size"]["height"]
+        self.width = config["size"]["width"]
+        self.resample = config.get("resample", RESAMPLE_NEAREST)
+
+        rescale = config["rescale_factor"] if config.get("do_rescale", True) else 1.0
+        mean = np.asarray(config["image_mean"], dtype=np.float64)
+        std = np.asarray(config["image_std"], dtype=np.float64)
+
+        if not config.get("do_normalize", True):
+            mean, std = np.zeros(3), np.ones(3)
+        elif config.get("include_top", False):
+            # EfficientNet vuelve a dividir por std cuando include_top=True
+            std = std * std
+
+        # ((x * rescale) - mean) / std  ==  x * scale - shift
+        self.scale = torch.tensor(rescale / std, dtype=torch.float32).view(1, 3, 1, 1)
+        self.shift = torch.tensor(mean / std, dtype=torch.float32).view(1, 3, 1, 1)
+
+        self._indices = {}
+        self._buffer = torch.empty((batch_size, 3, self.height, self.width), dtype=torch.float32)
+
+    def resize(self, img):
+        """Imagen PIL -> array uint8 (H, W, 3) con el tamaño del modelo."""
+        img = img.convert("RGB")
+
+        if not self.do_resize or img.size == (self.width, self.height):
+            return np.asarray(img)
+
+        if self.resample != RESAMPLE_NEAREST:
+            return np.asarray(img.resize((self.width, self.height), resample=self.resample))
+
+        arr = np.asarray(img)
+        key = arr.shape[:2]
+        if key not in self._indices:
+            self._indices[key] = (
+                nearest_indices(key[0], self.height)[:, None],
+                nearest_indices(key[1], self.width)[None, :],
+            )
+        rows, cols = self._indices[key]
+        return arr[rows, cols]
+
+    def normalize(self, batch):
+        """Tensor uint8 (N, H, W, 3) -> tensor float32 (N, 3, H, W) normalizado."""
+        n = batch.shape[0]
+        if n > self._buffer.shape[0]:
+            self._buffer = torch.empty((n, 3, self.height, self.width), dtype=torch.float32)
+
+        out = self._buffer[:n]
+        out.copy_(batch.permute(0, 3, 1, 2))
+        out.mul_(self.scale).sub_(self.shift)
+        return out
+
+    def __call__(self, images):
+        batch = torch.from_numpy(np.stack([self.resize(img) for img in images]))
+        return self.normalize(batch)
+
+
+def test(model_path=MODEL_PATH, n_images=4):
+    """Compara la salida contra AutoImageProcessor sobre imágenes sintéticas."""
+    from transformers import AutoImageProcessor
+
+    processor = AutoImageProcessor.from_pretrained(model_path)
+    preprocessor = BatchPreprocessor(model_path, batch_size=n_images)
+
+    rng = np.random.default_rng(0)
+    sizes = [(1024, 1024), (401, 399), (380, 380), (200, 250)]
+    images = [
+        Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+        for h, w in sizes[:n_images]
+    ]
+
+    expected = processor(images=images, return_tensors="pt")["pixel_values"]
+    actual = preprocessor(images)
+
+    max_diff = (expected - actual).abs().max().item()
+    print(f"Max abs diff vs {type(processor).__name__}: {max_diff:.2e}")
+    assert actual.shape == expected.shape, (actual.shape, expected.shape)
+    assert max_diff < 1e-4, max_diff
+    print("Parity OK")
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,109 @@
+import os
+import csv
+from datetime import datetime
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# Tabla con la última imagen procesada y la última predicción de cada tile;
+# una por tamaño de grilla, porque el mismo tile_id es otro tile en otra grilla
+STATE_DIR = os.getenv("SCAN_STATE_DIR", "data")
+
+STATE_FIELDS = [
+    "tile_id",
+    "image_id",
+    "timestamp_utc",
+    "lon_center",
+    "lat_center",
+    "prediction",
+    "confidence",
+    "prob_fire",
+    "prob_no_fire",
+    "updated_utc",
+]
+
+
+def scan_state_path(grid_size_km, state_dir=STATE_DIR):
+    return os.path.join(state_dir, f"uruguay_scan_state_{grid_size_km:g}km.csv")
+
+
+def load_scan_state(path):
+    """{tile_id: fila} con el estado del último escaneo; vacío si todavía no hay estado."""
+    state = {}
+    if os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                state[int(row["tile_id"])] = row
+    return state
+
+
+def save_scan_state(state, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=STATE_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for tile_id in sorted(state):
+            writer.writerow(state[tile_id])
+    os.replace(tmp_path, path)
+
+
+def changed_downloads(downloads, state):
+    """Filtra [(tile, image_meta)] a los tiles cuya imagen más reciente no fue procesada aún."""
+    changed = [
+        (tile, image_meta) for tile, image_meta in downloads
+        if state.get(int(tile["tile_id"]), {}).get("image_id") != image_meta["image_id"]
+    ]
+
+    print(f"Incremental scan: {len(changed)} tiles with new acquisitions, {len(downloads) - len(changed)} unchanged")
+
+    return changed
+
+
+def update_scan_state(metadata_csv, predictions_csv, path):
+    """
+    Mezcla las predicciones de una corrida (metadata.csv de uruguay_tiles +
+    predictions_*.csv de inference) en la tabla nacional. Los tiles sin
+    predicción nueva conservan la anterior.
+    """
+    state = load_scan_state(path)
+
+    predictions = {}
+    if os.path.exists(predictions_csv):
+        with open(predictions_csv, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                predictions[row["filename"]] = row
+
+    updated_utc = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    updated = 0
+
+    with open(metadata_csv, newline="", encoding="utf-8") as f:
+        for meta in csv.DictReader(f):
+            prediction = predictions.get(meta["image_name"])
+            if prediction is None:
+                continue
+
+            tile_id = int(meta["tile_id"])
+            state[tile_id] = {
+                "tile_id": tile_id,
+                "image_id": meta["image_id"],
+                "timestamp_utc": meta["timestamp_utc"],
+                "lon_center": meta["lon_center"],
+                "lat_center": meta["lat_center"],
+                "prediction": prediction["prediction"],
+                "confidence": prediction["confidence"],
+                "prob_fire": prediction["prob_fire"],
+                "prob_no_fire": prediction["prob_no_fire"],
+                "updated_utc": updated_utc,
+            }
+            updated += 1
+
+    save_scan_state(state, path)
+
+    fire = sum(1 for row in state.values() if row["prediction"] == "Fire")
+    print(f"Scan state updated: {updated} tiles refreshed, {len(state)} tiles tracked, {fire} currently Fire")
+
+    return path
@@ -0,0 +1,157 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+CACHE_DIR = os.getenv("THUMB_CACHE_DIR", "data/thumb_cache")
+
+# Tamaño máximo en disco; 0 desactiva el cache
+CACHE_MAX_GB = float(os.getenv("THUMB_CACHE_MAX_GB", "5"))
+
+
+def thumb_cache_key(image_id, region, **params):
+    """
+    Clave por contenido: misma imagen de EE + misma región + mismos parámetros
+    de visualización (dimensions/scale, bands, min, max, ...) => mismo thumbnail.
+    """
+    payload = {
+        "image_id": image_id,
+        "region": [round(float(v), 6) for v in region],
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ThumbCache:
+    """Cache en disco de thumbnails con desalojo LRU por tamaño y estadísticas de hit/miss."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=int(CACHE_MAX_GB * 1024 ** 3)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+
+        # mtime se actualiza en cada hit, así que ordenar por mtime da el orden LRU
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """Path del thumbnail cacheado o None."""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+
+            path = self._path(key)
+            if not os.path.exists(path):
+                self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        os.utime(path)
+        return path
+
+    def read(self, key):
+        path = self.get(key)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def copy_to(self, key, dst_path):
+        path = self.get(key)
+        if path is None:
+            return False
+        shutil.copyfile(path, dst_path)
+        return True
+
+    def put(self, key, content=None, src_path=None):
+        """Guarda bytes (content) o una copia de un archivo ya descargado (src_path)."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        if content is not None:
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+        else:
+            shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)
+            self.entries[key] = size
+            self.total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size_mb": self.total_bytes / 1024 ** 2,
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_thumb_cache():
+    """Cache compartido del proceso; None si THUMB_CACHE_MAX_GB=0."""
+    global _default_cache
+
+    if CACHE_MAX_GB <= 0:
+        return None
+
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ThumbCache()
+        return _default_cache
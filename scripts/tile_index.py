@@ -0,0 +1,80 @@
+import os
+import numpy as np
+
+
+# =========================
+# CONFIGURACIÓN
+# =========================
+
+# Cambiar la versión si cambia TILE_DTYPE; los índices viejos se regeneran
+TILE_INDEX_VERSION = 1
+
+TILE_DTYPE = np.dtype([
+    ("tile_id", "<i4"),
+    ("lon_min", "<f8"),
+    ("lat_min", "<f8"),
+    ("lon_max", "<f8"),
+    ("lat_max", "<f8"),
+    ("lon_center", "<f8"),
+    ("lat_center", "<f8"),
+])
+
+
+def tile_index_path(grid_size_km, data_dir="data"):
+    return os.path.join(data_dir, f"tiles_v{TILE_INDEX_VERSION}_{grid_size_km:g}km.npy")
+
+
+def build_tile_index(bounds):
+    """Array (N, 4) [lon_min, lat_min, lon_max, lat_max] -> array estructurado con TILE_DTYPE."""
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+
+    index = np.empty(len(bounds), dtype=TILE_DTYPE)
+    index["tile_id"] = np.arange(len(bounds))
+    index["lon_min"], index["lat_min"], index["lon_max"], index["lat_max"] = bounds.T
+    index["lon_center"] = (index["lon_min"] + index["lon_max"]) / 2
+    index["lat_center"] = (index["lat_min"] + index["lat_max"]) / 2
+
+    return index
+
+
+def save_tile_index(index, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # np.save agrega .npy si falta, así que el temporal ya lo lleva
+    tmp_path = path[:-len(".npy")] + ".tmp.npy"
+    np.save(tmp_path, index)
+    os.replace(tmp_path, path)
+
+
+def load_tile_index(path, mmap=True):
+    """Carga el índice (memory-mapped por defecto); None si no existe o es de otra versión."""
+    if not os.path.exists(path):
+        return None
+
+    index = np.load(path, mmap_mode="r" if mmap else None)
+
+    if index.dtype != TILE_DTYPE:
+        print(f"Tile index at {path} has an outdated format, ignoring it.")
+        return None
+
+    return index
+
+
+def query_bbox(index, lon_min, lat_min, lon_max, lat_max):
+    """Tiles que intersectan el bbox dado."""
+    mask = (
+        (index["lon_max"] >= lon_min) & (index["lon_min"] <= lon_max) &
+        (index["lat_max"] >= lat_min) & (index["lat_min"] <= lat_max)
+    )
+    return index[mask]
+
+
+def tile_bounds(tile):
+    return [float(tile["lon_min"]), float(tile["lat_min"]), float(tile["lon_max"]), float(tile["lat_max"])]
+
+
+def tile_geometry(tile):
+    """ee.Geometry del tile; se construye solo cuando hace falta consultar Earth Engine."""
+    import ee
+
+    return ee.Geometry.Rectangle(tile_bounds(tile), proj="EPSG:4326", geodesic=False)
@@ -1,13 +1,21 @@
 import os
 import ee
 import csv
+import hashlib
 import numpy as np
-import requests
-import pickle
 from tqdm import tqdm
 from dotenv import load_dotenv
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from utils import get_info_paged
+from downloader import iter_downloads
+from thumb_cache import get_thumb_cache, thumb_cache_key
+from scan_state import changed_downloads, load_scan_state, scan_state_path
+from instrumentation import count
+from tile_index import (
+    build_tile_index, load_tile_index, save_tile_index,
+    query_bbox, tile_bounds, tile_geometry, tile_index_path
+)
 
 
 ee.Authenticate()
@@ -15,17 +23,16 @@ ee.Initialize(project="cellular-retina-276416")
 
 load_dotenv(".env")
 
-GRID_SIZE_KM = 4
+GRID_SIZE_KM = float(os.getenv("GRID_SIZE_KM", "4"))
 GRID_SIZE_DEG = GRID_SIZE_KM / 111  # Aproximación
 
-DATA_DIR = f"data/uruguay_tiles_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-CSV_PATH = os.path.join(DATA_DIR, "metadata.csv")
-
-TILES_PATH = os.path.join("data", "tiles.pkl")
+# Cada escaneo descarga a DATA_DIR/uruguay_tiles_<scan_run_id> (ver tiles_dir)
+DATA_DIR = "data"
 
-MAX_THREADS = int(os.getenv("MAX_THREADS", "10"))
+TILES_PATH = tile_index_path(GRID_SIZE_KM)
+STATE_PATH = scan_state_path(GRID_SIZE_KM)
 
-os.makedirs(DATA_DIR, exist_ok=True)
+SENTINEL2_COLLECTION = "COPERNICUS/S2_SR_HARMONIZED"
 
 
 URUGUAY = (
@@ -34,195 +41,351 @@ URUGUAY = (
 )
 
 
-def init_csv():
-    if not os.path.exists(CSV_PATH):
-        with open(CSV_PATH, mode="w", newline="", encoding="utf-8") as f:
+def tile_file_name(tile):
+    return f"tile_{int(tile['tile_id'])}.png"
+
+
+def scan_run_id(downloads, incremental=False, grid_size_km=GRID_SIZE_KM):
+    """
+    Id de un escaneo: hash de la grilla, el modo y los (tile, imagen) a
+    descargar. Relanzar el mismo escaneo (mismas imágenes más recientes) da
+    el mismo id, y con él el mismo directorio de tiles y journal de inferencia.
+    """
+    digest = hashlib.sha1(f"{grid_size_km:g}|{int(incremental)}".encode("utf-8"))
+    for tile, image_meta in downloads:
+        digest.update(f"|{int(tile['tile_id'])}:{image_meta['image_id']}".encode("utf-8"))
+
+    return f"{grid_size_km:g}km_{digest.hexdigest()[:12]}"
+
+
+def tiles_dir(run_id, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"uruguay_tiles_{run_id}")
+
+
+def metadata_csv_path(tiles_path):
+    return os.path.join(tiles_path, "metadata.csv")
+
+
+def recorded_tiles(tiles_path):
+    """Tiles ya registrados en el metadata.csv del directorio (descargados por una corrida anterior)."""
+    csv_path = metadata_csv_path(tiles_path)
+    if not os.path.exists(csv_path):
+        return set()
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return {row["image_name"] for row in csv.DictReader(f)}
+
+
+def init_csv(tiles_path):
+    os.makedirs(tiles_path, exist_ok=True)
+    csv_path = metadata_csv_path(tiles_path)
+    if not os.path.exists(csv_path):
+        with open(csv_path, mode="w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
             writer.writerow([
                 "image_name",
                 "lon_min", "lat_min", "lon_max", "lat_max",
                 "lon_center", "lat_center",
-                "timestamp_utc"
+                "timestamp_utc",
+                "image_id", "cloud_pct",
+                "tile_id"
             ])
 
 
-def save_tiles(tiles, path=TILES_PATH):
-    with open(path, "wb") as f:
-        pickle.dump(tiles, f)
+def fetch_uruguay_rings():
+    """Descarga una única vez el polígono de Uruguay; devuelve sus anillos como arrays (K, 2) lon/lat."""
+    geometry = URUGUAY.geometry().getInfo()
 
-def load_tiles(path=TILES_PATH):
-    if os.path.exists(path):
-        with open(path, "rb") as f:
-            tiles = pickle.load(f)
-        return tiles
-    return None
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError(f"Unexpected geometry type for Uruguay: {geometry['type']}")
 
+    return [np.asarray(ring, dtype=np.float64) for polygon in polygons for ring in polygon]
 
 
-def generate_uruguay_tiles(grid_size_deg=GRID_SIZE_DEG):
+def points_in_rings(lons, lats, rings, chunk_size=4096):
+    """Ray casting vectorizado (regla par-impar sobre todos los anillos, respeta huecos)."""
+    inside = np.zeros(len(lons), dtype=bool)
 
-    uruguay_geom = URUGUAY.geometry()
-    bounds = uruguay_geom.bounds().getInfo()["coordinates"][0]
+    for ring in rings:
+        x1, y1 = ring[:-1, 0], ring[:-1, 1]
+        x2, y2 = ring[1:, 0], ring[1:, 1]
 
-    lon_min = min(c[0] for c in bounds)
-    lon_max = max(c[0] for c in bounds)
-    lat_min = min(c[1] for c in bounds)
-    lat_max = max(c[1] for c in bounds)
+        for start in range(0, len(lons), chunk_size):
+            px = lons[start:start + chunk_size, None]
+            py = lats[start:start + chunk_size, None]
 
-    lons = np.arange(lon_min, lon_max, grid_size_deg)
-    lats = np.arange(lat_min, lat_max, grid_size_deg)
+            crosses = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
 
-    tiles = []
-    total = len(lons) * len(lats)
+            hits = np.count_nonzero(crosses & (px < x_cross), axis=1)
+            inside[start:start + chunk_size] ^= (hits % 2).astype(bool)
 
-    with tqdm(total=total, desc="Generating Uruguay tiles") as pbar:
-        for lon in lons:
-            for lat in lats:
-                square = ee.Geometry.Rectangle(
-                    [lon, lat, lon + grid_size_deg, lat + grid_size_deg],
-                    proj="EPSG:4326",
-                    geodesic=False
-                )
+    return inside
 
-                if square.intersects(uruguay_geom, ee.ErrorMargin(1)).getInfo():
-                    tiles.append(square)
 
-                pbar.update(1)
+def densify_rings(rings, step):
+    """Agrega puntos sobre cada borde cada `step` grados para no perder celdas que solo cruza un borde."""
+    points = []
+    for ring in rings:
+        start, end = ring[:-1], ring[1:]
+        lengths = np.hypot(*(end - start).T)
+        n = np.maximum(1, np.ceil(lengths / step).astype(int))
+        seg = np.repeat(np.arange(len(start)), n)
+        t = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / np.repeat(n, n)
+        points.append(start[seg] + (end[seg] - start[seg]) * t[:, None])
+    return np.concatenate(points)
 
-    return tiles
 
-def create_tile(args):
-    lon, lat, grid_size_deg, uruguay_geom = args
-    square = ee.Geometry.Rectangle(
-        [lon, lat, lon + grid_size_deg, lat + grid_size_deg],
-        proj="EPSG:4326",
-        geodesic=False
-    )
-    if square.intersects(uruguay_geom, ee.ErrorMargin(1)).getInfo():
-        return square
-    return None
-
-def generate_uruguay_tiles_parallel(grid_size_deg=GRID_SIZE_DEG, max_workers=8):
-    uruguay_geom = URUGUAY.geometry()
-    bounds = uruguay_geom.bounds().getInfo()["coordinates"][0]
-
-    lon_min = min(c[0] for c in bounds)
-    lon_max = max(c[0] for c in bounds)
-    lat_min = min(c[1] for c in bounds)
-    lat_max = max(c[1] for c in bounds)
+def generate_uruguay_tiles(grid_size_deg=GRID_SIZE_DEG, rings=None):
+    """
+    Genera la grilla de tiles que intersectan Uruguay localmente con NumPy.
+
+    Una celda se conserva si alguna de sus esquinas cae dentro del país o si
+    algún punto del borde (densificado) cae dentro de la celda. Devuelve un
+    array (N, 4) con [lon_min, lat_min, lon_max, lat_max] por tile.
+    """
+    if rings is None:
+        rings = fetch_uruguay_rings()
+
+    vertices = np.concatenate(rings)
+    lon_min, lat_min = vertices.min(axis=0)
+    lon_max, lat_max = vertices.max(axis=0)
 
     lons = np.arange(lon_min, lon_max, grid_size_deg)
     lats = np.arange(lat_min, lat_max, grid_size_deg)
+    n_lon, n_lat = len(lons), len(lats)
 
-    tiles = []
-    total = len(lons) * len(lats)
+    # Esquinas compartidas: (n_lon + 1) x (n_lat + 1) puntos en lugar de 4 por celda
+    corner_lons = lon_min + np.arange(n_lon + 1) * grid_size_deg
+    corner_lats = lat_min + np.arange(n_lat + 1) * grid_size_deg
+    grid_lon, grid_lat = np.meshgrid(corner_lons, corner_lats, indexing="ij")
+    corners = points_in_rings(grid_lon.ravel(), grid_lat.ravel(), rings).reshape(n_lon + 1, n_lat + 1)
 
-    args_list = [(lon, lat, grid_size_deg, uruguay_geom) for lon in lons for lat in lats]
+    keep = corners[:-1, :-1] | corners[1:, :-1] | corners[:-1, 1:] | corners[1:, 1:]
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(create_tile, args) for args in args_list]
-        for f in tqdm(as_completed(futures), total=total, desc="Generating Uruguay tiles"):
-            result = f.result()
-            if result:
-                tiles.append(result)
+    border = densify_rings(rings, grid_size_deg / 4)
+    ix = np.clip(((border[:, 0] - lon_min) // grid_size_deg).astype(int), 0, n_lon - 1)
+    iy = np.clip(((border[:, 1] - lat_min) // grid_size_deg).astype(int), 0, n_lat - 1)
+    keep[ix, iy] = True
+
+    i, j = np.nonzero(keep)
+    tiles = np.column_stack([
+        lons[i], lats[j], lons[i] + grid_size_deg, lats[j] + grid_size_deg
+    ])
+
+    print(f"Generated {len(tiles)} tiles from a {n_lon}x{n_lat} grid")
 
     return tiles
 
 
-def download_latest_sentinel2_rgb(square, tile_num, start_date, end_date):
+def latest_image_feature(start_date, end_date):
+    """Función server-side: tile -> Feature con id, fecha y nubosidad de su imagen Sentinel-2 más reciente."""
+    def fn(feature):
+        latest = (
+            ee.ImageCollection(SENTINEL2_COLLECTION)
+            .filterBounds(feature.geometry())
+            .filterDate(start_date, end_date)
+            .limit(1, "system:time_start", False)
+        )
+        # aggregate_array devuelve listas vacías si no hay imágenes, sin errores server-side
+        return ee.Feature(None, {
+            "tile_id": feature.get("tile_id"),
+            "image_index": latest.aggregate_array("system:index"),
+            "time_start": latest.aggregate_array("system:time_start"),
+            "cloud_pct": latest.aggregate_array("CLOUDY_PIXEL_PERCENTAGE"),
+        })
+
+    return fn
+
+
+def resolve_latest_images(tiles, start_date, end_date):
+    """
+    Resuelve la última imagen de todos los tiles con un getInfo por página
+    (utils.get_info_paged) en lugar de varios round trips por tile.
+    Devuelve {tile_id: {"image_id", "timestamp", "cloud_pct"}} solo para tiles con imagen.
+    """
+    features = [ee.Feature(tile_geometry(tile), {"tile_id": int(tile["tile_id"])}) for tile in tiles]
+
+    print(f"Resolving latest Sentinel-2 image for {len(features)} tiles...")
+    results = get_info_paged(features, latest_image_feature(start_date, end_date))
 
-    collection = (
-        ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
-        .filterBounds(square)
-        .filterDate(start_date, end_date)
-        .sort("system:time_start", False)
-    )
+    images = {}
+    for props in results:
+        if not props.get("image_index"):
+            continue
 
-    if collection.size().eq(0).getInfo():
-        print(f"[Tile {tile_num}] Sin imágenes")
-        return
+        images[int(props["tile_id"])] = {
+            "image_id": f"{SENTINEL2_COLLECTION}/{props['image_index'][0]}",
+            "timestamp": datetime.utcfromtimestamp(props["time_start"][0] / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+            "cloud_pct": props["cloud_pct"][0] if props.get("cloud_pct") else None,
+        }
 
-    image = ee.Image(collection.first())
+    print(f"Tiles with images: {len(images)} / {len(features)}")
 
-    timestamp = (
-        ee.Date(image.get("system:time_start"))
-        .format("YYYY-MM-dd HH:mm:ss")
-        .getInfo()
-    )
+    return images
 
-    image = image.select(["B4", "B3", "B2"])
 
-    url = image.getThumbURL({
-        "region": square,
-        "dimensions": 1024,
-        "format": "png",
-        "min": 0,
-        "max": 6000
-    })
+THUMB_BANDS = ["B4", "B3", "B2"]
+THUMB_PARAMS = {
+    "dimensions": 1024,
+    "format": "png",
+    "min": 0,
+    "max": 6000
+}
 
-    response = requests.get(url)
 
-    if response.status_code != 200:
-        print(f"[Tile {tile_num}] Error descargando")
-        return
+def tile_thumbnail_url(tile, image_meta):
+    """URL del thumbnail RGB de la imagen ya resuelta para el tile (una llamada a EE)."""
+    image = ee.Image(image_meta["image_id"]).select(THUMB_BANDS)
 
-    file_name = f"tile_{tile_num}.png"
-    file_path = os.path.join(DATA_DIR, file_name)
+    return image.getThumbURL({"region": tile_geometry(tile), **THUMB_PARAMS})
 
-    with open(file_path, "wb") as f:
-        f.write(response.content)
 
-    coords = square.bounds().getInfo()["coordinates"][0]
-    lon_min = min(c[0] for c in coords)
-    lon_max = max(c[0] for c in coords)
-    lat_min = min(c[1] for c in coords)
-    lat_max = max(c[1] for c in coords)
+def tile_thumbnail_cache_key(tile, image_meta):
+    return thumb_cache_key(image_meta["image_id"], tile_bounds(tile), bands=THUMB_BANDS, **THUMB_PARAMS)
 
-    lon_center = (lon_min + lon_max) / 2
-    lat_center = (lat_min + lat_max) / 2
 
-    with open(CSV_PATH, mode="a", newline="", encoding="utf-8") as f:
+def write_tile_metadata(tiles_path, file_name, tile, image_meta):
+    with open(metadata_csv_path(tiles_path), mode="a", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow([
             file_name,
-            lon_min, lat_min, lon_max, lat_max,
-            lon_center, lat_center,
-            timestamp
+            *tile_bounds(tile),
+            float(tile["lon_center"]), float(tile["lat_center"]),
+            image_meta["timestamp"],
+            image_meta["image_id"], image_meta["cloud_pct"],
+            int(tile["tile_id"])
         ])
 
 
-def get_uruguay_tiles(max_tiles=None):
+def download_latest_sentinel2_rgb(downloads, tiles_path, save=True, in_memory=False):
+    """
+    Descarga los thumbnails de [(tile, image_meta)] con el downloader async
+    y devuelve (file_name, bytes PNG o None) a medida que terminan.
 
-    init_csv()
+    Con in_memory=True el contenido se devuelve en memoria y solo se escribe
+    a tiles_path si save=True. La metadata de cada tile se agrega una sola
+    vez a tiles_path/metadata.csv, aunque se descargue de nuevo al retomar.
+    """
+    recorded = recorded_tiles(tiles_path)
 
-    tiles = load_tiles()
+    jobs = []
+    for tile, image_meta in downloads:
+        file_name = tile_file_name(tile)
+        path = None if in_memory or not save else os.path.join(tiles_path, file_name)
+        jobs.append({
+            "key": (file_name, tile, image_meta),
+            "url": partial(tile_thumbnail_url, tile, image_meta),
+            "path": path,
+            "cache_key": tile_thumbnail_cache_key(tile, image_meta),
+        })
+
+    for result in iter_downloads(jobs, cache=get_thumb_cache()):
+        file_name, tile, image_meta = result["key"]
+
+        if result["error"]:
+            print(f"[Tile {int(tile['tile_id'])}] Error descargando: {result['error']}")
+            continue
+
+        if in_memory and save:
+            with open(os.path.join(tiles_path, file_name), "wb") as f:
+                f.write(result["content"])
+
+        if file_name not in recorded:
+            write_tile_metadata(tiles_path, file_name, tile, image_meta)
+        count("tiles")
+
+        yield file_name, result["content"]
+
+
+def get_tiles(max_tiles=None, bbox=None):
+    """Índice de tiles (memory-mapped); bbox = (lon_min, lat_min, lon_max, lat_max) opcional."""
+    tiles = load_tile_index(TILES_PATH)
     if tiles is None:
-        tiles = generate_uruguay_tiles_parallel()
-        save_tiles(tiles)
+        save_tile_index(build_tile_index(generate_uruguay_tiles()), TILES_PATH)
+        tiles = load_tile_index(TILES_PATH)
     else:
         print("Tiles coordinates loaded from disk.")
 
+    if bbox is not None:
+        tiles = query_bbox(tiles, *bbox)
+
     if max_tiles is not None:
         tiles = tiles[:max_tiles]
 
     print(f"Total de tiles: {len(tiles)}")
 
+    return tiles
+
+
+def plan_tile_downloads(max_tiles=None, bbox=None, incremental=False):
+    """
+    Lista de (tile, image_meta) a descargar, con la metadata resuelta en lote.
+    Con incremental=True solo quedan los tiles cuya imagen cambió desde el
+    último escaneo registrado en scan_state.
+    """
+    tiles = get_tiles(max_tiles, bbox)
+
     end_date = ee.Date(datetime.utcnow())
     start_date = end_date.advance(-20, "day")
 
-    with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+    images = resolve_latest_images(tiles, start_date, end_date)
+
+    downloads = [(tile, images[int(tile["tile_id"])]) for tile in tiles if int(tile["tile_id"]) in images]
+
+    if incremental:
+        downloads = changed_downloads(downloads, load_scan_state(STATE_PATH))
+
+    return downloads
+
+
+def stream_uruguay_tiles(max_tiles=None, save=False, bbox=None, incremental=False, downloads=None, tiles_path=None,
+                         skip=()):
+    """
+    Igual que get_uruguay_tiles pero devuelve (file_name, bytes PNG) a medida
+    que se descarga cada tile, sin pasar por disco salvo que save=True.
+    skip son nombres de tiles que no hace falta bajar (ej. ya clasificados en
+    el journal de la corrida que se retoma).
+    """
+    if downloads is None:
+        downloads = plan_tile_downloads(max_tiles, bbox, incremental)
+    tiles_path = tiles_path or tiles_dir(scan_run_id(downloads, incremental))
+
+    init_csv(tiles_path)
+
+    skip = set(skip)
+    if skip:
+        downloads = [(tile, image_meta) for tile, image_meta in downloads if tile_file_name(tile) not in skip]
+        print(f"Skipping {len(skip)} tiles already classified, {len(downloads)} to download")
+
+    yield from download_latest_sentinel2_rgb(downloads, tiles_path, save=save, in_memory=True)
+
+
+def get_uruguay_tiles(max_tiles=None, bbox=None, incremental=False, downloads=None, tiles_path=None):
+    """
+    Descarga los thumbnails del escaneo (downloads o plan_tile_downloads) a
+    tiles_path, por defecto el directorio de su scan_run_id. Relanzado sobre
+    el mismo directorio solo baja los tiles que faltan. Devuelve tiles_path.
+    """
+    if downloads is None:
+        downloads = plan_tile_downloads(max_tiles, bbox, incremental)
+    tiles_path = tiles_path or tiles_dir(scan_run_id(downloads, incremental))
+
+    init_csv(tiles_path)
+
+    recorded = recorded_tiles(tiles_path)
+    if recorded:
+        downloads = [(tile, image_meta) for tile, image_meta in downloads if tile_file_name(tile) not in recorded]
+        print(f"Resuming tiles in {tiles_path}: {len(recorded)} already downloaded, {len(downloads)} remaining")
 
-        futures = {executor.submit(download_latest_sentinel2_rgb, square, i, start_date, end_date): i
-                   for i, square in enumerate(tiles)}
+    for _ in tqdm(download_latest_sentinel2_rgb(downloads, tiles_path), total=len(downloads), desc="Downloading tiles"):
+        pass
 
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading tiles"):
-            try:
-                future.result()
-            except Exception as e:
-                i = futures[future]
-                print(f"Error downloading tile {i}: {e}")
-    
-    return DATA_DIR
+    return tiles_path
 
 if __name__ == "__main__":
 
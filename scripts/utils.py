@@ -1,46 +1,223 @@
 import ee
 import time
-import subprocess
+import asyncio
+import threading
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from gcs_transfer import download_paths, upload_paths
+from instrumentation import count, span
 
 ee.Authenticate()
 ee.Initialize(project="cellular-retina-276416")
 
+# Features por cada getInfo paginado (límite de payload / tiempo de cómputo de EE)
+EE_PAGE_SIZE = int(os.getenv("EE_PAGE_SIZE", "500"))
+EE_PAGE_WORKERS = int(os.getenv("EE_PAGE_WORKERS", "4"))
+
+# Backoff del TaskMonitor: vuelve al mínimo cuando algún task cambia de estado
+TASK_POLL_MIN_SECONDS = float(os.getenv("TASK_POLL_MIN_SECONDS", "2"))
+TASK_POLL_MAX_SECONDS = float(os.getenv("TASK_POLL_MAX_SECONDS", "60"))
+
+# Tiempo máximo de espera por task (el task sigue en EE, pero el future se resuelve)
+TASK_TIMEOUT_SECONDS = float(os.getenv("TASK_TIMEOUT_SECONDS", str(6 * 3600)))
+
+# Segundos que un task puede seguir sin aparecer en EE (ej. recién creado)
+# antes de darlo por perdido
+TASK_MISSING_SECONDS = float(os.getenv("TASK_MISSING_SECONDS", "300"))
+
+# ee.data.getTaskList pagina listOperations de a 500 operaciones por request
+TASK_LIST_PAGE_SIZE = 500
+
+TASK_DONE_STATES = {"COMPLETED", "FAILED", "CANCELLED"}
+
 gaul = ee.FeatureCollection("FAO/GAUL/2015/level0")
 uruguay = gaul.filter(ee.Filter.eq("ADM0_NAME", "Uruguay")).geometry()
 
-def wait_for_task(task, poll=10):
-    while True:
-        status = task.status()
-        state = status["state"]
+class TaskMonitor:
+    """
+    Sigue todos los ee.batch.Task en curso desde un único hilo. Cada ronda
+    consulta los ids vigilados por la vía con menos requests: el listado de
+    operaciones del proyecto (ee.data.getTaskList, una request por página de
+    500) o getTaskStatus (una request por id) cuando se vigilan menos tasks
+    que páginas tiene el listado. Los que no aparecen en el listado se
+    consultan con getTaskStatus.
+
+    watch() devuelve un concurrent.futures.Future con el status final del
+    task; wait_async() lo mismo como awaitable de asyncio. Un task que EE
+    reporta UNKNOWN durante TASK_MISSING_SECONDS se resuelve con estado
+    UNKNOWN, y uno que supera timeout con TIMED_OUT, para que nadie espere
+    para siempre.
+    """
+
+    def __init__(self, min_poll=TASK_POLL_MIN_SECONDS, max_poll=TASK_POLL_MAX_SECONDS):
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.futures = {}
+        self.deadlines = {}
+        self.missing = {}
+        self.states = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.polls = 0
+        self.list_pages = 1
+
+    def watch(self, task, callback=None, timeout=TASK_TIMEOUT_SECONDS):
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        with self.lock:
+            self.futures.setdefault(task.id, []).append(future)
+            self.deadlines[task.id] = max(self.deadlines.get(task.id, 0), time.monotonic() + timeout)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+        # Un task nuevo reinicia el backoff
+        self.wakeup.set()
+        return future
+
+    def wait_async(self, task, callback=None, timeout=TASK_TIMEOUT_SECONDS):
+        return asyncio.wrap_future(self.watch(task, callback, timeout))
+
+    def _list_tasks(self):
+        tasks = ee.data.getTaskList()
+        self.list_pages = max(1, -(-len(tasks) // TASK_LIST_PAGE_SIZE))
+        count("ee_round_trips", self.list_pages)
+        return {status.get("id"): status for status in tasks}
+
+    def _task_status(self, task_ids):
+        statuses = ee.data.getTaskStatus(task_ids)
+        count("ee_round_trips", len(task_ids))
+        return {status.get("id"): status for status in statuses}
+
+    def _poll(self, task_ids):
+        """{id: status} de task_ids; los que EE no conoce quedan con estado UNKNOWN."""
+        self.polls += 1
+        if len(task_ids) < self.list_pages:
+            return self._task_status(task_ids)
+
+        statuses = self._list_tasks()
+        # Un task recién creado puede no estar todavía en el listado
+        unlisted = [task_id for task_id in task_ids if task_id not in statuses]
+        if unlisted:
+            statuses.update(self._task_status(unlisted))
+        return statuses
+
+    def _resolve(self, task_id, status):
+        # Llamar con self.lock tomado
+        self.states.pop(task_id, None)
+        self.deadlines.pop(task_id, None)
+        self.missing.pop(task_id, None)
+        for future in self.futures.pop(task_id, []):
+            future.set_result(status)
+
+    def _run(self):
+        delay = self.min_poll
+
+        while True:
+            self.wakeup.wait(delay)
+            if self.wakeup.is_set():
+                self.wakeup.clear()
+                delay = self.min_poll
 
-        if state == "COMPLETED":
-            return True
-        elif state in ["FAILED", "CANCELLED"]:
-            print("Task failed:", status.get("error_message"))
-            return False
+            with self.lock:
+                task_ids = list(self.futures)
 
-        time.sleep(poll)
+            try:
+                statuses = self._poll(task_ids)
+                error = None
+            except Exception as e:
+                print("Error polling Earth Engine tasks:", e)
+                statuses, error = {}, e
+
+            changed = False
+            now = time.monotonic()
+            with self.lock:
+                for task_id in list(self.futures):
+                    status = statuses.get(task_id)
+                    state = status.get("state") if status else None
+
+                    if error is None and state in (None, "UNKNOWN"):
+                        # Perdido recién cuando EE no lo conoce por TASK_MISSING_SECONDS
+                        missing_since = self.missing.setdefault(task_id, now)
+                        if now - missing_since < TASK_MISSING_SECONDS:
+                            status = state = None
+                        else:
+                            state = "UNKNOWN"
+                            status = {"id": task_id, "state": state, "error_message": f"Task unknown to Earth Engine for {now - missing_since:.0f}s"}
+                    elif status is not None:
+                        self.missing.pop(task_id, None)
+
+                    if state is not None and self.states.get(task_id) != state:
+                        self.states[task_id] = state
+                        changed = True
+
+                    if state in TASK_DONE_STATES or state == "UNKNOWN":
+                        self._resolve(task_id, status)
+                    elif now >= self.deadlines[task_id]:
+                        self._resolve(task_id, {
+                            "id": task_id,
+                            "state": "TIMED_OUT",
+                            "error_message": f"Task still {self.states.get(task_id, 'unseen')} after the timeout",
+                        })
+
+                if not self.futures:
+                    self.thread = None
+                    return
+
+            delay = self.min_poll if changed and error is None else min(delay * 2, self.max_poll)
+
+
+_task_monitor = None
+_task_monitor_lock = threading.Lock()
+
+def get_task_monitor():
+    global _task_monitor
+
+    with _task_monitor_lock:
+        if _task_monitor is None:
+            _task_monitor = TaskMonitor()
+        return _task_monitor
+
+def wait_for_task(task):
+    status = get_task_monitor().watch(task).result()
+
+    if status["state"] == "COMPLETED":
+        return True
+
+    print("Task failed:", status.get("error_message"))
+    return False
+
+def get_info_paged(features, map_fn, page_size=EE_PAGE_SIZE, max_workers=EE_PAGE_WORKERS):
+    """
+    Aplica map_fn del lado del servidor a una lista de ee.Feature y resuelve el
+    resultado con un getInfo por página. Devuelve las properties de cada
+    feature en el mismo orden.
+    """
+    pages = [features[i:i + page_size] for i in range(0, len(features), page_size)]
+
+    def resolve(page):
+        with span("ee_query"):
+            info = ee.FeatureCollection(page).map(map_fn).getInfo()
+        count("ee_round_trips")
+        return [f["properties"] for f in info["features"]]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(resolve, pages))
+
+    return [props for page in results for props in page]
 
 def move_data_from_gcs_to_local(bucket_path_lists, local_dir):
-    os.makedirs(local_dir, exist_ok=True)
-    
-    for gcs_path in bucket_path_lists:
-        cmd = ["gsutil", "-m" , "cp", "-r", gcs_path, local_dir]
-        
-        try:
-            subprocess.run(cmd, check=True, shell=True)
-            print(f"File downloaded: {gcs_path}")
-        except subprocess.CalledProcessError as e:
-            print(f"Error downloading {gcs_path}: {e}")
+    """Baja objetos o prefijos de GCS a local_dir en paralelo (ver gcs_transfer.py)."""
+    return download_paths(bucket_path_lists, local_dir)
 
 def move_data_from_local_to_gcs(local_path, gcs_bucket_path):
-    cmd = ["gsutil", "-m" , "cp", "-r", local_path, gcs_bucket_path]
-    
-    try:
-        subprocess.run(cmd, check=True, shell=True)
-        print(f"File uploaded: {local_path} to {gcs_bucket_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error uploading {local_path}: {e}")
-
-    return gcs_bucket_path + "/" + os.path.basename(local_path)
\ No newline at end of file
+    """Sube un archivo o directorio (o una lista) bajo gcs_bucket_path, salteando lo que no cambió."""
+    local_paths = [local_path] if isinstance(local_path, str) else list(local_path)
+    upload_paths(local_paths, gcs_bucket_path)
+
+    if isinstance(local_path, str):
+        return gcs_bucket_path.rstrip("/") + "/" + os.path.basename(local_path.rstrip("/"))
+    return gcs_bucket_path